@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Meal, MerchantAccount, Restaurant, Tag
+from .models import Allergen, Category, Cuisine, Meal, MerchantAccount, Region, Restaurant, Tag
 
 
 class MerchantAccountInline(admin.StackedInline):
@@ -49,3 +49,19 @@ class MealAdmin(admin.ModelAdmin):
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
 	search_fields = ("name",)
+
+
+@admin.register(Cuisine, Category, Allergen)
+class TaxonomyTermAdmin(admin.ModelAdmin):
+	list_display = ("name", "key", "aliases")
+	search_fields = ("name", "key")
+	readonly_fields = ("key",)
+
+
+@admin.register(Region)
+class RegionAdmin(admin.ModelAdmin):
+	list_display = ("name", "parent", "key", "aliases")
+	list_filter = (("parent", admin.EmptyFieldListFilter),)
+	search_fields = ("name", "key")
+	list_select_related = ("parent",)
+	readonly_fields = ("key",)
@@ -0,0 +1,171 @@
+"""Geohash cells and distance helpers for proximity lookups.
+
+Restaurants store the geohash of their coordinates (see ``Restaurant.save``).
+A radius query picks the coarsest cell size that is still at least as large
+as the radius, so the circle around any point fits in that cell and its
+eight neighbors. Each of those nine cells is one contiguous range on the
+indexed ``geohash`` column, or on its integer form (:func:`geohash_int`) in
+in-memory columns. The map viewport groups restaurants by a
+geohash prefix sized to the zoom level (:func:`precision_for_zoom`).
+"""
+
+from __future__ import annotations
+
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.db.models import Q
+
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        target, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if target >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """``(height, width)`` of a cell at ``precision``, in degrees."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2**lat_bits, 360.0 / 2**lon_bits
+
+
+def precision_for_zoom(zoom: int, cells_per_tile: int = 4) -> int:
+    """Finest precision whose cells are no wider than a web-map tile at ``zoom`` split ``cells_per_tile`` ways."""
+    target = 360.0 / 2 ** zoom / cells_per_tile
+    precision = 1
+    while precision < GEOHASH_PRECISION and cell_size(precision)[1] > target:
+        precision += 1
+    return precision
+
+
+def cell_bbox(cell: str) -> Tuple[float, float, float, float]:
+    """``(west, south, east, north)`` of ``cell``."""
+    latitude, longitude = decode(cell)
+    height, width = cell_size(len(cell))
+    return longitude - width / 2, latitude - height / 2, longitude + width / 2, latitude + height / 2
+
+
+def decode(cell: str) -> Tuple[float, float]:
+    """Center of ``cell`` as ``(latitude, longitude)``."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in cell:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bounds = lon_range if even else lat_range
+            middle = (bounds[0] + bounds[1]) / 2
+            if value >> shift & 1:
+                bounds[0] = middle
+            else:
+                bounds[1] = middle
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+
+def neighbors(cell: str) -> List[str]:
+    """``cell`` and its (up to) eight neighbors."""
+    latitude, longitude = decode(cell)
+    height, width = cell_size(len(cell))
+    cells = []
+    for d_lat in (-height, 0.0, height):
+        lat = latitude + d_lat
+        if not -90 <= lat <= 90:
+            continue
+        for d_lon in (-width, 0.0, width):
+            lon = (longitude + d_lon + 180) % 360 - 180
+            candidate = encode(lat, lon, len(cell))
+            if candidate not in cells:
+                cells.append(candidate)
+    return cells
+
+
+def covering_cells(latitude: float, longitude: float, radius_km: float) -> List[str]:
+    """Cells whose union contains every point within ``radius_km`` of the origin."""
+    km_per_lon_degree = KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6)
+    precision = GEOHASH_PRECISION
+    while precision > 1:
+        height, width = cell_size(precision)
+        if min(height * KM_PER_DEGREE, width * km_per_lon_degree) >= radius_km:
+            break
+        precision -= 1
+    return neighbors(encode(latitude, longitude, precision))
+
+
+def _prefix_upper_bound(prefix: str) -> Optional[str]:
+    """Smallest geohash greater than every hash starting with ``prefix``."""
+    while prefix:
+        position = BASE32.index(prefix[-1])
+        if position + 1 < len(BASE32):
+            return prefix[:-1] + BASE32[position + 1]
+        prefix = prefix[:-1]
+    return None
+
+
+def cells_q(cells: List[str], field: str = "geohash") -> Q:
+    """Index range conditions matching any hash inside ``cells``.
+
+    Uses ``>=``/``<`` bounds rather than ``LIKE`` so the lookup stays a range
+    scan under any column collation.
+    """
+    condition = Q()
+    for cell in cells:
+        bounds = {f"{field}__gte": cell}
+        upper = _prefix_upper_bound(cell)
+        if upper is not None:
+            bounds[f"{field}__lt"] = upper
+        condition |= Q(**bounds)
+    return condition
+
+
+def geohash_int(geohash: Optional[str]) -> int:
+    """Full-precision geohash as an integer that sorts like the string (-1 when missing)."""
+    if not geohash:
+        return -1
+    value = 0
+    for char in geohash[:GEOHASH_PRECISION].ljust(GEOHASH_PRECISION, BASE32[0]):
+        value = value << 5 | BASE32.index(char)
+    return value
+
+
+def cell_int_range(cell: str) -> Tuple[int, int]:
+    """Half-open ``[low, high)`` range of :func:`geohash_int` values inside ``cell``."""
+    low = geohash_int(cell)
+    return low, low + (1 << 5 * (GEOHASH_PRECISION - len(cell)))
+
+
+def haversine_km(latitude: float, longitude: float, latitudes, longitudes) -> np.ndarray:
+    """Great-circle distances from one point to arrays of points (NaN stays NaN)."""
+    lat1 = math.radians(latitude)
+    lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+    d_lat = lat2 - lat1
+    d_lon = np.radians(np.asarray(longitudes, dtype=np.float64) - longitude)
+    a = np.sin(d_lat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
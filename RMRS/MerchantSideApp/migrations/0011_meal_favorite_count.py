@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:59
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_favorite_counts(apps, schema_editor):
+    Meal = apps.get_model("MerchantSideApp", "Meal")
+    Restaurant = apps.get_model("MerchantSideApp", "Restaurant")
+    Favorite = apps.get_model("UserSideApp", "Favorite")
+
+    meal_totals = (
+        Favorite.objects.filter(meal=OuterRef("pk"))
+        .order_by()
+        .values("meal")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    Meal.objects.update(favorite_count=Coalesce(Subquery(meal_totals), 0))
+    restaurant_totals = (
+        Meal.objects.filter(restaurant=OuterRef("pk"))
+        .order_by()
+        .values("restaurant")
+        .annotate(total=Sum("favorite_count"))
+        .values("total")
+    )
+    Restaurant.objects.update(favorite_count=Coalesce(Subquery(restaurant_totals), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MerchantSideApp', '0010_restaurant_meal_slugs'),
+        ('UserSideApp', '0007_userpreference_recommendation_cooldown_days'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='favorite_count',
+            field=models.PositiveIntegerField(db_default=0, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='favorite_count',
+            field=models.PositiveIntegerField(db_default=0, default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['favorite_count'], name='idx_meal_favorites'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['favorite_count'], name='idx_restaurant_favorites'),
+        ),
+        migrations.RunPython(populate_favorite_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:23
+
+from django.db import migrations, models
+
+from MerchantSideApp.geo import encode
+
+
+def populate_geohashes(apps, schema_editor):
+    Restaurant = apps.get_model("MerchantSideApp", "Restaurant")
+    pending = []
+    located = Restaurant.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    for restaurant in located.only("pk", "latitude", "longitude").iterator(chunk_size=1000):
+        restaurant.geohash = encode(float(restaurant.latitude), float(restaurant.longitude))
+        pending.append(restaurant)
+        if len(pending) >= 1000:
+            Restaurant.objects.bulk_update(pending, ["geohash"])
+            pending = []
+    if pending:
+        Restaurant.objects.bulk_update(pending, ["geohash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MerchantSideApp', '0011_meal_favorite_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['geohash'], name='idx_restaurant_geohash'),
+        ),
+        migrations.RunPython(populate_geohashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,160 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:44
+
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+# Frozen copies of MerchantSideApp.taxonomy as of this migration, so later edits there do not
+# change what it backfills.
+CHARACTER_FOLDS = str.maketrans({"臺": "台"})
+CUISINE_ALIASES = {
+    "台式": ["台菜", "台灣料理", "台灣菜"],
+    "中式": ["中菜", "中華料理"],
+    "日式": ["日本料理", "日料", "和食"],
+    "韓式": ["韓國料理", "韓料"],
+    "泰式": ["泰國料理", "泰菜"],
+    "義式": ["義大利料理", "義大利菜"],
+    "美式": ["美國料理"],
+    "西式": ["西餐"],
+}
+
+
+def normalize(value):
+    if not value:
+        return ""
+    folded = unicodedata.normalize("NFKC", str(value)).casefold().translate(CHARACTER_FOLDS)
+    return "".join(folded.split())
+
+
+class _Terms:
+    """Resolve free-text values to term ids, creating rows on first sight."""
+
+    def __init__(self, model):
+        self.model = model
+        self.ids = {}
+        for term in model.objects.all():
+            for value in [term.name, *(term.aliases or [])]:
+                self.ids.setdefault((getattr(term, "parent_id", None), normalize(value)), term.pk)
+
+    def resolve(self, value, parent_id=None, aliases=()):
+        key = normalize(value)
+        if not key:
+            return None
+        if (parent_id, key) not in self.ids:
+            fields = {"name": value.strip(), "key": key, "aliases": list(aliases)}
+            if parent_id is not None:
+                fields["parent_id"] = parent_id
+            term = self.model.objects.create(**fields)
+            for alias in [value, *aliases]:
+                self.ids.setdefault((parent_id, normalize(alias)), term.pk)
+        return self.ids[(parent_id, key)]
+
+
+def _backfill(queryset, fields, resolve):
+    pending = []
+    for obj in queryset.iterator(chunk_size=BATCH_SIZE):
+        resolve(obj)
+        pending.append(obj)
+        if len(pending) >= BATCH_SIZE:
+            queryset.model.objects.bulk_update(pending, fields)
+            pending = []
+    if pending:
+        queryset.model.objects.bulk_update(pending, fields)
+
+
+def populate_taxonomy(apps, schema_editor):
+    Restaurant = apps.get_model("MerchantSideApp", "Restaurant")
+    Meal = apps.get_model("MerchantSideApp", "Meal")
+    cuisines = _Terms(apps.get_model("MerchantSideApp", "Cuisine"))
+    regions = _Terms(apps.get_model("MerchantSideApp", "Region"))
+    categories = _Terms(apps.get_model("MerchantSideApp", "Category"))
+    for name, aliases in CUISINE_ALIASES.items():
+        cuisines.resolve(name, aliases=aliases)
+
+    def resolve_restaurant(restaurant):
+        restaurant.cuisine_ref_id = cuisines.resolve(restaurant.cuisine_type)
+        city_id = regions.resolve(restaurant.city)
+        district_id = regions.resolve(restaurant.district, parent_id=city_id) if city_id else None
+        restaurant.region_ref_id = district_id or city_id
+
+    def resolve_meal(meal):
+        meal.category_ref_id = categories.resolve(meal.category)
+
+    _backfill(
+        Restaurant.objects.only("pk", "cuisine_type", "city", "district").order_by("pk"),
+        ["cuisine_ref", "region_ref"],
+        resolve_restaurant,
+    )
+    _backfill(Meal.objects.only("pk", "category").order_by("pk"), ["category_ref"], resolve_meal)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MerchantSideApp', '0012_restaurant_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('key', models.CharField(editable=False, max_length=50)),
+                ('aliases', models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                'verbose_name_plural': 'categories',
+                'db_table': 'categories',
+                'constraints': [models.UniqueConstraint(fields=('key',), name='uniq_category_key')],
+            },
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='category_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='meals', to='MerchantSideApp.category'),
+        ),
+        migrations.CreateModel(
+            name='Cuisine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('key', models.CharField(editable=False, max_length=50)),
+                ('aliases', models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                'db_table': 'cuisines',
+                'constraints': [models.UniqueConstraint(fields=('key',), name='uniq_cuisine_key')],
+            },
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='cuisine_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='restaurants', to='MerchantSideApp.cuisine'),
+        ),
+        migrations.CreateModel(
+            name='Region',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('key', models.CharField(editable=False, max_length=50)),
+                ('aliases', models.JSONField(blank=True, default=list)),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='districts', to='MerchantSideApp.region')),
+            ],
+            options={
+                'db_table': 'regions',
+            },
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='region_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='restaurants', to='MerchantSideApp.region'),
+        ),
+        migrations.AddConstraint(
+            model_name='region',
+            constraint=models.UniqueConstraint(fields=('parent', 'key'), name='uniq_region_parent_key'),
+        ),
+        migrations.RunPython(populate_taxonomy, migrations.RunPython.noop),
+    ]
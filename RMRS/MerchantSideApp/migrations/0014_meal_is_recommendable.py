@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:51
+
+from django.db import migrations, models
+
+
+def populate_is_recommendable(apps, schema_editor):
+    Meal = apps.get_model("MerchantSideApp", "Meal")
+    Restaurant = apps.get_model("MerchantSideApp", "Restaurant")
+    Meal.objects.filter(is_available=False).update(is_recommendable=False)
+    closed = Restaurant.objects.filter(is_active=False).values("pk")
+    Meal.objects.filter(restaurant_id__in=closed).update(is_recommendable=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MerchantSideApp', '0013_taxonomy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='is_recommendable',
+            field=models.BooleanField(db_default=True, default=True, editable=False),
+        ),
+        migrations.RunPython(populate_is_recommendable, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['is_recommendable', 'category_ref'], name='idx_meal_rec_category'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['is_recommendable', 'is_vegetarian'], name='idx_meal_rec_vegetarian'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['is_recommendable', 'created_at'], name='idx_meal_rec_created'),
+        ),
+    ]
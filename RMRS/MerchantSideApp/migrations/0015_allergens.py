@@ -0,0 +1,110 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:00
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+# Frozen copies of MerchantSideApp.taxonomy as of this migration, so later edits there do not
+# change what it backfills.
+CHARACTER_FOLDS = str.maketrans({"臺": "台"})
+LIST_SEPARATORS = re.compile(r"[,、;\n]+")
+
+
+def normalize(value):
+    if not value:
+        return ""
+    folded = unicodedata.normalize("NFKC", str(value)).casefold().translate(CHARACTER_FOLDS)
+    return "".join(folded.split())
+
+
+def split_terms(value):
+    if not value:
+        return ()
+    if isinstance(value, str):
+        value = LIST_SEPARATORS.split(unicodedata.normalize("NFKC", value))
+    terms = []
+    seen = set()
+    for item in value:
+        item = str(item).strip()
+        if item and normalize(item) not in seen:
+            seen.add(normalize(item))
+            terms.append(item)
+    return tuple(terms)
+
+
+def allergen_names(metadata_payloads):
+    names = []
+    for metadata in metadata_payloads:
+        payload = (metadata or {}).get("allergens") if isinstance(metadata, dict) else None
+        if isinstance(payload, (list, tuple)):
+            names.extend(str(item) for item in payload if item)
+        elif payload:
+            names.append(str(payload))
+    return split_terms(names)
+
+
+def populate_meal_allergens(apps, schema_editor):
+    Allergen = apps.get_model("MerchantSideApp", "Allergen")
+    MealAllergen = apps.get_model("MerchantSideApp", "MealAllergen")
+    MealComponent = apps.get_model("UserSideApp", "MealComponent")
+    payloads = {}
+    components = MealComponent.objects.filter(meal__isnull=False, metadata__isnull=False)
+    for meal_id, metadata in components.values_list("meal_id", "metadata").iterator(chunk_size=BATCH_SIZE):
+        payloads.setdefault(meal_id, []).append(metadata)
+    allergen_ids = {}
+    links = []
+    for meal_id, metadata in payloads.items():
+        for name in allergen_names(metadata):
+            key = normalize(name)
+            if key not in allergen_ids:
+                allergen_ids[key] = Allergen.objects.get_or_create(key=key, defaults={"name": name})[0].pk
+            links.append(MealAllergen(meal_id=meal_id, allergen_id=allergen_ids[key]))
+    MealAllergen.objects.bulk_create(links, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MerchantSideApp', '0014_meal_is_recommendable'),
+        ('UserSideApp', '0007_userpreference_recommendation_cooldown_days'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Allergen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('key', models.CharField(editable=False, max_length=50)),
+                ('aliases', models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                'db_table': 'allergens',
+                'constraints': [models.UniqueConstraint(fields=('key',), name='uniq_allergen_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MealAllergen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('allergen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='MerchantSideApp.allergen')),
+                ('meal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='MerchantSideApp.meal')),
+            ],
+            options={
+                'db_table': 'meal_allergens',
+            },
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='allergens',
+            field=models.ManyToManyField(blank=True, related_name='meals', through='MerchantSideApp.MealAllergen', to='MerchantSideApp.allergen'),
+        ),
+        migrations.AddConstraint(
+            model_name='mealallergen',
+            constraint=models.UniqueConstraint(fields=('meal', 'allergen'), name='uniq_meal_allergen'),
+        ),
+        migrations.RunPython(populate_meal_allergens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:00
+
+from django.db import migrations
+
+FULLTEXT_INDEXES = (
+    ("restaurants", "ft_restaurant_text", ("name", "address", "cuisine_type")),
+    ("meals", "ft_meal_text", ("name", "description")),
+)
+
+
+def _has_ngram_parser(connection) -> bool:
+    """MySQL 5.7.6+ ships the ngram parser; MariaDB (same Django vendor) has none."""
+    return (
+        connection.vendor == "mysql"
+        and not connection.mysql_is_mariadb
+        and connection.mysql_version >= (5, 7, 6)
+    )
+
+
+def add_fulltext_indexes(apps, schema_editor):
+    if not _has_ngram_parser(schema_editor.connection):
+        return
+    quote = schema_editor.quote_name
+    for table, name, columns in FULLTEXT_INDEXES:
+        schema_editor.execute(
+            f"ALTER TABLE {quote(table)} ADD FULLTEXT INDEX {quote(name)} "
+            f"({', '.join(quote(column) for column in columns)}) WITH PARSER ngram"
+        )
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if not _has_ngram_parser(schema_editor.connection):
+        return
+    quote = schema_editor.quote_name
+    for table, name, _columns in FULLTEXT_INDEXES:
+        schema_editor.execute(f"ALTER TABLE {quote(table)} DROP INDEX {quote(name)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("MerchantSideApp", "0015_allergens"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_fulltext_indexes, drop_fulltext_indexes, elidable=False),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MerchantSideApp', '0016_fulltext'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['is_recommendable', 'name'], name='idx_meal_rec_name'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['is_active', '-rating', 'name'], name='idx_restaurant_active_rating'),
+        ),
+    ]
@@ -5,6 +5,9 @@ from django.urls import reverse
 from django.utils.crypto import get_random_string
 from django.utils.text import slugify
 
+from . import taxonomy
+from .geo import encode as encode_geohash
+
 
 SLUG_MAX_LENGTH = 150
 SLUG_BASE_LENGTH = SLUG_MAX_LENGTH - 6  # leave room for suffixes
@@ -21,6 +24,83 @@ def _build_unique_slug(model_cls, base_value: str | None, fallback_prefix: str,
     return slug_candidate
 
 
+class TaxonomyTerm(models.Model):
+    """A normalized lookup value; ``key`` is the folded name (see ``taxonomy.normalize``)."""
+
+    name = models.CharField(max_length=50)
+    key = models.CharField(max_length=50, editable=False)
+    aliases = models.JSONField(default=list, blank=True)
+
+    taxonomy_kind = ""
+
+    class Meta:
+        abstract = True
+
+    def __str__(self) -> str:
+        return self.name
+
+    def save(self, *args, **kwargs):
+        self.key = taxonomy.normalize(self.name)
+        super().save(*args, **kwargs)
+        taxonomy.invalidate(self.taxonomy_kind)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        taxonomy.invalidate(self.taxonomy_kind)
+        return result
+
+
+class Cuisine(TaxonomyTerm):
+    taxonomy_kind = "cuisine"
+
+    class Meta:
+        db_table = "cuisines"
+        constraints = [
+            models.UniqueConstraint(fields=["key"], name="uniq_cuisine_key"),
+        ]
+
+
+class Region(TaxonomyTerm):
+    """A city (no parent) or a district within one."""
+
+    parent = models.ForeignKey(
+        "self",
+        related_name="districts",
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+    )
+
+    taxonomy_kind = "region"
+
+    class Meta:
+        db_table = "regions"
+        constraints = [
+            models.UniqueConstraint(fields=["parent", "key"], name="uniq_region_parent_key"),
+        ]
+
+
+class Category(TaxonomyTerm):
+    taxonomy_kind = "category"
+
+    class Meta:
+        db_table = "categories"
+        verbose_name_plural = "categories"
+        constraints = [
+            models.UniqueConstraint(fields=["key"], name="uniq_category_key"),
+        ]
+
+
+class Allergen(TaxonomyTerm):
+    taxonomy_kind = "allergen"
+
+    class Meta:
+        db_table = "allergens"
+        constraints = [
+            models.UniqueConstraint(fields=["key"], name="uniq_allergen_key"),
+        ]
+
+
 class Restaurant(models.Model):
     """Merchant managed restaurant metadata."""
 
@@ -44,7 +124,25 @@ class Restaurant(models.Model):
     rating = models.DecimalField(max_digits=3, decimal_places=1, default=0.0)
     latitude = models.DecimalField(max_digits=10, decimal_places=7, blank=True, null=True)
     longitude = models.DecimalField(max_digits=10, decimal_places=7, blank=True, null=True)
+    geohash = models.CharField(max_length=12, blank=True, null=True, editable=False)
+    cuisine_ref = models.ForeignKey(
+        Cuisine,
+        related_name="restaurants",
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    region_ref = models.ForeignKey(
+        Region,
+        related_name="restaurants",
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        editable=False,
+    )
     is_active = models.BooleanField(default=True, db_default=True)
+    favorite_count = models.PositiveIntegerField(default=0, db_default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True, db_default=Now())
     updated_at = models.DateTimeField(auto_now=True, db_default=Now())
 
@@ -56,6 +154,9 @@ class Restaurant(models.Model):
             models.Index(fields=["is_active"], name="idx_is_active"),
             models.Index(fields=["city", "district"], name="idx_city_district"),
             models.Index(fields=["latitude", "longitude"], name="idx_geo_coordinates"),
+            models.Index(fields=["geohash"], name="idx_restaurant_geohash"),
+            models.Index(fields=["favorite_count"], name="idx_restaurant_favorites"),
+            models.Index(fields=["is_active", "-rating", "name"], name="idx_restaurant_active_rating"),
         ]
 
     def __str__(self) -> str:
@@ -64,7 +165,41 @@ class Restaurant(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = self._generate_unique_slug()
+        self.geohash = self.compute_geohash()
+        self.cuisine_ref_id = taxonomy.ensure_cuisine(self.cuisine_type)
+        self.region_ref_id = taxonomy.ensure_region(self.city, self.district)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            derived = set()
+            if {"latitude", "longitude"} & set(update_fields):
+                derived.add("geohash")
+            if "cuisine_type" in update_fields:
+                derived.add("cuisine_ref")
+            if {"city", "district"} & set(update_fields):
+                derived.add("region_ref")
+            kwargs["update_fields"] = {*update_fields, *derived}
         super().save(*args, **kwargs)
+        if update_fields is None or "is_active" in update_fields:
+            self.sync_meal_recommendability()
+
+    def sync_meal_recommendability(self) -> int:
+        """Bring ``Meal.is_recommendable`` in line with ``is_active`` in one UPDATE.
+
+        Only rows whose flag actually changes are written, so re-saving a
+        restaurant whose status did not change costs one indexed no-op.
+        """
+        if self.pk is None:
+            return 0
+        if self.is_active:
+            stale = self.meals.filter(is_available=True, is_recommendable=False)
+        else:
+            stale = self.meals.filter(is_recommendable=True)
+        return stale.update(is_recommendable=self.is_active)
+
+    def compute_geohash(self) -> str | None:
+        if self.latitude is None or self.longitude is None:
+            return None
+        return encode_geohash(float(self.latitude), float(self.longitude))
 
     def _generate_unique_slug(self) -> str:
         base_value = self.name or f"restaurant-{get_random_string(6)}"
@@ -87,6 +222,14 @@ class Meal(models.Model):
     description = models.TextField(blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     category = models.CharField(max_length=50, blank=True, null=True)
+    category_ref = models.ForeignKey(
+        Category,
+        related_name="meals",
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        editable=False,
+    )
     is_vegetarian = models.BooleanField(default=False)
     is_spicy = models.BooleanField(default=False)
     image_url = models.CharField(max_length=255, blank=True, null=True)
@@ -96,6 +239,11 @@ class Meal(models.Model):
         null=True,
     )
     is_available = models.BooleanField(default=True, db_default=True)
+    # ``is_available`` and the restaurant's ``is_active``, kept on the meal so
+    # candidate queries are a range scan on one table (see ``Meal.save`` and
+    # ``Restaurant.sync_meal_recommendability``).
+    is_recommendable = models.BooleanField(default=True, db_default=True, editable=False)
+    favorite_count = models.PositiveIntegerField(default=0, db_default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True, db_default=Now())
     updated_at = models.DateTimeField(auto_now=True, db_default=Now())
     tags = models.ManyToManyField(
@@ -104,6 +252,12 @@ class Meal(models.Model):
         through="MealTag",
         blank=True,
     )
+    allergens = models.ManyToManyField(
+        Allergen,
+        related_name="meals",
+        through="MealAllergen",
+        blank=True,
+    )
 
     class Meta:
         db_table = "meals"
@@ -112,6 +266,11 @@ class Meal(models.Model):
             models.Index(fields=["category"], name="idx_category"),
             models.Index(fields=["is_vegetarian"], name="idx_is_vegetarian"),
             models.Index(fields=["is_available"], name="idx_is_available"),
+            models.Index(fields=["favorite_count"], name="idx_meal_favorites"),
+            models.Index(fields=["is_recommendable", "category_ref"], name="idx_meal_rec_category"),
+            models.Index(fields=["is_recommendable", "is_vegetarian"], name="idx_meal_rec_vegetarian"),
+            models.Index(fields=["is_recommendable", "created_at"], name="idx_meal_rec_created"),
+            models.Index(fields=["is_recommendable", "name"], name="idx_meal_rec_name"),
         ]
 
     def __str__(self) -> str:
@@ -120,8 +279,38 @@ class Meal(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = self._generate_unique_slug()
+        self.category_ref_id = taxonomy.ensure_category(self.category)
+        self.is_recommendable = bool(self.is_available) and self._restaurant_is_active()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            derived = set()
+            if "category" in update_fields:
+                derived.add("category_ref")
+            if "is_available" in update_fields:
+                derived.add("is_recommendable")
+            kwargs["update_fields"] = {*update_fields, *derived}
         super().save(*args, **kwargs)
 
+    def sync_allergens(self) -> None:
+        """Rebuild ``allergens`` from the components' ``metadata["allergens"]`` lists."""
+        payloads = self.nutrition_components.values_list("metadata", flat=True)
+        allergen_ids = {taxonomy.ensure_allergen(name) for name in taxonomy.allergen_names(payloads)}
+        allergen_ids.discard(None)
+        MealAllergen.objects.filter(meal=self).exclude(allergen_id__in=allergen_ids).delete()
+        MealAllergen.objects.bulk_create(
+            [MealAllergen(meal=self, allergen_id=allergen_id) for allergen_id in allergen_ids],
+            ignore_conflicts=True,
+        )
+
+    def _restaurant_is_active(self) -> bool:
+        if not self.restaurant_id:
+            return False
+        if Meal.restaurant.is_cached(self):
+            return bool(self.restaurant.is_active)
+        return bool(
+            Restaurant.objects.filter(pk=self.restaurant_id).values_list("is_active", flat=True).first()
+        )
+
     def _generate_unique_slug(self) -> str:
         restaurant_name = getattr(self.restaurant, "name", "") if self.restaurant_id else ""
         base_value = f"{restaurant_name}-{self.name}" if restaurant_name else self.name
@@ -222,6 +411,28 @@ class MealTag(models.Model):
         return f"{self.meal_id}:{self.tag_id}"
 
 
+class MealAllergen(models.Model):
+    """Allergens a meal contains, extracted from its components (see ``Meal.sync_allergens``)."""
+
+    meal = models.ForeignKey(
+        Meal,
+        on_delete=models.CASCADE,
+    )
+    allergen = models.ForeignKey(
+        Allergen,
+        on_delete=models.CASCADE,
+    )
+
+    class Meta:
+        db_table = "meal_allergens"
+        constraints = [
+            models.UniqueConstraint(fields=["meal", "allergen"], name="uniq_meal_allergen"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.meal_id}:{self.allergen_id}"
+
+
 class MerchantAccount(models.Model):
     """Authentication profile for merchants tied to a single restaurant."""
 
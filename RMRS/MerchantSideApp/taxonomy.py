@@ -0,0 +1,237 @@
+"""Normalized cuisine, region and category lookups.
+
+Merchants type cuisine, city, district and category as free text. Each
+value is folded to a key (NFKC, which turns full-width letters, digits and
+spaces into half-width ones; casefolded; whitespace dropped; 臺 -> 台) and
+resolved against a small lookup table whose rows also list aliases.
+Restaurants and meals keep a foreign key to the resolved row (see
+``Restaurant.save`` and ``Meal.save``). Allergens listed in a meal's
+components resolve the same way into the ``MealAllergen`` table (see
+``Meal.sync_allergens``).
+
+The tables are cached whole in ``RECOMMENDATION_CACHE``, so turning a
+filter value into ids costs no query and the filter itself becomes an
+indexed equality / ``IN`` lookup on the foreign key. Writes drop the cached
+table, but only a cache shared by all workers sees that from every process,
+so a process-local cache keeps each table for ``LOCAL_CACHE_TIMEOUT`` only.
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from RecommendationSystem.result_cache import shared_cache_enabled
+
+
+CHARACTER_FOLDS = str.maketrans({"臺": "台"})
+CACHE_KEY = "taxonomy:{kind}"
+CACHE_TIMEOUT = 3600
+# Seconds another worker may keep using a table a write changed, when the cache is per process.
+LOCAL_CACHE_TIMEOUT = 30
+MODEL_NAMES = {"cuisine": "Cuisine", "region": "Region", "category": "Category", "allergen": "Allergen"}
+# Separators accepted between values in a free-text list (checked after NFKC).
+LIST_SEPARATORS = re.compile(r"[,、;\n]+")
+# Canonical cuisine names and the spellings that should resolve to them.
+CUISINE_ALIASES = {
+    "台式": ["台菜", "台灣料理", "台灣菜"],
+    "中式": ["中菜", "中華料理"],
+    "日式": ["日本料理", "日料", "和食"],
+    "韓式": ["韓國料理", "韓料"],
+    "泰式": ["泰國料理", "泰菜"],
+    "義式": ["義大利料理", "義大利菜"],
+    "美式": ["美國料理"],
+    "西式": ["西餐"],
+}
+
+
+def normalize(value: Optional[str]) -> str:
+    """Lookup key for a free-text taxonomy value."""
+    if not value:
+        return ""
+    folded = unicodedata.normalize("NFKC", str(value)).casefold().translate(CHARACTER_FOLDS)
+    return "".join(folded.split())
+
+
+@dataclass
+class TermIndex:
+    """One taxonomy table: display names, keys (names and aliases) and parents."""
+
+    names: Dict[int, str] = field(default_factory=dict)
+    keys: Dict[str, List[int]] = field(default_factory=dict)
+    parents: Dict[int, Optional[int]] = field(default_factory=dict)
+
+    @classmethod
+    def from_rows(cls, rows) -> "TermIndex":
+        index = cls()
+        for term_id, name, aliases, parent_id in rows:
+            index.names[term_id] = name
+            index.parents[term_id] = parent_id
+            for key in {normalize(name), *(normalize(alias) for alias in aliases or [])}:
+                if key:
+                    index.keys.setdefault(key, []).append(term_id)
+        return index
+
+    def exact(self, value: Optional[str], roots: Optional[bool] = None) -> List[int]:
+        """Ids whose name or an alias equals ``value`` after normalization."""
+        ids = self.keys.get(normalize(value), [])
+        return [term_id for term_id in ids if self._level_matches(term_id, roots)]
+
+    def matching(self, value: Optional[str], roots: Optional[bool] = None) -> List[int]:
+        """Exact matches, or else every id with a name or alias containing ``value``."""
+        ids = self.exact(value, roots)
+        if ids:
+            return ids
+        needle = normalize(value)
+        if not needle:
+            return []
+        found = {term_id for key, term_ids in self.keys.items() if needle in key for term_id in term_ids}
+        return sorted(term_id for term_id in found if self._level_matches(term_id, roots))
+
+    def with_children(self, ids: List[int]) -> List[int]:
+        wanted = set(ids)
+        return sorted(wanted | {term_id for term_id, parent in self.parents.items() if parent in wanted})
+
+    def _level_matches(self, term_id: int, roots: Optional[bool]) -> bool:
+        if roots is None:
+            return True
+        return (self.parents.get(term_id) is None) == roots
+
+
+def _model(kind: str):
+    return apps.get_model("MerchantSideApp", MODEL_NAMES[kind])
+
+
+def _cache():
+    return caches[getattr(settings, "RECOMMENDATION_CACHE", "default")]
+
+
+def term_index(kind: str) -> TermIndex:
+    """The whole ``kind`` table, from the cache when present."""
+    key = CACHE_KEY.format(kind=kind)
+    cache = _cache()
+    index = cache.get(key)
+    if index is None:
+        terms = _model(kind).objects.all()
+        if kind == "region":
+            rows = terms.values_list("pk", "name", "aliases", "parent_id")
+        else:
+            rows = ((pk, name, aliases, None) for pk, name, aliases in terms.values_list("pk", "name", "aliases"))
+        index = TermIndex.from_rows(rows)
+        cache.set(key, index, CACHE_TIMEOUT if shared_cache_enabled() else LOCAL_CACHE_TIMEOUT)
+    return index
+
+
+def invalidate(kind: str) -> None:
+    """Drop the cached table now and again once the surrounding transaction commits."""
+    key = CACHE_KEY.format(kind=kind)
+    cache = _cache()
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def cuisine_ids(value: Optional[str]) -> List[int]:
+    return term_index("cuisine").matching(value)
+
+
+def category_ids(value: Optional[str]) -> List[int]:
+    return term_index("category").exact(value)
+
+
+def city_ids(value: Optional[str]) -> List[int]:
+    """Matching cities and all of their districts."""
+    index = term_index("region")
+    return index.with_children(index.matching(value, roots=True))
+
+
+def district_ids(value: Optional[str]) -> List[int]:
+    return term_index("region").matching(value, roots=False)
+
+
+def allergen_ids(value: Optional[str]) -> List[int]:
+    return term_index("allergen").exact(value)
+
+
+def split_terms(value) -> Tuple[str, ...]:
+    """Distinct non-empty values from a comma (or 、/;) separated string or a list."""
+    if not value:
+        return ()
+    if isinstance(value, str):
+        value = LIST_SEPARATORS.split(unicodedata.normalize("NFKC", value))
+    terms = []
+    seen = set()
+    for item in value:
+        item = str(item).strip()
+        if item and normalize(item) not in seen:
+            seen.add(normalize(item))
+            terms.append(item)
+    return tuple(terms)
+
+
+def allergen_names(metadata_payloads: Iterable[Optional[dict]]) -> Tuple[str, ...]:
+    """Distinct allergens named in component ``metadata["allergens"]`` values."""
+    names = []
+    for metadata in metadata_payloads:
+        payload = (metadata or {}).get("allergens") if isinstance(metadata, dict) else None
+        if isinstance(payload, (list, tuple)):
+            names.extend(str(item) for item in payload if item)
+        elif payload:
+            names.append(str(payload))
+    return split_terms(names)
+
+
+def category_choices() -> List[tuple]:
+    names = sorted(set(term_index("category").names.values()))
+    return [(name, name) for name in names]
+
+
+def _ensure(kind: str, name: Optional[str], parent_id: Optional[int] = None) -> Optional[int]:
+    key = normalize(name)
+    if not key:
+        return None
+    roots = None if kind != "region" else parent_id is None
+    model = _model(kind)
+    candidates = [
+        term_id
+        for term_id in term_index(kind).exact(name, roots)
+        if kind != "region" or term_index(kind).parents.get(term_id) == parent_id
+    ]
+    if candidates:
+        # The cached table may name rows a rolled-back transaction created.
+        existing = model.objects.filter(pk__in=candidates).values_list("pk", flat=True).first()
+        if existing is not None:
+            return existing
+        invalidate(kind)
+    lookup = {"key": key}
+    if kind == "region":
+        lookup["parent_id"] = parent_id
+    term, _created = model.objects.get_or_create(**lookup, defaults={"name": name.strip()})
+    return term.pk
+
+
+def ensure_cuisine(name: Optional[str]) -> Optional[int]:
+    """Id of the cuisine ``name`` resolves to, creating the row when it is new."""
+    return _ensure("cuisine", name)
+
+
+def ensure_category(name: Optional[str]) -> Optional[int]:
+    return _ensure("category", name)
+
+
+def ensure_allergen(name: Optional[str]) -> Optional[int]:
+    return _ensure("allergen", name)
+
+
+def ensure_region(city: Optional[str], district: Optional[str]) -> Optional[int]:
+    """Id of the district (or, without one, the city) region, creating rows as needed."""
+    city_id = _ensure("region", city)
+    if city_id is None:
+        return None
+    return _ensure("region", district, parent_id=city_id) or city_id
@@ -5,16 +5,19 @@ import shutil
 import tempfile
 from datetime import timedelta
 from decimal import Decimal
+from unittest import mock
 
 from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
 from PIL import Image
 
+from . import geo, taxonomy
 from .auth_utils import SESSION_MERCHANT_KEY
-from .models import Meal, MerchantAccount, Restaurant, NutritionInfo
+from .models import Allergen, Category, Cuisine, Meal, MerchantAccount, Restaurant, NutritionInfo, Region
 from UserSideApp.models import MealComponent
 
 
@@ -458,6 +461,7 @@ class MerchantMealManagementTests(TestCase):
 		self.assertEqual(response.status_code, 302)
 		meal.refresh_from_db()
 		self.assertFalse(meal.is_available)
+		self.assertFalse(meal.is_recommendable)
 
 	def test_reactivate_archived_meal(self):
 		self._login()
@@ -563,6 +567,12 @@ class MerchantDashboardTests(TestCase):
 		self.assertEqual(response.status_code, 302)
 		self.restaurant.refresh_from_db()
 		self.assertFalse(self.restaurant.is_active)
+		self.assertFalse(Meal.objects.filter(restaurant=self.restaurant, is_recommendable=True).exists())
+		self.client.post(reverse("merchantsideapp:restaurant_status"), {"status": "open"})
+		self.assertEqual(
+			list(Meal.objects.filter(restaurant=self.restaurant, is_recommendable=True)),
+			[self.meal_new],
+		)
 
 	def test_restaurant_detail_accessible_without_login(self):
 		url = reverse("merchantsideapp:restaurant_detail", args=[self.restaurant.slug])
@@ -702,3 +712,160 @@ class MerchantSettingsTests(TestCase):
 		self.restaurant.refresh_from_db()
 		self.assertIsNone(self.restaurant.latitude)
 		self.assertIsNone(self.restaurant.longitude)
+
+
+class RestaurantGeohashTests(TestCase):
+	def test_encode_matches_reference_hash(self):
+		self.assertEqual(geo.encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+		self.assertAlmostEqual(geo.decode("u4pruydqqvj")[0], 57.64911, places=4)
+
+	def test_save_maintains_geohash(self):
+		restaurant = Restaurant.objects.create(name="定位餐廳", latitude=25.033, longitude=121.5654)
+		self.assertEqual(restaurant.geohash, geo.encode(25.033, 121.5654))
+		restaurant.latitude = Decimal("24.1477")
+		restaurant.longitude = Decimal("120.6736")
+		restaurant.save(update_fields=["latitude", "longitude"])
+		restaurant.refresh_from_db()
+		self.assertEqual(restaurant.geohash, geo.encode(24.1477, 120.6736))
+		restaurant.latitude = None
+		restaurant.save()
+		self.assertIsNone(Restaurant.objects.get(pk=restaurant.pk).geohash)
+
+	def test_covering_cells_contain_radius(self):
+		origin = (25.033, 121.5654)
+		cells = geo.covering_cells(*origin, 1.0)
+		self.assertLessEqual(len(cells), 9)
+		for d_lat, d_lon in ((0.009, 0), (-0.009, 0), (0, 0.0099), (0, -0.0099), (0.006, 0.007)):
+			point_hash = geo.encode(origin[0] + d_lat, origin[1] + d_lon)
+			self.assertTrue(any(point_hash.startswith(cell) for cell in cells))
+
+	def test_cells_query_is_prefix_range(self):
+		inside = Restaurant.objects.create(name="範圍內", latitude=25.033, longitude=121.5654)
+		Restaurant.objects.create(name="範圍外", latitude=22.6273, longitude=120.3014)
+		cells = geo.covering_cells(25.033, 121.5654, 1.0)
+		self.assertEqual(list(Restaurant.objects.filter(geo.cells_q(cells))), [inside])
+		self.assertEqual(geo._prefix_upper_bound("wsqz"), "wsr")
+		self.assertIsNone(geo._prefix_upper_bound("zz"))
+
+	def test_geohash_ints_sort_like_cell_ranges(self):
+		point_hash = geo.encode(25.033, 121.5654)
+		low, high = geo.cell_int_range(point_hash[:5])
+		self.assertTrue(low <= geo.geohash_int(point_hash) < high)
+		self.assertEqual(geo.cell_int_range(geo._prefix_upper_bound(point_hash[:5]))[0], high)
+		self.assertEqual(geo.geohash_int(None), -1)
+
+	def test_haversine_distances(self):
+		distances = geo.haversine_km(25.033, 121.5654, [25.033, 25.042, None], [121.5654, 121.5654, None])
+		self.assertAlmostEqual(distances[0], 0.0)
+		self.assertAlmostEqual(distances[1], 1.0, places=2)
+
+	def test_zoom_precision_and_cell_bounds(self):
+		self.assertEqual([geo.precision_for_zoom(zoom) for zoom in (7, 10, 12, 14)], [4, 5, 6, 7])
+		west, south, east, north = geo.cell_bbox(geo.encode(25.033, 121.5654, 5))
+		self.assertTrue(west <= 121.5654 <= east and south <= 25.033 <= north)
+		self.assertAlmostEqual(east - west, geo.cell_size(5)[1])
+
+
+class TaxonomyTests(TestCase):
+	def setUp(self):
+		cache.clear()
+
+	def test_normalize_folds_width_case_and_variants(self):
+		self.assertEqual(taxonomy.normalize(" ＪＡＰＡＮ　Food "), "japanfood")
+		self.assertEqual(taxonomy.normalize("臺北市"), taxonomy.normalize("台北市"))
+		self.assertEqual(taxonomy.normalize(None), "")
+
+	def test_save_links_normalized_terms(self):
+		first = Restaurant.objects.create(name="一號店", cuisine_type="日本料理", city="臺北市", district="信義區")
+		second = Restaurant.objects.create(name="二號店", cuisine_type="日式", city="台北市", district="大安區")
+		self.assertEqual(first.cuisine_ref, second.cuisine_ref)
+		self.assertEqual(first.cuisine_ref, Cuisine.objects.get(key="日式"))
+		self.assertEqual(first.region_ref.parent, second.region_ref.parent)
+		self.assertEqual(Region.objects.filter(parent__isnull=True).count(), 1)
+		meal = Meal.objects.create(restaurant=first, name="拉麵", category="ＡＢＣ")
+		self.assertEqual(meal.category_ref, Category.objects.get(key="abc"))
+
+	def test_update_fields_refresh_references(self):
+		restaurant = Restaurant.objects.create(name="搬家餐廳", cuisine_type="台式", city="台中市")
+		restaurant.city = "高雄市"
+		restaurant.cuisine_type = "泰式"
+		restaurant.save(update_fields=["city", "cuisine_type"])
+		restaurant.refresh_from_db()
+		self.assertEqual(restaurant.region_ref.name, "高雄市")
+		self.assertEqual(restaurant.cuisine_ref.name, "泰式")
+
+	def test_city_filter_covers_its_districts(self):
+		downtown = Restaurant.objects.create(name="市中心", city="台北市", district="中正區")
+		uptown = Restaurant.objects.create(name="北區", city="台北市")
+		Restaurant.objects.create(name="南部", city="高雄市", district="前金區")
+		self.assertEqual(
+			set(Restaurant.objects.filter(region_ref__in=taxonomy.city_ids("臺北"))),
+			{downtown, uptown},
+		)
+		self.assertEqual(list(Restaurant.objects.filter(region_ref__in=taxonomy.district_ids("中正"))), [downtown])
+
+	def test_stale_cached_terms_are_recreated(self):
+		cache.set(taxonomy.CACHE_KEY.format(kind="category"), taxonomy.TermIndex.from_rows([(999, "湯品", [], None)]))
+		restaurant = Restaurant.objects.create(name="湯店")
+		meal = Meal.objects.create(restaurant=restaurant, name="玉米濃湯", category="湯品")
+		self.assertEqual(meal.category_ref.name, "湯品")
+		self.assertEqual(taxonomy.category_ids("湯品"), [meal.category_ref_id])
+
+	def test_per_process_cache_keeps_tables_only_briefly(self):
+		# bulk_create skips the save() invalidation, like a write made by another worker.
+		with mock.patch.object(taxonomy, "LOCAL_CACHE_TIMEOUT", 0):
+			self.assertEqual(taxonomy.cuisine_ids("越式"), [])
+			(vietnamese,) = Cuisine.objects.bulk_create([Cuisine(key="越式", name="越式", aliases=[])])
+			self.assertEqual(taxonomy.cuisine_ids("越式"), [vietnamese.pk])
+			cache_dir = tempfile.mkdtemp()
+			self.addCleanup(shutil.rmtree, cache_dir)
+			shared = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": cache_dir}}
+			with self.settings(CACHES=shared):
+				self.assertEqual(taxonomy.cuisine_ids("印度"), [])
+				Cuisine.objects.bulk_create([Cuisine(key="印度", name="印度", aliases=[])])
+				self.assertEqual(taxonomy.cuisine_ids("印度"), [])
+
+
+class MealAllergenTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.meal = Meal.objects.create(restaurant=Restaurant.objects.create(name="過敏原餐廳"), name="綜合炒麵")
+
+	def test_components_populate_normalized_allergens(self):
+		shrimp = MealComponent.objects.create(meal=self.meal, name="蝦仁", metadata={"allergens": ["蝦", " 蛋 "]})
+		MealComponent.objects.create(meal=self.meal, name="醬汁", metadata={"allergens": "蛋", "notes": "微辣"})
+		self.assertEqual(sorted(self.meal.allergens.values_list("name", flat=True)), ["蛋", "蝦"])
+		self.assertEqual(Allergen.objects.count(), 2)
+		shrimp.delete()
+		self.assertEqual(list(self.meal.allergens.values_list("name", flat=True)), ["蛋"])
+
+	def test_split_terms_handles_full_width_separators(self):
+		self.assertEqual(taxonomy.split_terms("花生，蝦、 蛋;花生"), ("花生", "蝦", "蛋"))
+		self.assertEqual(taxonomy.split_terms(["ＥＧＧ", "egg"]), ("ＥＧＧ",))
+
+
+class MealRecommendabilityTests(TestCase):
+	def setUp(self):
+		self.restaurant = Restaurant.objects.create(name="旗標餐廳")
+		self.meal = Meal.objects.create(restaurant=self.restaurant, name="旗標飯")
+		self.archived = Meal.objects.create(restaurant=self.restaurant, name="下架麵", is_available=False)
+
+	def test_save_derives_flag_from_meal_and_restaurant(self):
+		self.assertTrue(self.meal.is_recommendable)
+		self.assertFalse(self.archived.is_recommendable)
+		closed = Restaurant.objects.create(name="休息中", is_active=False)
+		self.assertFalse(Meal.objects.create(restaurant=closed, name="暫停飯").is_recommendable)
+		self.meal.is_available = False
+		self.meal.save(update_fields=["is_available"])
+		self.assertFalse(Meal.objects.get(pk=self.meal.pk).is_recommendable)
+
+	def test_status_change_is_one_bulk_update(self):
+		self.restaurant.is_active = False
+		with self.assertNumQueries(2):
+			self.restaurant.save(update_fields=["is_active"])
+		self.assertEqual(Meal.objects.filter(is_recommendable=True).count(), 0)
+		self.restaurant.is_active = True
+		self.restaurant.save(update_fields=["is_active"])
+		self.assertEqual(list(Meal.objects.filter(is_recommendable=True)), [self.meal])
+		with self.assertNumQueries(1):
+			self.restaurant.save(update_fields=["name"])
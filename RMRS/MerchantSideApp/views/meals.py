@@ -6,6 +6,8 @@ from django.db.models import Count, Q
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
 
+from RecommendationSystem.similarity import similar_meals
+
 from ..auth_utils import get_current_merchant, merchant_login_required
 from ..forms import MealCreateForm
 from ..models import Meal
@@ -101,13 +103,16 @@ def meal_detail(request, meal_slug):
     """Display meal details (public view)."""
     merchant = get_current_merchant(request)
     meal = get_object_or_404(
-        Meal.objects.select_related("restaurant", "nutrition").prefetch_related("nutrition_components"),
+        Meal.objects.select_related("restaurant", "nutrition").prefetch_related(
+            "nutrition_components", "allergens"
+        ),
         slug=meal_slug,
     )
     restaurant = meal.restaurant
     nutrition = _build_display_nutrition(meal)
     components = list(meal.nutrition_components.order_by("id"))
-    ingredients, allergens = _extract_ingredients(components)
+    ingredients = _extract_ingredients(components)
+    allergens = [allergen.name for allergen in meal.allergens.all()]
     stock_status = "庫存充足" if meal.is_available else "暫停供應"
     setattr(meal, "stock_status", stock_status)
     can_edit = bool(
@@ -115,6 +120,7 @@ def meal_detail(request, meal_slug):
         and getattr(merchant, "restaurant_id", None) == restaurant.id
     )
     image_source = meal.get_image_source()
+    similar_dishes = similar_meals(meal, limit=4)
 
     return render(
         request,
@@ -127,6 +133,7 @@ def meal_detail(request, meal_slug):
             "allergens": allergens,
             "can_edit": can_edit,
             "image_source": image_source,
+            "similar_dishes": similar_dishes,
         },
     )
 
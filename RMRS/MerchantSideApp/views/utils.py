@@ -2,8 +2,13 @@
 
 import json
 from decimal import Decimal
+from functools import partial
+
+from django.db import transaction
 
 from ..models import NutritionInfo
+from RecommendationSystem.dietary import dietary_index
+from RecommendationSystem.nutrition import nutrition_matrix
 from UserSideApp.models import MealComponent
 
 
@@ -23,29 +28,14 @@ def _build_display_nutrition(meal):
 
 
 def _extract_ingredients(meal_components):
-    """Extract ingredients and allergens from meal components."""
+    """Extract ingredient labels from meal components."""
     ingredients = []
-    allergens = []
     for component in meal_components:
         label = component.name
         if component.quantity:
             label = f"{label}（{component.quantity}）"
         ingredients.append(label)
-        metadata = component.metadata or {}
-        allergen_payload = metadata.get("allergens")
-        if isinstance(allergen_payload, (list, tuple)):
-            allergens.extend(str(item) for item in allergen_payload if item)
-        elif allergen_payload:
-            allergens.append(str(allergen_payload))
-    deduped = []
-    seen = set()
-    for item in allergens:
-        key = item.strip()
-        if not key or key in seen:
-            continue
-        seen.add(key)
-        deduped.append(key)
-    return ingredients, deduped
+    return ingredients
 
 
 def _coerce_decimal(value: Decimal | float | str | int | None) -> Decimal:
@@ -69,6 +59,7 @@ def _coerce_float(value: Decimal | float | str | int | None) -> float | None:
 
 def _persist_meal_nutrition(meal, entries):
     """Persist meal nutrition information."""
+    transaction.on_commit(partial(nutrition_matrix.refresh_meals, [meal.pk]))
     if not entries:
         NutritionInfo.objects.filter(meal=meal).delete()
         return
@@ -143,6 +134,8 @@ def _persist_nutrition_components(meal, entries):
                 for entry in entries
             ],
         )
+    meal.sync_allergens()
+    transaction.on_commit(partial(dietary_index.refresh_meals, [meal.pk]))
     _persist_meal_nutrition(meal, entries)
 
 
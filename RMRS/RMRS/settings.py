@@ -181,6 +181,64 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Recommendation engine
+
+# Serve candidate selection from the in-process NumPy catalog index.
+RECOMMENDATION_CATALOG_INDEX = os.getenv("RECOMMENDATION_CATALOG_INDEX", "False").lower() in ("true", "1", "t")
+# Seconds before the catalog index is fully reloaded (covers writes made by other workers).
+RECOMMENDATION_CATALOG_MAX_AGE = int(os.getenv("RECOMMENDATION_CATALOG_MAX_AGE", 300))
+# "probe" samples random meals by id-range probing; "order_by" keeps the ORDER BY RAND() query.
+RECOMMENDATION_RANDOM_SAMPLING = os.getenv("RECOMMENDATION_RANDOM_SAMPLING", "probe")
+# Cache alias for recommendation caches. Point it at a shared backend (Redis, Memcached) when running
+# several workers so invalidations reach all of them; per-user exclusion sets are only cached there.
+RECOMMENDATION_CACHE = os.getenv("RECOMMENDATION_CACHE", "default")
+# Seconds per-user cooldown/seen exclusion sets stay cached (shared cache backends only).
+RECOMMENDATION_EXCLUSION_TTL = int(os.getenv("RECOMMENDATION_EXCLUSION_TTL", 300))
+# Seconds shared (user-independent) ranked id lists stay cached; 0 disables the cache.
+RECOMMENDATION_RESULT_CACHE_TTL = int(os.getenv("RECOMMENDATION_RESULT_CACHE_TTL", 300))
+# Ids stored per cached ranking, leaving room for per-user cooldown filtering.
+RECOMMENDATION_RESULT_CACHE_DEPTH = int(os.getenv("RECOMMENDATION_RESULT_CACHE_DEPTH", 60))
+# Log every card shown as an unselected RecommendationHistory row, written behind in batches.
+RECOMMENDATION_IMPRESSION_LOGGING = os.getenv("RECOMMENDATION_IMPRESSION_LOGGING", "False").lower() in ("true", "1", "t")
+# Flush once this many impressions are queued or this many seconds pass; beyond capacity they are dropped.
+RECOMMENDATION_IMPRESSION_FLUSH_SIZE = int(os.getenv("RECOMMENDATION_IMPRESSION_FLUSH_SIZE", 200))
+RECOMMENDATION_IMPRESSION_FLUSH_INTERVAL = float(os.getenv("RECOMMENDATION_IMPRESSION_FLUSH_INTERVAL", 5))
+RECOMMENDATION_IMPRESSION_CAPACITY = int(os.getenv("RECOMMENDATION_IMPRESSION_CAPACITY", 10000))
+# Where archive_recommendation_history writes compressed history files.
+RECOMMENDATION_ARCHIVE_DIR = os.getenv("RECOMMENDATION_ARCHIVE_DIR", str(BASE_DIR / "archive"))
+# Serve the default recommendation page from precomputed slates and rebuild a user's slate after
+# login or a preference change; slates older than the max age fall back to live computation.
+RECOMMENDATION_SLATES = os.getenv("RECOMMENDATION_SLATES", "False").lower() in ("true", "1", "t")
+RECOMMENDATION_SLATE_MAX_AGE = int(os.getenv("RECOMMENDATION_SLATE_MAX_AGE", 36 * 3600))
+# Render only the primary cards up front and load each secondary section from its own endpoint.
+RECOMMENDATION_LAZY_SECTIONS = os.getenv("RECOMMENDATION_LAZY_SECTIONS", "True").lower() in ("true", "1", "t")
+# Seconds browsers may reuse a per-section response (private cache only).
+RECOMMENDATION_SECTION_MAX_AGE = int(os.getenv("RECOMMENDATION_SECTION_MAX_AGE", 60))
+# Encoder for the recommendation JSON endpoints: "json" (stdlib) or "orjson" (pip install orjson).
+RECOMMENDATION_JSON_ENCODER = os.getenv("RECOMMENDATION_JSON_ENCODER", "json")
+# Keyword search backend: "auto" (MySQL FULLTEXT ngram index on MySQL 5.7.6+, otherwise - including
+# MariaDB - the in-process bigram index), "mysql", "index", or "like" for the old icontains scan.
+RECOMMENDATION_SEARCH_BACKEND = os.getenv("RECOMMENDATION_SEARCH_BACKEND", "auto")
+# Seconds before the in-process search index is fully reloaded.
+RECOMMENDATION_SEARCH_INDEX_MAX_AGE = int(os.getenv("RECOMMENDATION_SEARCH_INDEX_MAX_AGE", 3600))
+# Search totals stop counting at this many rows (shown as "1000+") and, when RECOMMENDATION_CACHE is
+# shared by all workers, are cached per normalized query for this many seconds, or until the catalog
+# changes; 0 disables the cache.
+RECOMMENDATION_SEARCH_COUNT_CAP = int(os.getenv("RECOMMENDATION_SEARCH_COUNT_CAP", 1000))
+RECOMMENDATION_SEARCH_COUNT_TTL = int(os.getenv("RECOMMENDATION_SEARCH_COUNT_TTL", 300))
+# Seconds browsers may reuse the search map's GeoJSON markers before revalidating (private cache only).
+RECOMMENDATION_SEARCH_MAP_MAX_AGE = int(os.getenv("RECOMMENDATION_SEARCH_MAP_MAX_AGE", 60))
+# Map zoom from which the viewport API returns individual restaurants instead of grid clusters.
+RECOMMENDATION_VIEWPORT_CLUSTER_ZOOM = int(os.getenv("RECOMMENDATION_VIEWPORT_CLUSTER_ZOOM", 15))
+
+# Async views
+
+# Route the search and random-recommendation pages to their async variants (serve with an ASGI
+# server such as uvicorn or daphne to get the most out of them).
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "False").lower() in ("true", "1", "t")
+# Run the independent queries of async views in worker threads, each on its own connection.
+ASYNC_PARALLEL_QUERIES = os.getenv("ASYNC_PARALLEL_QUERIES", "True").lower() in ("true", "1", "t")
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
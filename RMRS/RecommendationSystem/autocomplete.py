@@ -0,0 +1,250 @@
+"""Prefix index for typeahead over restaurant, meal, cuisine and district names.
+
+Every name (and taxonomy alias) is folded with :func:`taxonomy.normalize`,
+so full-width letters, case, whitespace and 臺/台 do not matter. Each kind
+keeps a sorted array of ``(key, id)`` pairs. A prefix maps to one
+contiguous slice of it, found with two bisections. Short prefixes
+(``HEAD_LENGTH`` characters or fewer) can match a large share of the
+catalog, so their top suggestions are precomputed. Longer prefixes select
+few rows and are ranked on the fly. Restaurant and meal saves update the
+affected entries in place (see ``signals``).
+"""
+
+from __future__ import annotations
+
+import bisect
+import heapq
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db.models import Count, Q
+
+from MerchantSideApp import taxonomy
+from MerchantSideApp.models import Cuisine, Meal, Region, Restaurant
+
+
+KINDS = ("restaurant", "meal", "cuisine", "district")
+HEAD_LENGTH = 2
+HEAD_SIZE = 20
+# Sorts after every character a key can contain.
+KEY_END = "\U0010ffff"
+
+
+@dataclass(frozen=True)
+class Suggestion:
+    kind: str
+    id: int
+    label: str
+    detail: str
+    slug: str
+    # Higher ranks first, compared within one kind.
+    rank: Tuple[float, ...]
+
+    def sort_key(self):
+        return tuple(-value for value in self.rank), self.label, self.id
+
+
+class PrefixIndex:
+    """Sorted ``(key, id)`` array of one kind with precomputed heads for short prefixes."""
+
+    def __init__(self):
+        self.entries: List[Tuple[str, int]] = []
+        self.items: Dict[int, Suggestion] = {}
+        self.keys: Dict[int, Tuple[str, ...]] = {}
+        self.heads: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def load(self, rows: Iterable[Tuple[Suggestion, Sequence[str]]]) -> None:
+        self.items = {}
+        self.keys = {}
+        for suggestion, names in rows:
+            self._store(suggestion, names)
+        self.entries = sorted((key, item_id) for item_id, keys in self.keys.items() for key in keys)
+        candidates: Dict[str, set] = {}
+        for key, item_id in self.entries:
+            for length in range(1, min(HEAD_LENGTH, len(key)) + 1):
+                candidates.setdefault(key[:length], set()).add(item_id)
+        self.heads = {prefix: self._top(ids, HEAD_SIZE) for prefix, ids in candidates.items()}
+
+    def _store(self, suggestion: Suggestion, names: Sequence[str]) -> Tuple[str, ...]:
+        keys = tuple(sorted({key for key in (taxonomy.normalize(name) for name in names) if key}))
+        self.items[suggestion.id] = suggestion
+        self.keys[suggestion.id] = keys
+        return keys
+
+    def _top(self, ids, limit: int) -> List[int]:
+        return [item.id for item in heapq.nsmallest(limit, (self.items[i] for i in ids), key=Suggestion.sort_key)]
+
+    def _range(self, prefix: str) -> set:
+        start = bisect.bisect_left(self.entries, (prefix,))
+        stop = bisect.bisect_left(self.entries, (prefix + KEY_END,), start)
+        return {item_id for _key, item_id in self.entries[start:stop]}
+
+    def _refresh_heads(self, keys: Iterable[str]) -> None:
+        prefixes = {key[:length] for key in keys for length in range(1, min(HEAD_LENGTH, len(key)) + 1)}
+        for prefix in prefixes:
+            ids = self._range(prefix)
+            if ids:
+                self.heads[prefix] = self._top(ids, HEAD_SIZE)
+            else:
+                self.heads.pop(prefix, None)
+
+    def remove(self, item_id: int) -> None:
+        keys = self.keys.pop(item_id, None)
+        if keys is None:
+            return
+        del self.items[item_id]
+        for key in keys:
+            position = bisect.bisect_left(self.entries, (key, item_id))
+            if position < len(self.entries) and self.entries[position] == (key, item_id):
+                del self.entries[position]
+        self._refresh_heads(keys)
+
+    def upsert(self, suggestion: Suggestion, names: Sequence[str]) -> None:
+        old_keys = self.keys.get(suggestion.id, ())
+        self.remove(suggestion.id)
+        keys = self._store(suggestion, names)
+        for key in keys:
+            bisect.insort(self.entries, (key, suggestion.id))
+        self._refresh_heads(old_keys + keys)
+
+    def search(self, prefix: str, limit: int) -> List[Suggestion]:
+        if not prefix:
+            return []
+        if len(prefix) <= HEAD_LENGTH and limit <= HEAD_SIZE:
+            ids = self.heads.get(prefix, ())[:limit]
+        else:
+            ids = self._top(self._range(prefix), limit)
+        return [self.items[item_id] for item_id in ids]
+
+
+def _restaurant_rows(ids: Optional[Sequence[int]] = None):
+    qs = Restaurant.objects.filter(is_active=True)
+    if ids is not None:
+        qs = qs.filter(pk__in=list(ids))
+    fields = ("pk", "name", "slug", "city", "district", "rating", "favorite_count")
+    for pk, name, slug, city, district, rating, favorites in qs.values_list(*fields).iterator(chunk_size=2000):
+        detail = f"{city or ''}{district or ''}"
+        yield Suggestion("restaurant", pk, name, detail, slug, (float(rating or 0), favorites)), (name,)
+
+
+def _meal_rows(ids: Optional[Sequence[int]] = None, restaurant_ids: Optional[Sequence[int]] = None):
+    qs = Meal.objects.filter(is_recommendable=True)
+    if ids is not None:
+        qs = qs.filter(pk__in=list(ids))
+    if restaurant_ids is not None:
+        qs = qs.filter(restaurant_id__in=list(restaurant_ids))
+    fields = ("pk", "name", "slug", "restaurant__name", "favorite_count", "restaurant__rating")
+    for pk, name, slug, restaurant, favorites, rating in qs.values_list(*fields).iterator(chunk_size=2000):
+        yield Suggestion("meal", pk, name, restaurant, slug, (favorites, float(rating or 0))), (name,)
+
+
+def _term_rows(kind: str, queryset, detail_field: Optional[str] = None):
+    """Taxonomy terms used by at least one open restaurant, ranked by how many."""
+    qs = queryset.annotate(restaurant_count=Count("restaurants", filter=Q(restaurants__is_active=True)))
+    fields = ("pk", "name", "aliases", "restaurant_count", detail_field or "key")
+    for pk, name, aliases, count, detail in qs.filter(restaurant_count__gt=0).values_list(*fields):
+        yield Suggestion(kind, pk, name, detail if detail_field else "", "", (count,)), (name, *(aliases or ()))
+
+
+def _cuisine_rows():
+    return _term_rows("cuisine", Cuisine.objects.all())
+
+
+def _district_rows():
+    return _term_rows("district", Region.objects.filter(parent__isnull=False), "parent__name")
+
+
+class AutocompleteIndex:
+    """Process-wide prefix indexes per kind with lazy loading and incremental updates."""
+
+    def __init__(self, max_age: Optional[float] = None):
+        self._lock = threading.RLock()
+        self._indexes: Optional[Dict[str, PrefixIndex]] = None
+        self._loaded_at = 0.0
+        self._max_age = max_age
+
+    @property
+    def max_age(self) -> float:
+        if self._max_age is not None:
+            return self._max_age
+        return float(getattr(settings, "RECOMMENDATION_SEARCH_INDEX_MAX_AGE", 3600))
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._indexes is not None
+
+    def _loaded(self) -> Dict[str, PrefixIndex]:
+        expired = self.max_age and time.monotonic() - self._loaded_at > self.max_age
+        if self._indexes is None or expired:
+            self.reload()
+        return self._indexes
+
+    def reload(self) -> None:
+        sources = {
+            "restaurant": _restaurant_rows(),
+            "meal": _meal_rows(),
+            "cuisine": _cuisine_rows(),
+            "district": _district_rows(),
+        }
+        indexes = {}
+        for kind, rows in sources.items():
+            indexes[kind] = PrefixIndex()
+            indexes[kind].load(rows)
+        with self._lock:
+            self._indexes = indexes
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._indexes = None
+
+    def _apply(self, kind: str, ids: Sequence[int], rows) -> None:
+        rows = {suggestion.id: (suggestion, names) for suggestion, names in rows}
+        with self._lock:
+            if self._indexes is None:
+                return
+            index = self._indexes[kind]
+            for item_id in set(ids) | set(rows):
+                if item_id in rows:
+                    index.upsert(*rows[item_id])
+                else:
+                    index.remove(item_id)
+
+    def refresh_meals(self, meal_ids: Iterable[int]) -> None:
+        """Re-read the given meals into a loaded index."""
+        meal_ids = list(meal_ids)
+        if meal_ids and self.is_loaded:
+            self._apply("meal", meal_ids, list(_meal_rows(meal_ids)))
+
+    def refresh_restaurant(self, restaurant_id: int) -> None:
+        """Re-read a restaurant, its meals and the cuisine/district counts it feeds."""
+        if not self.is_loaded:
+            return
+        self._apply("restaurant", [restaurant_id], list(_restaurant_rows([restaurant_id])))
+        meal_ids = list(Meal.objects.filter(restaurant_id=restaurant_id).values_list("pk", flat=True))
+        self._apply("meal", meal_ids, list(_meal_rows(restaurant_ids=[restaurant_id])))
+        cuisines = PrefixIndex()
+        cuisines.load(_cuisine_rows())
+        districts = PrefixIndex()
+        districts.load(_district_rows())
+        with self._lock:
+            if self._indexes is not None:
+                self._indexes = {**self._indexes, "cuisine": cuisines, "district": districts}
+
+    def suggest(self, query: str, kinds: Sequence[str] = KINDS, limit: int = 8) -> List[Suggestion]:
+        """Up to ``limit`` suggestions per kind whose name starts with ``query``, best first."""
+        prefix = taxonomy.normalize(query)
+        if not prefix:
+            return []
+        with self._lock:
+            indexes = self._loaded()
+            return [suggestion for kind in kinds for suggestion in indexes[kind].search(prefix, limit)]
+
+
+autocomplete_index = AutocompleteIndex()
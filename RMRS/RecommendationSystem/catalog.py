@@ -0,0 +1,432 @@
+"""Array-backed, in-process index over the meal catalog.
+
+The index keeps one row per meal in a set of NumPy columns so the
+recommendation engine can evaluate filters with vectorized masks and pick
+top-k candidates with ``argpartition`` instead of issuing a query per
+section. Rows are sorted by meal id, which keeps lookups for incremental
+updates at ``searchsorted`` cost.
+"""
+
+from __future__ import annotations
+
+import copy
+import threading
+import time
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence
+
+import numpy as np
+from django.conf import settings
+
+from MerchantSideApp import taxonomy
+from MerchantSideApp.geo import cell_int_range, covering_cells, geohash_int, haversine_km
+from MerchantSideApp.models import Meal, Restaurant
+
+from .dietary import dietary_index
+
+
+PRICE_CODES = {value: code for code, value in enumerate(Restaurant.PriceRange.values)}
+NO_CODE = -1
+
+
+class CatalogColumns:
+    """Column store for meal rows, sorted by meal id."""
+
+    INT_COLUMNS = {
+        "meal_id": np.int64,
+        "restaurant_id": np.int64,
+        "price_code": np.int8,
+        "category_id": np.int64,
+        "cuisine_id": np.int64,
+        "region_id": np.int64,
+        "favorite_count": np.int32,
+        "geohash": np.int64,
+    }
+    FLOAT_COLUMNS = {
+        "rating": np.float32,
+        "created_at": np.float64,
+        "latitude": np.float64,
+        "longitude": np.float64,
+    }
+    BOOL_COLUMNS = ("is_vegetarian", "is_spicy", "is_available", "is_active")
+
+    def __init__(self):
+        self.names: List[str] = []
+        self._name_rank: Optional[np.ndarray] = None
+        for column, dtype in {**self.INT_COLUMNS, **self.FLOAT_COLUMNS}.items():
+            setattr(self, column, np.empty(0, dtype=dtype))
+        for column in self.BOOL_COLUMNS:
+            setattr(self, column, np.empty(0, dtype=bool))
+
+    def __len__(self) -> int:
+        return int(self.meal_id.size)
+
+    @property
+    def column_names(self) -> Sequence[str]:
+        return (*self.INT_COLUMNS, *self.FLOAT_COLUMNS, *self.BOOL_COLUMNS)
+
+    def encode_row(self, row: dict) -> dict:
+        """Translate a raw row (see ``CATALOG_VALUES``) into column values."""
+        created_at = row.get("created_at")
+        latitude = row.get("restaurant__latitude")
+        longitude = row.get("restaurant__longitude")
+        return {
+            "meal_id": row["id"],
+            "restaurant_id": row["restaurant_id"],
+            "price_code": PRICE_CODES.get(row.get("restaurant__price_range"), NO_CODE),
+            "category_id": row.get("category_ref_id") or NO_CODE,
+            "cuisine_id": row.get("restaurant__cuisine_ref_id") or NO_CODE,
+            "region_id": row.get("restaurant__region_ref_id") or NO_CODE,
+            "favorite_count": row.get("favorite_count") or 0,
+            "geohash": geohash_int(row.get("restaurant__geohash")),
+            "rating": float(row.get("restaurant__rating") or 0),
+            "created_at": created_at.timestamp() if created_at else 0.0,
+            "latitude": float(latitude) if latitude is not None else np.nan,
+            "longitude": float(longitude) if longitude is not None else np.nan,
+            "is_vegetarian": bool(row.get("is_vegetarian")),
+            "is_spicy": bool(row.get("is_spicy")),
+            "is_available": bool(row.get("is_available")),
+            "is_active": bool(row.get("restaurant__is_active")),
+        }
+
+    def load(self, rows: Iterable[dict]) -> None:
+        encoded = []
+        names = []
+        for row in rows:
+            encoded.append(self.encode_row(row))
+            names.append(row.get("name") or "")
+        order = np.argsort(np.array([item["meal_id"] for item in encoded], dtype=np.int64), kind="stable")
+        for column in self.column_names:
+            dtype = getattr(self, column).dtype
+            values = np.array([item[column] for item in encoded], dtype=dtype)
+            setattr(self, column, values[order] if values.size else values)
+        self.names = [names[i] for i in order]
+        self._name_rank = None
+
+    def extended(self, rows: Iterable[dict]) -> "CatalogColumns":
+        """New columns holding these rows plus ``rows`` not present yet (existing rows win)."""
+        added = CatalogColumns()
+        added.load(row for row in rows if self.position(row["id"]) is None)
+        if not len(added):
+            return self
+        merged = CatalogColumns()
+        order = np.argsort(np.concatenate([self.meal_id, added.meal_id]), kind="stable")
+        for column in self.column_names:
+            setattr(merged, column, np.concatenate([getattr(self, column), getattr(added, column)])[order])
+        names = self.names + added.names
+        merged.names = [names[i] for i in order]
+        return merged
+
+    def copy(self, columns: Optional[Sequence[str]] = None) -> "CatalogColumns":
+        """Copy whose ``columns`` (default: all, plus names) can be mutated without racing readers.
+
+        Columns not copied stay shared with this instance, so they must only
+        be replaced, never written in place.
+        """
+        clone = copy.copy(self)
+        for column in self.column_names if columns is None else columns:
+            setattr(clone, column, getattr(self, column).copy())
+        if columns is None:
+            clone.names = list(self.names)
+        return clone
+
+    def position(self, meal_id: int) -> Optional[int]:
+        pos = int(np.searchsorted(self.meal_id, meal_id))
+        if pos < len(self) and self.meal_id[pos] == meal_id:
+            return pos
+        return None
+
+    def upsert(self, row: dict) -> None:
+        values = self.encode_row(row)
+        pos = self.position(values["meal_id"])
+        if pos is not None:
+            for column in self.column_names:
+                getattr(self, column)[pos] = values[column]
+            if self.names[pos] != (row.get("name") or ""):
+                self.names[pos] = row.get("name") or ""
+                self._name_rank = None
+            return
+        pos = int(np.searchsorted(self.meal_id, values["meal_id"]))
+        for column in self.column_names:
+            array = getattr(self, column)
+            setattr(self, column, np.insert(array, pos, np.array(values[column], dtype=array.dtype)))
+        self.names.insert(pos, row.get("name") or "")
+        self._name_rank = None
+
+    def remove(self, meal_id: int) -> None:
+        pos = self.position(meal_id)
+        if pos is None:
+            return
+        for column in self.column_names:
+            setattr(self, column, np.delete(getattr(self, column), pos))
+        del self.names[pos]
+        self._name_rank = None
+
+    @property
+    def name_rank(self) -> np.ndarray:
+        """Rank of each row's name, used as the final ordering tie-breaker."""
+        if self._name_rank is None or self._name_rank.size != len(self):
+            rank = np.empty(len(self), dtype=np.int64)
+            order = np.argsort(np.array(self.names, dtype=object), kind="stable")
+            rank[order] = np.arange(len(self))
+            self._name_rank = rank
+        return self._name_rank
+
+    # -- query helpers -------------------------------------------------
+
+    def base_mask(self, exclude_ids: Optional[Iterable[int]] = None) -> np.ndarray:
+        mask = self.is_available & self.is_active
+        if exclude_ids is not None:
+            excluded = (
+                exclude_ids
+                if isinstance(exclude_ids, np.ndarray)
+                else np.fromiter(exclude_ids, dtype=np.int64)
+            )
+            if excluded.size:
+                mask &= ~np.isin(self.meal_id, excluded)
+        return mask
+
+    def filter_mask(self, filters, exclude_ids: Optional[Iterable[int]] = None) -> np.ndarray:
+        """Vectorized equivalent of ``RecommendationEngine.apply_filters``."""
+        mask = self.base_mask(exclude_ids)
+        if getattr(filters, "cuisine_type", None):
+            mask &= np.isin(self.cuisine_id, taxonomy.cuisine_ids(filters.cuisine_type))
+        if getattr(filters, "category", None):
+            mask &= np.isin(self.category_id, taxonomy.category_ids(filters.category))
+        if getattr(filters, "price_range", None):
+            mask &= self.price_code == PRICE_CODES.get(filters.price_range, NO_CODE - 1)
+        if getattr(filters, "city", None):
+            mask &= np.isin(self.region_id, taxonomy.city_ids(filters.city))
+        if getattr(filters, "district", None):
+            mask &= np.isin(self.region_id, taxonomy.district_ids(filters.district))
+        if getattr(filters, "is_vegetarian", False):
+            mask &= self.is_vegetarian
+        if getattr(filters, "avoid_spicy", False):
+            mask &= ~self.is_spicy
+        dietary = dietary_index.selection(
+            getattr(filters, "include_tags", ()),
+            getattr(filters, "exclude_allergens", ()),
+        )
+        if dietary is not None:
+            mask &= dietary.mask(self.meal_id)
+        if getattr(filters, "near", None):
+            latitude, longitude = filters.near
+            mask &= self.cells_mask(covering_cells(latitude, longitude, filters.radius_km))
+            rows = np.flatnonzero(mask)
+            distances = haversine_km(latitude, longitude, self.latitude[rows], self.longitude[rows])
+            mask[rows[~(distances <= filters.radius_km)]] = False
+        return mask
+
+    def cells_mask(self, cells: Iterable[str]) -> np.ndarray:
+        """Rows whose restaurant lies in any of ``cells``: range compares, no trigonometry."""
+        mask = np.zeros(len(self), dtype=bool)
+        for cell in cells:
+            low, high = cell_int_range(cell)
+            mask |= (self.geohash >= low) & (self.geohash < high)
+        return mask
+
+    def ordering_keys(self, ordering: str) -> List[np.ndarray]:
+        """Sort keys (primary first, all ascending) for a named ordering."""
+        if ordering == "rating":
+            return [-self.rating, self.name_rank]
+        if ordering == "popular":
+            return [-self.favorite_count, -self.rating, self.name_rank]
+        if ordering == "newest":
+            return [-self.created_at]
+        raise ValueError(f"Unknown catalog ordering: {ordering}")
+
+    def top_k(self, mask: np.ndarray, ordering: str, k: int) -> np.ndarray:
+        """Return meal ids of the best ``k`` rows under ``mask``.
+
+        ``argpartition`` narrows the rows to those that can reach the top-k
+        by the primary key (ties included) before the full lexicographic
+        sort, so the sort only touches a handful of rows.
+        """
+        rows = np.flatnonzero(mask)
+        if not rows.size or k <= 0:
+            return np.empty(0, dtype=np.int64)
+        keys = [key[rows] for key in self.ordering_keys(ordering)]
+        if rows.size > k:
+            primary = keys[0]
+            threshold = primary[np.argpartition(primary, k - 1)[k - 1]]
+            keep = primary <= threshold
+            rows = rows[keep]
+            keys = [key[keep] for key in keys]
+        order = np.lexsort(tuple(reversed(keys)))
+        return self.meal_id[rows[order[:k]]]
+
+    def nearest(self, mask: np.ndarray, latitude: float, longitude: float, k: int) -> np.ndarray:
+        """Meal ids of the ``k`` rows under ``mask`` closest to a point (ties by name)."""
+        rows = np.flatnonzero(mask)
+        if not rows.size or k <= 0:
+            return np.empty(0, dtype=np.int64)
+        distances = haversine_km(latitude, longitude, self.latitude[rows], self.longitude[rows])
+        order = np.lexsort((self.name_rank[rows], distances))
+        return self.meal_id[rows[order[:k]]]
+
+    def sample(self, mask: np.ndarray, k: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """Return up to ``k`` meal ids drawn uniformly from rows under ``mask``."""
+        rows = np.flatnonzero(mask)
+        if not rows.size or k <= 0:
+            return np.empty(0, dtype=np.int64)
+        rng = rng or np.random.default_rng()
+        return self.meal_id[rng.choice(rows, size=min(k, rows.size), replace=False)]
+
+    def favorite_counts(self, meal_ids: Iterable[int]) -> Dict[int, int]:
+        counts = {}
+        for meal_id in meal_ids:
+            pos = self.position(meal_id)
+            if pos is not None:
+                counts[int(meal_id)] = int(self.favorite_count[pos])
+        return counts
+
+
+CATALOG_VALUES = (
+    "id",
+    "name",
+    "category_ref_id",
+    "is_vegetarian",
+    "is_spicy",
+    "is_available",
+    "created_at",
+    "favorite_count",
+    "restaurant_id",
+    "restaurant__price_range",
+    "restaurant__cuisine_ref_id",
+    "restaurant__region_ref_id",
+    "restaurant__rating",
+    "restaurant__is_active",
+    "restaurant__latitude",
+    "restaurant__longitude",
+    "restaurant__geohash",
+)
+
+
+def catalog_rows(meal_ids: Optional[Iterable[int]] = None, recommendable_only: bool = False):
+    """Fetch raw catalog rows in a single query."""
+    qs = Meal.objects.all()
+    if meal_ids is not None:
+        qs = qs.filter(pk__in=list(meal_ids))
+    if recommendable_only:
+        qs = qs.filter(is_recommendable=True)
+    return qs.values(*CATALOG_VALUES)
+
+
+class MealCatalogIndex:
+    """Process-wide catalog index with lazy loading and incremental updates."""
+
+    def __init__(self, max_age: Optional[float] = None):
+        self._lock = threading.RLock()
+        self._columns: Optional[CatalogColumns] = None
+        self._loaded_at = 0.0
+        self._max_age = max_age
+
+    @property
+    def max_age(self) -> float:
+        if self._max_age is not None:
+            return self._max_age
+        return float(getattr(settings, "RECOMMENDATION_CATALOG_MAX_AGE", 300))
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._columns is not None
+
+    def columns(self) -> CatalogColumns:
+        """Return the live columns, (re)loading them when missing or expired."""
+        with self._lock:
+            expired = self.max_age and time.monotonic() - self._loaded_at > self.max_age
+            if self._columns is None or expired:
+                self.reload()
+            return self._columns
+
+    def reload(self) -> None:
+        columns = CatalogColumns()
+        columns.load(catalog_rows())
+        with self._lock:
+            self._columns = columns
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._columns = None
+
+    def refresh_meals(self, meal_ids: Iterable[int]) -> None:
+        """Re-read the given meals from the database into a loaded index."""
+        meal_ids = list(meal_ids)
+        if not meal_ids or not self.is_loaded:
+            return
+        rows = {row["id"]: row for row in catalog_rows(meal_ids)}
+        with self._lock:
+            if self._columns is None:
+                return
+            columns = self._columns.copy()
+            for meal_id in meal_ids:
+                row = rows.get(meal_id)
+                if row is None:
+                    columns.remove(meal_id)
+                else:
+                    columns.upsert(row)
+            self._columns = columns
+
+    def refresh_restaurant(self, restaurant_id: int) -> None:
+        if not self.is_loaded:
+            return
+        meal_ids = Meal.objects.filter(restaurant_id=restaurant_id).values_list("pk", flat=True)
+        self.refresh_meals(meal_ids)
+
+    def remove_meal(self, meal_id: int) -> None:
+        with self._lock:
+            if self._columns is not None:
+                columns = self._columns.copy()
+                columns.remove(meal_id)
+                self._columns = columns
+
+    def adjust_favorites(self, meal_id: int, delta: int) -> None:
+        with self._lock:
+            if self._columns is None:
+                return
+            pos = self._columns.position(meal_id)
+            if pos is not None:
+                columns = self._columns.copy(("favorite_count",))
+                columns.favorite_count[pos] = max(0, int(columns.favorite_count[pos]) + delta)
+                self._columns = columns
+
+
+catalog_index = MealCatalogIndex()
+
+
+class SharedPoolCache:
+    """Process-wide bounded candidate pool (see ``RecommendationEngine.shared_pool``).
+
+    The pool is rebuilt when its ``key`` (the versions of the rankings it is
+    made of) changes or it is older than ``max_age`` seconds, so section
+    requests and slate batches in one process share a single set of rows.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._columns: Optional[CatalogColumns] = None
+        self._key: Optional[Hashable] = None
+        self._loaded_at = 0.0
+
+    def columns(self, key: Hashable, load: Callable[[], CatalogColumns], max_age: float) -> CatalogColumns:
+        """The pool for ``key``, calling ``load()`` on a miss (no reuse when ``max_age`` is 0)."""
+        if max_age <= 0:
+            return load()
+        with self._lock:
+            expired = time.monotonic() - self._loaded_at > max_age
+            if self._columns is None or self._key != key or expired:
+                self._columns = load()
+                self._key = key
+                self._loaded_at = time.monotonic()
+            return self._columns
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._columns = None
+
+
+shared_pool_cache = SharedPoolCache()
+
+
+def catalog_index_enabled() -> bool:
+    return bool(getattr(settings, "RECOMMENDATION_CATALOG_INDEX", False))
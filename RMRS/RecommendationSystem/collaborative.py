@@ -0,0 +1,228 @@
+"""Offline collaborative filtering: implicit-feedback ALS over user×meal interactions.
+
+Training runs in batch (see the ``train_collaborative_filter`` command) and
+writes each user's top-N meal ids to :class:`PersonalizedRecommendation`, so
+serving personalized picks is a single indexed read.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.db.models import Count
+from django.utils import timezone
+from scipy import sparse
+
+from MerchantSideApp.models import Meal
+from UserSideApp.models import DailyMealRecord, Favorite, Review
+
+from .models import PersonalizedRecommendation, RecommendationHistory
+
+
+FAVORITE_WEIGHT = 4.0
+SELECTION_WEIGHT = 2.0
+MEAL_RECORD_WEIGHT = 1.0
+# Reviews of 3 stars and up count as positive feedback; lower ratings are ignored.
+REVIEW_NEUTRAL_RATING = 2
+
+
+@dataclass
+class InteractionMatrix:
+    matrix: sparse.csr_matrix
+    user_ids: np.ndarray
+    meal_ids: np.ndarray
+
+
+@dataclass
+class FactorModel:
+    user_factors: np.ndarray
+    item_factors: np.ndarray
+
+
+def _interaction_rows() -> Iterable[Tuple[int, int, float]]:
+    """Yield ``(user_id, meal_id, weight)`` triples from every feedback source."""
+    for user_id, meal_id in Favorite.objects.values_list("user_id", "meal_id").iterator():
+        yield user_id, meal_id, FAVORITE_WEIGHT
+    reviews = Review.objects.filter(rating__gt=REVIEW_NEUTRAL_RATING).values_list(
+        "user_id", "meal_id", "rating"
+    )
+    for user_id, meal_id, rating in reviews.iterator():
+        yield user_id, meal_id, float(rating - REVIEW_NEUTRAL_RATING)
+    selections = (
+        RecommendationHistory.objects.filter(was_selected=True, user__isnull=False)
+        .values("user_id", "meal_id")
+        .annotate(total=Count("pk"))
+        .values_list("user_id", "meal_id", "total")
+    )
+    for user_id, meal_id, total in selections.iterator():
+        yield user_id, meal_id, SELECTION_WEIGHT * float(np.log1p(total))
+    records = (
+        DailyMealRecord.objects.filter(source_meal__isnull=False)
+        .values("user_id", "source_meal_id")
+        .annotate(total=Count("pk"))
+        .values_list("user_id", "source_meal_id", "total")
+    )
+    for user_id, meal_id, total in records.iterator():
+        yield user_id, meal_id, MEAL_RECORD_WEIGHT * float(np.log1p(total))
+
+
+def build_interaction_matrix(rows: Optional[Iterable[Tuple[int, int, float]]] = None) -> InteractionMatrix:
+    """Assemble a CSR user×meal matrix; duplicate pairs are summed."""
+    users: List[int] = []
+    meals: List[int] = []
+    weights: List[float] = []
+    for user_id, meal_id, weight in rows if rows is not None else _interaction_rows():
+        users.append(user_id)
+        meals.append(meal_id)
+        weights.append(weight)
+    user_ids, user_index = np.unique(np.array(users, dtype=np.int64), return_inverse=True)
+    meal_ids, meal_index = np.unique(np.array(meals, dtype=np.int64), return_inverse=True)
+    matrix = sparse.coo_matrix(
+        (np.array(weights, dtype=np.float32), (user_index, meal_index)),
+        shape=(user_ids.size, meal_ids.size),
+    ).tocsr()
+    matrix.sum_duplicates()
+    return InteractionMatrix(matrix, user_ids, meal_ids)
+
+
+def _als_step(
+    confidence: sparse.csr_matrix,
+    fixed: np.ndarray,
+    regularization: float,
+) -> np.ndarray:
+    """Solve every row's factors against ``fixed`` (Hu, Koren & Volinsky, 2008).
+
+    For row ``u`` with observed columns ``I``: ``(YᵀY + Y_Iᵀ (C_I - 1) Y_I + λI) x_u
+    = Y_Iᵀ C_I``. ``YᵀY`` is shared across rows, so each solve only touches
+    the row's non-zeros.
+    """
+    factors = fixed.shape[1]
+    gram = fixed.T @ fixed + regularization * np.eye(factors, dtype=np.float64)
+    solved = np.zeros((confidence.shape[0], factors), dtype=np.float64)
+    indptr, indices, data = confidence.indptr, confidence.indices, confidence.data
+    for row in range(confidence.shape[0]):
+        start, end = indptr[row], indptr[row + 1]
+        if start == end:
+            continue
+        observed = fixed[indices[start:end]]
+        conf = data[start:end]
+        lhs = gram + (observed.T * (conf - 1.0)) @ observed
+        rhs = observed.T @ conf
+        solved[row] = np.linalg.solve(lhs, rhs)
+    return solved
+
+
+def train_als(
+    interactions: InteractionMatrix,
+    factors: int = 32,
+    regularization: float = 0.1,
+    alpha: float = 10.0,
+    iterations: int = 10,
+    seed: Optional[int] = None,
+) -> FactorModel:
+    """Alternating least squares for implicit feedback."""
+    rng = np.random.default_rng(seed)
+    n_users, n_items = interactions.matrix.shape
+    confidence = interactions.matrix.astype(np.float64)
+    confidence.data = 1.0 + alpha * confidence.data
+    confidence_t = confidence.T.tocsr()
+    user_factors = rng.normal(scale=0.01, size=(n_users, factors))
+    item_factors = rng.normal(scale=0.01, size=(n_items, factors))
+    for _ in range(iterations):
+        user_factors = _als_step(confidence, item_factors, regularization)
+        item_factors = _als_step(confidence_t, user_factors, regularization)
+    return FactorModel(user_factors.astype(np.float32), item_factors.astype(np.float32))
+
+
+def top_n(
+    interactions: InteractionMatrix,
+    model: FactorModel,
+    n: int,
+    candidate_meal_ids: Optional[Iterable[int]] = None,
+    batch_size: int = 512,
+    exclude_seen: bool = True,
+) -> Dict[int, Tuple[List[int], List[float]]]:
+    """Score every user against candidate meals in batches and keep the best ``n``."""
+    candidates = np.ones(interactions.meal_ids.size, dtype=bool)
+    if candidate_meal_ids is not None:
+        allowed = np.fromiter(candidate_meal_ids, dtype=np.int64)
+        candidates = np.isin(interactions.meal_ids, allowed)
+    results: Dict[int, Tuple[List[int], List[float]]] = {}
+    if not candidates.any() or n <= 0:
+        return results
+    k = min(n, int(candidates.sum()))
+    for start in range(0, interactions.user_ids.size, batch_size):
+        stop = min(start + batch_size, interactions.user_ids.size)
+        scores = model.user_factors[start:stop] @ model.item_factors.T
+        scores[:, ~candidates] = -np.inf
+        if exclude_seen:
+            seen = interactions.matrix[start:stop].tocoo()
+            scores[seen.row, seen.col] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        for offset in range(stop - start):
+            keep = np.isfinite(top_scores[offset])
+            results[int(interactions.user_ids[start + offset])] = (
+                interactions.meal_ids[top[offset][keep]].tolist(),
+                [round(float(score), 4) for score in top_scores[offset][keep]],
+            )
+    return results
+
+
+def store_recommendations(
+    rankings: Dict[int, Tuple[List[int], List[float]]],
+    model_version: str,
+    batch_size: int = 500,
+) -> int:
+    """Upsert each user's ranked meal ids and drop rows for users no longer ranked."""
+    now = timezone.now()
+    rows = [
+        PersonalizedRecommendation(
+            user_id=user_id,
+            meal_ids=meal_ids,
+            scores=scores,
+            model_version=model_version,
+            generated_at=now,
+        )
+        for user_id, (meal_ids, scores) in rankings.items()
+    ]
+    PersonalizedRecommendation.objects.bulk_create(
+        rows,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=["meal_ids", "scores", "model_version", "generated_at"],
+    )
+    PersonalizedRecommendation.objects.exclude(model_version=model_version).delete()
+    return len(rows)
+
+
+def train_and_store(
+    top_n_count: int = 50,
+    factors: int = 32,
+    regularization: float = 0.1,
+    alpha: float = 10.0,
+    iterations: int = 10,
+    seed: Optional[int] = None,
+) -> Tuple[InteractionMatrix, int]:
+    """Full batch run: build the matrix, train, rank recommendable meals, persist."""
+    interactions = build_interaction_matrix()
+    if not interactions.matrix.nnz:
+        return interactions, 0
+    model = train_als(
+        interactions,
+        factors=factors,
+        regularization=regularization,
+        alpha=alpha,
+        iterations=iterations,
+        seed=seed,
+    )
+    recommendable = Meal.objects.filter(is_recommendable=True).values_list("pk", flat=True)
+    rankings = top_n(interactions, model, top_n_count, candidate_meal_ids=recommendable)
+    version = f"als-{timezone.now():%Y%m%d%H%M%S}"
+    return interactions, store_recommendations(rankings, version)
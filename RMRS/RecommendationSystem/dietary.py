@@ -0,0 +1,214 @@
+"""Bitset inverted index over meal tags, plus the allergen exclusion.
+
+Every tag maps to the set of meals carrying it, stored as a Python ``int``
+whose bit *n* stands for meal id *n*. ``include_tags`` resolves to the
+intersection of the requested tags' bitsets, so a tag filter costs a few
+integer ``&`` operations instead of a join per tag. The result is applied
+either as a vectorized lookup against catalog columns or as one ``id IN``
+condition.
+
+``exclude_allergens`` is a safety filter and is not served from these
+process-local postings, which another process's writes only reach after
+``max_age``: it is resolved against ``MealAllergen`` in SQL every time,
+as a ``NOT IN`` subquery or, for catalog columns, one id query.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+
+from MerchantSideApp import taxonomy
+from MerchantSideApp.models import MealAllergen, MealTag, Tag
+
+
+def to_bitset(meal_ids: Iterable[int]) -> int:
+    ids = np.fromiter(meal_ids, dtype=np.int64)
+    if not ids.size:
+        return 0
+    bits = np.zeros(int(ids.max()) + 1, dtype=bool)
+    bits[ids] = True
+    return int.from_bytes(np.packbits(bits, bitorder="little").tobytes(), "little")
+
+
+def _unpack(bitset: int) -> np.ndarray:
+    raw = bitset.to_bytes((bitset.bit_length() + 7) // 8, "little")
+    return np.unpackbits(np.frombuffer(raw, dtype=np.uint8), bitorder="little").astype(bool)
+
+
+def bitset_ids(bitset: int) -> np.ndarray:
+    """Meal ids set in ``bitset``, ascending."""
+    return np.flatnonzero(_unpack(bitset)).astype(np.int64)
+
+
+def bitset_contains(bitset: int, meal_ids: np.ndarray) -> np.ndarray:
+    """Boolean array: which of ``meal_ids`` are set in ``bitset``."""
+    bits = _unpack(bitset)
+    result = np.zeros(meal_ids.shape, dtype=bool)
+    inside = (meal_ids >= 0) & (meal_ids < bits.size)
+    result[inside] = bits[meal_ids[inside]]
+    return result
+
+
+def allergen_meals(names: Sequence[str]):
+    """``meal_id`` values query of meals containing any allergen in ``names``.
+
+    Names are matched on the stored ``key`` in SQL; only aliases go through
+    the cached taxonomy table.
+    """
+    keys = {taxonomy.normalize(name) for name in names} - {""}
+    alias_ids = {term_id for name in names for term_id in taxonomy.allergen_ids(name)}
+    return MealAllergen.objects.filter(Q(allergen__key__in=keys) | Q(allergen__in=alias_ids)).values("meal_id")
+
+
+@dataclass(frozen=True)
+class DietarySelection:
+    """Meals a dietary filter keeps: all of ``include`` (when set) minus meals with ``allergens``."""
+
+    include: Optional[int]
+    allergens: Tuple[str, ...] = ()
+
+    def mask(self, meal_ids: np.ndarray) -> np.ndarray:
+        keep = np.ones(meal_ids.shape, dtype=bool)
+        if self.include is not None:
+            keep &= bitset_contains(self.include, meal_ids)
+        if self.allergens:
+            excluded = np.fromiter(
+                allergen_meals(self.allergens).values_list("meal_id", flat=True), dtype=np.int64
+            )
+            keep &= ~np.isin(meal_ids, excluded)
+        return keep
+
+    def apply(self, queryset):
+        if self.include is not None:
+            queryset = queryset.filter(pk__in=bitset_ids(self.include).tolist())
+        if self.allergens:
+            queryset = queryset.exclude(pk__in=allergen_meals(self.allergens))
+        return queryset
+
+
+class DietaryPostings:
+    """``{tag id: bitset}`` plus tag name keys."""
+
+    def __init__(self):
+        self.tags: Dict[int, int] = {}
+        self.tag_keys: Dict[str, List[int]] = {}
+
+    @staticmethod
+    def _postings(rows: Iterable[Tuple[int, int]]) -> Dict[int, int]:
+        grouped: Dict[int, List[int]] = {}
+        for meal_id, term_id in rows:
+            grouped.setdefault(term_id, []).append(meal_id)
+        return {term_id: to_bitset(meal_ids) for term_id, meal_ids in grouped.items()}
+
+    def load(self, tag_rows, tag_names) -> None:
+        self.tags = self._postings(tag_rows)
+        self.tag_keys = {}
+        for tag_id, name in tag_names:
+            self.tag_keys.setdefault(taxonomy.normalize(name), []).append(tag_id)
+
+    def copy(self) -> "DietaryPostings":
+        clone = DietaryPostings()
+        clone.tags = dict(self.tags)
+        clone.tag_keys = self.tag_keys
+        return clone
+
+    def replace_meals(self, meal_ids: Sequence[int], tag_rows) -> None:
+        """Clear ``meal_ids`` from every posting, then set the given rows."""
+        cleared = ~to_bitset(meal_ids)
+        for tag_id in list(self.tags):
+            self.tags[tag_id] &= cleared
+        for tag_id, bitset in self._postings(tag_rows).items():
+            self.tags[tag_id] = self.tags.get(tag_id, 0) | bitset
+
+    def _union(self, postings: Dict[int, int], term_ids: Iterable[int]) -> int:
+        bitset = 0
+        for term_id in term_ids:
+            bitset |= postings.get(term_id, 0)
+        return bitset
+
+    def select(self, include_tags: Sequence[str], exclude_allergens: Sequence[str]) -> DietarySelection:
+        include = None
+        for name in include_tags:
+            tagged = self._union(self.tags, self.tag_keys.get(taxonomy.normalize(name), ()))
+            include = tagged if include is None else include & tagged
+        return DietarySelection(include=include, allergens=tuple(exclude_allergens))
+
+
+def _tag_rows(meal_ids: Optional[Sequence[int]] = None):
+    qs = MealTag.objects.all()
+    if meal_ids is not None:
+        qs = qs.filter(meal_id__in=list(meal_ids))
+    return qs.values_list("meal_id", "tag_id")
+
+
+class DietaryIndex:
+    """Process-wide postings with lazy loading and incremental updates."""
+
+    def __init__(self, max_age: Optional[float] = None):
+        self._lock = threading.RLock()
+        self._postings: Optional[DietaryPostings] = None
+        self._loaded_at = 0.0
+        self._max_age = max_age
+
+    @property
+    def max_age(self) -> float:
+        if self._max_age is not None:
+            return self._max_age
+        return float(getattr(settings, "RECOMMENDATION_CATALOG_MAX_AGE", 300))
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._postings is not None
+
+    def postings(self) -> DietaryPostings:
+        with self._lock:
+            expired = self.max_age and time.monotonic() - self._loaded_at > self.max_age
+            if self._postings is None or expired:
+                self.reload()
+            return self._postings
+
+    def reload(self) -> None:
+        postings = DietaryPostings()
+        postings.load(_tag_rows(), Tag.objects.values_list("pk", "name"))
+        with self._lock:
+            self._postings = postings
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._postings = None
+
+    def refresh_meals(self, meal_ids: Iterable[int]) -> None:
+        """Re-read the given meals' tags into loaded postings."""
+        meal_ids = list(meal_ids)
+        if not meal_ids or not self.is_loaded:
+            return
+        tag_rows = list(_tag_rows(meal_ids))
+        with self._lock:
+            if self._postings is None:
+                return
+            postings = self._postings.copy()
+            postings.replace_meals(meal_ids, tag_rows)
+            self._postings = postings
+
+    def selection(
+        self,
+        include_tags: Sequence[str] = (),
+        exclude_allergens: Sequence[str] = (),
+    ) -> Optional[DietarySelection]:
+        """The meals ``include_tags``/``exclude_allergens`` keep, or None when both are empty."""
+        if not include_tags and not exclude_allergens:
+            return None
+        if not include_tags:
+            return DietarySelection(include=None, allergens=tuple(exclude_allergens))
+        return self.postings().select(include_tags, exclude_allergens)
+
+
+dietary_index = DietaryIndex()
@@ -0,0 +1,159 @@
+"""Per-user exclusion sets (cooldown selections and seen meals) cached as packed arrays.
+
+Each user's sets are stored in Django's cache as sorted ``int32`` id arrays
+(plus the last-selected timestamp per id) under a versioned key. Selections
+are kept for the widest cooldown window so the user's own cooldown is
+applied at read time; any write that changes the sets bumps the version.
+
+Caching needs a shared backend: an invalidation only reaches the process
+that made it, so with a per-process cache (the local-memory default) the
+sets are read from the database on every call instead.
+"""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import partial
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from UserSideApp.models import Favorite, Review
+
+from .models import RecommendationHistory
+from .result_cache import shared_cache_enabled
+from .services import MAX_COOLDOWN_DAYS, get_recommendation_cooldown_days
+
+
+ID_DTYPE = np.int32
+TIMESTAMP_DTYPE = np.int64
+VERSION_KEY = "recommendation:exclusions:version:{user_id}"
+DATA_KEY = "recommendation:exclusions:{user_id}:{version}"
+
+
+def _cache():
+    return caches[getattr(settings, "RECOMMENDATION_CACHE", "default")]
+
+
+def _ttl() -> int:
+    return int(getattr(settings, "RECOMMENDATION_EXCLUSION_TTL", 300))
+
+
+def _timestamp(value) -> int:
+    return int(value.timestamp())
+
+
+@dataclass(frozen=True)
+class UserExclusions:
+    selected_ids: np.ndarray
+    selected_at: np.ndarray
+    seen_ids: np.ndarray
+
+    @classmethod
+    def empty(cls) -> "UserExclusions":
+        return cls(
+            np.empty(0, dtype=ID_DTYPE),
+            np.empty(0, dtype=TIMESTAMP_DTYPE),
+            np.empty(0, dtype=ID_DTYPE),
+        )
+
+    def cooldown_ids(self, days: int) -> np.ndarray:
+        """Meals selected within the last ``days`` days, sorted."""
+        cutoff = _timestamp(timezone.now() - timedelta(days=days))
+        return self.selected_ids[self.selected_at >= cutoff]
+
+    def pack(self) -> tuple[bytes, bytes, bytes]:
+        return (
+            self.selected_ids.astype(ID_DTYPE).tobytes(),
+            self.selected_at.astype(TIMESTAMP_DTYPE).tobytes(),
+            self.seen_ids.astype(ID_DTYPE).tobytes(),
+        )
+
+    @classmethod
+    def unpack(cls, packed) -> "UserExclusions":
+        selected, selected_at, seen = packed
+        return cls(
+            np.frombuffer(selected, dtype=ID_DTYPE),
+            np.frombuffer(selected_at, dtype=TIMESTAMP_DTYPE),
+            np.frombuffer(seen, dtype=ID_DTYPE),
+        )
+
+
+def load_user_exclusions(user_id: int) -> UserExclusions:
+    """Read both sets from the database: one grouped query and one union."""
+    cutoff = timezone.now() - timedelta(days=MAX_COOLDOWN_DAYS)
+    selections = (
+        RecommendationHistory.objects.filter(
+            user_id=user_id,
+            was_selected=True,
+            recommended_at__gte=cutoff,
+        )
+        .order_by("meal_id")
+        .values("meal_id")
+        .annotate(last_selected=Max("recommended_at"))
+        .values_list("meal_id", "last_selected")
+    )
+    selected_ids = []
+    selected_at = []
+    for meal_id, last_selected in selections:
+        selected_ids.append(meal_id)
+        selected_at.append(_timestamp(last_selected))
+    favorites = Favorite.objects.filter(user_id=user_id).values_list("meal_id", flat=True)
+    reviews = Review.objects.filter(user_id=user_id).values_list("meal_id", flat=True)
+    seen = np.unique(np.fromiter(favorites.union(reviews), dtype=ID_DTYPE))
+    return UserExclusions(
+        np.array(selected_ids, dtype=ID_DTYPE),
+        np.array(selected_at, dtype=TIMESTAMP_DTYPE),
+        seen,
+    )
+
+
+def get_user_exclusions(user) -> UserExclusions:
+    """Return the user's exclusion sets, served from a shared cache when fresh."""
+    user_id = getattr(user, "pk", None)
+    if not user_id:
+        return UserExclusions.empty()
+    if not shared_cache_enabled():
+        return load_user_exclusions(user_id)
+    cache = _cache()
+    version = cache.get(VERSION_KEY.format(user_id=user_id))
+    if version is None:
+        version = _bump_version(user_id)
+    key = DATA_KEY.format(user_id=user_id, version=version)
+    packed = cache.get(key)
+    if packed is not None:
+        return UserExclusions.unpack(packed)
+    exclusions = load_user_exclusions(user_id)
+    cache.set(key, exclusions.pack(), _ttl())
+    return exclusions
+
+
+def cooldown_meal_ids(user) -> np.ndarray:
+    """Sorted ids still inside the user's recommendation cooldown."""
+    if not getattr(user, "pk", None):
+        return np.empty(0, dtype=ID_DTYPE)
+    return get_user_exclusions(user).cooldown_ids(get_recommendation_cooldown_days(user))
+
+
+def _bump_version(user_id: int) -> int:
+    version = time.time_ns()
+    _cache().set(VERSION_KEY.format(user_id=user_id), version, None)
+    return version
+
+
+def invalidate_user_exclusions(user_id) -> None:
+    """Drop the cached sets now and again once the surrounding transaction commits.
+
+    The second bump stops a concurrent reader from re-caching rows it read
+    before the write became visible.
+    """
+    if not user_id:
+        return
+    _bump_version(user_id)
+    transaction.on_commit(partial(_bump_version, user_id))
@@ -0,0 +1,345 @@
+"""Keyword search over restaurants and meals.
+
+On MySQL 5.7.6+, the ``restaurants`` (name, address, cuisine_type) and
+``meals`` (name, description) columns carry FULLTEXT indexes built with the
+ngram parser (migration ``0016_fulltext``). MariaDB has no ngram parser, so
+it gets no index and uses the in-process index below. A keyword becomes a boolean-mode
+phrase ``MATCH ... AGAINST``, and InnoDB ranks the hits by relevance.
+Runs shorter than the ngram token size have no ngram to match, so they
+are checked with ``LIKE`` instead.
+
+Other backends (SQLite in tests and development) use an in-process
+inverted index instead. Text is folded with NFKC and casefold and split
+into runs of letters and digits. Each run is indexed as character bigrams,
+plus unigrams so that one-character queries still work. A document matches
+when it holds every query bigram and each query run appears verbatim, which
+is what ``icontains`` used to check. Matches are ranked by BM25.
+Restaurant and meal saves update the index incrementally (see
+``signals``).
+
+Either way a restaurant also matches through its meals' text and a meal
+through its restaurant's, as the ``icontains`` search did. On MySQL the
+two id sets are combined with ``UNION`` in one ``IN`` subquery, which
+keeps both sides on their FULLTEXT index instead of an ``OR`` that scans.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from MerchantSideApp.models import Meal, Restaurant
+
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Matches beyond this many (best first) are still returned, unranked.
+RANK_DEPTH = 500
+# Score share a document gets from matching through the other kind.
+RELATED_WEIGHT = 0.5
+# The server's ngram_token_size; shorter query runs are matched with LIKE.
+NGRAM_TOKEN_SIZE = 2
+
+DOCUMENT_FIELDS = {
+    "restaurant": ("name", "address", "cuisine_type"),
+    "meal": ("name", "description"),
+}
+MODELS = {"restaurant": Restaurant, "meal": Meal}
+TABLES = {"restaurant": "restaurants", "meal": "meals"}
+
+
+def has_ngram_fulltext() -> bool:
+    """Whether the database is a MySQL server with the ngram FULLTEXT parser (``0016_fulltext``)."""
+    return (
+        connection.vendor == "mysql"
+        and not connection.mysql_is_mariadb
+        and connection.mysql_version >= (5, 7, 6)
+    )
+
+
+def search_backend() -> str:
+    """``"mysql"`` (FULLTEXT), ``"index"`` (in-process) or ``"like"`` (``icontains``)."""
+    backend = str(getattr(settings, "RECOMMENDATION_SEARCH_BACKEND", "auto")).lower()
+    if backend == "auto":
+        return "mysql" if has_ngram_fulltext() else "index"
+    return backend
+
+
+def runs(text: Optional[str]) -> List[str]:
+    """Folded runs of letters and digits in ``text``."""
+    if not text:
+        return []
+    folded = unicodedata.normalize("NFKC", str(text)).casefold()
+    pieces = []
+    current = []
+    for char in folded:
+        if unicodedata.category(char)[0] in "LN":
+            current.append(char)
+        elif current:
+            pieces.append("".join(current))
+            current = []
+    if current:
+        pieces.append("".join(current))
+    return pieces
+
+
+def tokens(text: Optional[str], unigrams: bool = True) -> List[str]:
+    """Bigrams of every run (and, with ``unigrams``, every single character)."""
+    result = []
+    for run in runs(text):
+        result.extend(run[i:i + 2] for i in range(len(run) - 1))
+        if unigrams or len(run) == 1:
+            result.extend(run)
+    return result
+
+
+def query_tokens(keyword: str) -> List[str]:
+    """Distinct tokens a document must contain to match ``keyword``."""
+    return sorted(set(tokens(keyword, unigrams=False)))
+
+
+class TextIndex:
+    """Inverted index of one document kind with BM25 scoring."""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.lengths: Dict[int, int] = {}
+        self.texts: Dict[int, str] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def upsert(self, doc_id: int, text: str) -> None:
+        self.remove(doc_id)
+        terms = Counter(tokens(text))
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+        length = sum(terms.values())
+        self.lengths[doc_id] = length
+        self.texts[doc_id] = " ".join(runs(text))
+        self.total_length += length
+
+    def remove(self, doc_id: int) -> None:
+        text = self.texts.pop(doc_id, None)
+        if text is None:
+            return
+        self.total_length -= self.lengths.pop(doc_id)
+        for term in set(tokens(text)):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+
+    def search(self, keyword: str) -> Dict[int, float]:
+        """``{doc id: BM25 score}`` for documents containing every run of ``keyword``."""
+        terms = query_tokens(keyword)
+        needles = runs(keyword)
+        if not terms or not self.lengths:
+            return {}
+        postings = [self.postings.get(term, {}) for term in terms]
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for docs in postings[1:]:
+            candidates.intersection_update(docs)
+            if not candidates:
+                return {}
+        count = len(self.lengths)
+        average = self.total_length / count
+        scores = {}
+        for doc_id in candidates:
+            text = self.texts[doc_id]
+            if not all(needle in text for needle in needles):
+                continue
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc_id] / average)
+            score = 0.0
+            for docs in postings:
+                frequency = docs[doc_id]
+                idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+                score += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+            scores[doc_id] = score
+        return scores
+
+
+def _document(row: tuple) -> str:
+    return " ".join(value for value in row if value)
+
+
+def document_rows(kind: str, ids: Optional[Iterable[int]] = None):
+    """``(id, text)`` per row of ``kind``."""
+    qs = MODELS[kind].objects.all()
+    if ids is not None:
+        qs = qs.filter(pk__in=list(ids))
+    for doc_id, *values in qs.values_list("pk", *DOCUMENT_FIELDS[kind]).iterator(chunk_size=2000):
+        yield doc_id, _document(values)
+
+
+class SearchIndex:
+    """Process-wide restaurant and meal text indexes with lazy loading and incremental updates."""
+
+    def __init__(self, max_age: Optional[float] = None):
+        self._lock = threading.RLock()
+        self._indexes: Optional[Dict[str, TextIndex]] = None
+        self._meal_restaurant: Dict[int, int] = {}
+        self._loaded_at = 0.0
+        self._max_age = max_age
+
+    @property
+    def max_age(self) -> float:
+        if self._max_age is not None:
+            return self._max_age
+        return float(getattr(settings, "RECOMMENDATION_SEARCH_INDEX_MAX_AGE", 3600))
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._indexes is not None
+
+    def _loaded(self) -> Dict[str, TextIndex]:
+        expired = self.max_age and time.monotonic() - self._loaded_at > self.max_age
+        if self._indexes is None or expired:
+            self.reload()
+        return self._indexes
+
+    def reload(self) -> None:
+        indexes = {kind: TextIndex() for kind in DOCUMENT_FIELDS}
+        for kind, index in indexes.items():
+            for doc_id, text in document_rows(kind):
+                index.upsert(doc_id, text)
+        meal_restaurant = dict(Meal.objects.values_list("pk", "restaurant_id"))
+        with self._lock:
+            self._indexes = indexes
+            self._meal_restaurant = meal_restaurant
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._indexes = None
+
+    def refresh(self, kind: str, ids: Iterable[int]) -> None:
+        """Re-read the given rows of ``kind`` into a loaded index."""
+        ids = list(ids)
+        if not ids or not self.is_loaded:
+            return
+        rows = dict(document_rows(kind, ids))
+        owners = dict(Meal.objects.filter(pk__in=ids).values_list("pk", "restaurant_id")) if kind == "meal" else {}
+        with self._lock:
+            if self._indexes is None:
+                return
+            index = self._indexes[kind]
+            for doc_id in ids:
+                if doc_id in rows:
+                    index.upsert(doc_id, rows[doc_id])
+                else:
+                    index.remove(doc_id)
+                if kind == "meal":
+                    if doc_id in owners:
+                        self._meal_restaurant[doc_id] = owners[doc_id]
+                    else:
+                        self._meal_restaurant.pop(doc_id, None)
+
+    def scores(self, kind: str, keyword: str) -> Dict[int, float]:
+        """Relevance of every ``kind`` row matching ``keyword`` directly or through the other kind."""
+        with self._lock:
+            indexes = self._loaded()
+            restaurants = indexes["restaurant"].search(keyword)
+            meals = indexes["meal"].search(keyword)
+            owners = self._meal_restaurant
+            if kind == "meal":
+                scores = dict(meals)
+                if restaurants:
+                    for meal_id, restaurant_id in owners.items():
+                        if restaurant_id in restaurants:
+                            related = RELATED_WEIGHT * restaurants[restaurant_id]
+                            scores[meal_id] = scores.get(meal_id, 0.0) + related
+                return scores
+            scores = dict(restaurants)
+            for meal_id, score in meals.items():
+                restaurant_id = owners.get(meal_id)
+                if restaurant_id is not None:
+                    best = max(scores.get(restaurant_id, 0.0), restaurants.get(restaurant_id, 0.0) + RELATED_WEIGHT * score)
+                    scores[restaurant_id] = best
+            return scores
+
+
+search_index = SearchIndex()
+
+
+def _phrase(keyword: str) -> str:
+    """Boolean-mode query requiring every ngram-sized run of ``keyword`` as a phrase."""
+    return " ".join(f'+"{run}"' for run in runs(keyword) if len(run) >= NGRAM_TOKEN_SIZE)
+
+
+def _match(kind: str, phrase: str, qualified: bool) -> RawSQL:
+    quote = connection.ops.quote_name
+    prefix = f"{quote(TABLES[kind])}." if qualified else ""
+    columns = ", ".join(f"{prefix}{quote(column)}" for column in DOCUMENT_FIELDS[kind])
+    return RawSQL(f"MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)", [phrase], output_field=FloatField())
+
+
+def _like(kind: str, keyword: str) -> Q:
+    """The ``icontains`` predicates keyword search used before the full-text index."""
+    if kind == "restaurant":
+        return (
+            Q(name__icontains=keyword)
+            | Q(address__icontains=keyword)
+            | Q(cuisine_type__icontains=keyword)
+            | Q(pk__in=Meal.objects.filter(Q(name__icontains=keyword) | Q(description__icontains=keyword)).values("restaurant_id"))
+        )
+    return Q(name__icontains=keyword) | Q(description__icontains=keyword) | Q(restaurant__name__icontains=keyword)
+
+
+def _matches(kind: str, keyword: str):
+    """``kind`` rows whose own text matches ``keyword`` (MySQL backend)."""
+    queryset = MODELS[kind].objects.order_by()
+    phrase = _phrase(keyword)
+    if phrase:
+        queryset = queryset.annotate(match=_match(kind, phrase, qualified=False)).filter(match__gt=0)
+    for run in runs(keyword):
+        if len(run) < NGRAM_TOKEN_SIZE:
+            contains = Q()
+            for column in DOCUMENT_FIELDS[kind]:
+                contains |= Q(**{f"{column}__icontains": run})
+            queryset = queryset.filter(contains)
+    return queryset
+
+
+def keyword_search(queryset, kind: str, keyword: str):
+    """``queryset`` narrowed to rows matching ``keyword``, annotated with ``search_relevance``.
+
+    Order by ``-search_relevance`` for best matches first.
+    """
+    backend = search_backend()
+    if not runs(keyword):
+        return queryset.none().annotate(search_relevance=Value(0.0, output_field=FloatField()))
+    if backend == "mysql":
+        if kind == "restaurant":
+            related = _matches("meal", keyword).values("restaurant_id")
+        else:
+            restaurants = _matches("restaurant", keyword).values("pk")
+            related = Meal.objects.order_by().filter(restaurant__in=restaurants).values("pk")
+        matched = _matches(kind, keyword).values("pk").union(related)
+        phrase = _phrase(keyword)
+        relevance = _match(kind, phrase, qualified=True) if phrase else Value(0.0, output_field=FloatField())
+        return queryset.filter(pk__in=matched).annotate(search_relevance=relevance)
+    if backend == "like":
+        return queryset.filter(_like(kind, keyword)).annotate(
+            search_relevance=Value(0.0, output_field=FloatField())
+        )
+    scores = search_index.scores(kind, keyword)
+    ranked = sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+    relevance = Case(
+        *(When(pk=doc_id, then=Value(scores[doc_id])) for doc_id in ranked[:RANK_DEPTH]),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return queryset.filter(pk__in=ranked).annotate(search_relevance=relevance)
@@ -0,0 +1,150 @@
+"""Write-behind logging of recommendation impressions.
+
+Cards shown to a user are queued in memory and written to
+``RecommendationHistory`` (``was_selected=False``) with ``bulk_create`` by a
+background thread once the queue reaches ``flush_size`` rows or
+``flush_interval`` seconds pass. The queue is bounded; impressions arriving
+while it is full are dropped and counted instead of slowing requests down.
+Pending rows are flushed at interpreter exit.
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+
+from .models import RecommendationHistory
+
+
+logger = logging.getLogger(__name__)
+
+Impression = Tuple[int, int, int]  # (user_id, meal_id, restaurant_id)
+
+
+class ImpressionBuffer:
+    def __init__(
+        self,
+        flush_size: int = 200,
+        flush_interval: float = 5.0,
+        capacity: int = 10_000,
+        background: bool = True,
+    ):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.background = background
+        self.written = 0
+        self.dropped = 0
+        self._pending: List[Impression] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def log(self, user, meals: Iterable) -> int:
+        """Queue one impression per meal; returns how many were accepted."""
+        user_id = getattr(user, "pk", None)
+        if not user_id:
+            return 0
+        rows = [(user_id, meal.pk, meal.restaurant_id) for meal in meals]
+        with self._lock:
+            room = max(0, self.capacity - len(self._pending))
+            accepted = rows[:room]
+            self.dropped += len(rows) - len(accepted)
+            self._pending.extend(accepted)
+            full = len(self._pending) >= self.flush_size
+        if self.background:
+            self._ensure_thread()
+            if full:
+                self._wake.set()
+        return len(accepted)
+
+    def flush(self) -> int:
+        """Write everything queued so far; safe to call from any thread."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                RecommendationHistory.objects.bulk_create(
+                    [
+                        RecommendationHistory(
+                            user_id=user_id,
+                            meal_id=meal_id,
+                            restaurant_id=restaurant_id,
+                            was_selected=False,
+                        )
+                        for user_id, meal_id, restaurant_id in batch
+                    ],
+                    batch_size=self.flush_size,
+                )
+            except DatabaseError:
+                logger.exception("Dropping %d recommendation impressions after a failed flush", len(batch))
+                with self._lock:
+                    self.dropped += len(batch)
+                return 0
+            with self._lock:
+                self.written += len(batch)
+            return len(batch)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"pending": len(self._pending), "written": self.written, "dropped": self.dropped}
+
+    def stop(self) -> None:
+        """Stop the background thread and flush what is left."""
+        self._stopped.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run,
+                name="recommendation-impressions",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+impression_buffer = ImpressionBuffer(
+    flush_size=int(getattr(settings, "RECOMMENDATION_IMPRESSION_FLUSH_SIZE", 200)),
+    flush_interval=float(getattr(settings, "RECOMMENDATION_IMPRESSION_FLUSH_INTERVAL", 5.0)),
+    capacity=int(getattr(settings, "RECOMMENDATION_IMPRESSION_CAPACITY", 10_000)),
+)
+atexit.register(impression_buffer.stop)
+
+
+def impression_logging_enabled() -> bool:
+    return bool(getattr(settings, "RECOMMENDATION_IMPRESSION_LOGGING", False))
+
+
+def log_impressions(user, meals: Iterable) -> int:
+    """Queue impressions for ``meals`` shown to ``user`` when logging is enabled."""
+    if not impression_logging_enabled():
+        return 0
+    return impression_buffer.log(user, meals)
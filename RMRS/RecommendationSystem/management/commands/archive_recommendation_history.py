@@ -0,0 +1,52 @@
+"""Archive recommendation history older than the cooldown window."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from RecommendationSystem.retention import archive_cutoff, archive_history
+from RecommendationSystem.services import MAX_COOLDOWN_DAYS
+
+
+class Command(BaseCommand):
+    help = (
+        "Move recommendation_history rows older than the maximum cooldown window into "
+        "gzip JSON-lines files and the recommendation_daily_stats rollup, deleting them "
+        "in small chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=MAX_COOLDOWN_DAYS,
+            help=f"Archive rows older than this many days (never less than {MAX_COOLDOWN_DAYS}).",
+        )
+        parser.add_argument(
+            "--output-dir",
+            default=getattr(settings, "RECOMMENDATION_ARCHIVE_DIR", None),
+            help="Directory for archive files (defaults to RECOMMENDATION_ARCHIVE_DIR).",
+        )
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--max-chunks", type=int, default=None, help="Stop after this many chunks.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the rows that would move.")
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options["days"])
+        result = archive_history(
+            Path(options["output_dir"]),
+            days=options["days"],
+            chunk_size=max(1, options["chunk_size"]),
+            max_chunks=options["max_chunks"],
+            dry_run=options["dry_run"],
+        )
+        if options["dry_run"]:
+            self.stdout.write(f"{result.archived} row(s) older than {cutoff:%Y-%m-%d %H:%M} would be archived.")
+            return
+        location = f" to {result.path}" if result.path else ""
+        self.stdout.write(
+            self.style.SUCCESS(f"Archived {result.archived} row(s) in {result.chunks} chunk(s){location}.")
+        )
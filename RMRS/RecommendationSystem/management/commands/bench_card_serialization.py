@@ -0,0 +1,115 @@
+"""Benchmark the per-request cost of serializing recommendation cards."""
+
+from __future__ import annotations
+
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+
+from MerchantSideApp.models import Meal, Restaurant
+from UserSideApp import cards as card_serialization
+
+
+def reverse_card(card: dict) -> dict:
+    """Card serialization with one ``reverse()`` per URL, the path the fast one replaced."""
+    meal = card["meal"]
+    restaurant = card["restaurant"]
+    price_label = restaurant.get_price_range_display() if restaurant.price_range else ""
+    return {
+        "meal": {
+            "id": meal.id,
+            "slug": meal.slug,
+            "name": meal.name,
+            "description": meal.description or "",
+            "isVegetarian": bool(meal.is_vegetarian),
+            "isSpicy": bool(meal.is_spicy),
+            "url": reverse("merchantsideapp:meal_detail", args=[meal.slug]),
+        },
+        "restaurant": {
+            "id": restaurant.id,
+            "slug": restaurant.slug,
+            "name": restaurant.name,
+            "cuisineType": restaurant.cuisine_type or "",
+            "priceRange": restaurant.price_range or "",
+            "priceLabel": price_label or "",
+            "city": restaurant.city or "",
+            "district": restaurant.district or "",
+            "url": reverse("merchantsideapp:restaurant_detail", args=[restaurant.slug]),
+        },
+        "favoriteCount": card.get("favorite_count", 0),
+        "reason": card.get("reason") or "",
+    }
+
+
+def sample_cards(count: int) -> list[dict]:
+    """Unsaved meals and restaurants shaped like a real recommendation page."""
+    price_ranges = Restaurant.PriceRange.values
+    cards = []
+    for index in range(count):
+        restaurant = Restaurant(
+            id=index // 4 + 1,
+            name=f"示範餐廳 {index // 4}",
+            slug=f"bench-restaurant-{index // 4}",
+            cuisine_type="台式",
+            price_range=price_ranges[index % len(price_ranges)],
+            city="台北市",
+            district="信義區",
+        )
+        meal = Meal(
+            id=index + 1,
+            restaurant=restaurant,
+            name=f"示範餐點 {index}",
+            slug=f"bench-meal-{index}",
+            description="香煎雞腿佐時蔬與五穀飯",
+            is_vegetarian=index % 4 == 0,
+            is_spicy=index % 5 == 0,
+        )
+        cards.append({"meal": meal, "restaurant": restaurant, "favorite_count": index, "reason": "根據你的偏好"})
+    return cards
+
+
+class Command(BaseCommand):
+    help = (
+        "Time serializing one recommendation payload of --cards cards: per-card reverse() "
+        "with the stdlib encoder, against URL templates with a slotted card DTO under the "
+        "stdlib encoder and (when installed) orjson. Needs no database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cards", type=int, default=30)
+        parser.add_argument("--repeat", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        cards = sample_cards(options["cards"])
+        if [reverse_card(card) for card in cards] != card_serialization.serialize_cards(cards):
+            raise CommandError("Fast card serialization does not match the reverse() output.")
+        strategies = {
+            "reverse": lambda: JsonResponse({"cards": [reverse_card(card) for card in cards]}),
+            "template": lambda: JsonResponse({"cards": card_serialization.serialize_cards(cards)}),
+        }
+        if card_serialization.orjson is not None:
+            orjson = card_serialization.orjson
+            strategies["template+orjson"] = lambda: HttpResponse(
+                orjson.dumps({"cards": card_serialization.serialize_cards(cards)}),
+                content_type="application/json",
+            )
+        self.stdout.write(f"{'strategy':>16} {'median us':>10} {'p95 us':>10}")
+        baseline = None
+        for name, strategy in strategies.items():
+            timings = self._time(strategy, options["repeat"])
+            median = statistics.median(timings)
+            baseline = baseline or median
+            p95 = timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))]
+            self.stdout.write(f"{name:>16} {median:>10.1f} {p95:>10.1f}  ({baseline / median:.1f}x)")
+
+    def _time(self, strategy, repeat: int) -> list[float]:
+        strategy()  # warm-up
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            strategy()
+            timings.append((time.perf_counter() - started) * 1_000_000)
+        return sorted(timings)
@@ -0,0 +1,131 @@
+"""Benchmark random meal sampling strategies on a scratch database."""
+
+from __future__ import annotations
+
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from MerchantSideApp.models import Meal, Restaurant
+from RecommendationSystem.catalog import CatalogColumns, catalog_rows
+from RecommendationSystem.sampling import sample_queryset
+from RecommendationSystem.services import record_user_choice
+from UserSideApp.models import AppUser
+from UserSideApp.services import RecommendationEngine
+
+
+MEALS_PER_RESTAURANT = 20
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare ORDER BY RAND() with id-range probing (and optionally the catalog "
+        "index) for RecommendationEngine.random_meals at several catalog sizes. "
+        "Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000, 1_000_000])
+        parser.add_argument("--limit", type=int, default=6)
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument(
+            "--with-index",
+            action="store_true",
+            help="Also time sampling from the in-memory catalog index (build time excluded).",
+        )
+        parser.add_argument("--keepdb", action="store_true", help="Reuse and keep the scratch database.")
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options["keepdb"]
+        )
+        try:
+            self._run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+
+    def _run(self, options):
+        limit = options["limit"]
+        repeat = options["repeat"]
+        user = AppUser.objects.create(
+            username="bench-user",
+            email="bench@example.com",
+            password_hash="!",
+        )
+        self.stdout.write(f"{'meals':>10} {'strategy':>10} {'median ms':>10} {'p95 ms':>10}")
+        populated = 0
+        for size in sorted(options["sizes"]):
+            populated = self._populate(populated, size)
+            if not user.recommendations.exists():
+                for meal in Meal.objects.order_by("?")[:20]:
+                    record_user_choice(user, meal)
+            engine = RecommendationEngine(user)
+            strategies = {
+                "order_by": lambda: list(engine._base_queryset().order_by("?")[:limit]),
+                "probe": lambda: sample_queryset(engine._base_queryset(), limit),
+            }
+            if options["with_index"]:
+                columns = CatalogColumns()
+                columns.load(catalog_rows())
+                excluded = list(user.recommendations.values_list("meal_id", flat=True))
+                strategies["index"] = lambda: columns.sample(columns.base_mask(excluded), limit)
+            for name, strategy in strategies.items():
+                timings = self._time(strategy, repeat)
+                p95 = timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))]
+                self.stdout.write(
+                    f"{size:>10} {name:>10} {statistics.median(timings):>10.2f} {p95:>10.2f}"
+                )
+
+    def _time(self, strategy, repeat: int) -> list[float]:
+        strategy()  # warm-up
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            strategy()
+            timings.append((time.perf_counter() - started) * 1000)
+        return sorted(timings)
+
+    def _populate(self, start: int, size: int) -> int:
+        """Grow the scratch catalog from ``start`` to ``size`` meals."""
+        price_ranges = Restaurant.PriceRange.values
+        for offset in range(start, size, BATCH_SIZE):
+            batch_end = min(size, offset + BATCH_SIZE)
+            first_restaurant = offset // MEALS_PER_RESTAURANT
+            last_restaurant = (batch_end - 1) // MEALS_PER_RESTAURANT
+            Restaurant.objects.bulk_create(
+                [
+                    Restaurant(
+                        name=f"Bench restaurant {index}",
+                        slug=f"bench-restaurant-{index}",
+                        price_range=price_ranges[index % len(price_ranges)],
+                        rating=(index % 50) / 10,
+                        is_active=index % 25 != 0,
+                    )
+                    for index in range(first_restaurant, last_restaurant + 1)
+                ],
+                ignore_conflicts=True,
+            )
+            restaurant_ids = dict(
+                Restaurant.objects.filter(
+                    slug__in=[f"bench-restaurant-{index}" for index in range(first_restaurant, last_restaurant + 1)]
+                ).values_list("slug", "pk")
+            )
+            Meal.objects.bulk_create(
+                [
+                    Meal(
+                        restaurant_id=restaurant_ids[f"bench-restaurant-{index // MEALS_PER_RESTAURANT}"],
+                        name=f"Bench meal {index}",
+                        slug=f"bench-meal-{index}",
+                        category=("主食", "湯品", "點心")[index % 3],
+                        is_vegetarian=index % 4 == 0,
+                        is_spicy=index % 5 == 0,
+                        is_available=index % 10 != 0,
+                        is_recommendable=index % 10 != 0 and index // MEALS_PER_RESTAURANT % 25 != 0,
+                    )
+                    for index in range(offset, batch_end)
+                ]
+            )
+        return max(start, size)
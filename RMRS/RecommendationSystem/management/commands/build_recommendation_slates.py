@@ -0,0 +1,38 @@
+"""Precompute each user's default recommendation page into the slate table."""
+
+from __future__ import annotations
+
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from RecommendationSystem.slates import active_user_ids, prune_slates, rebuild_slates
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the default recommendation strategy for every user (or those active in the "
+        "last --active-days days) across a process pool and store the resulting primary "
+        "and secondary slates for the random-recommendation page."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--active-days", type=int, default=None, help="Only users active in this many days.")
+        parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--chunk-size", type=int, default=200, help="Users per worker task.")
+        parser.add_argument("--user", type=int, action="append", dest="user_ids", help="Limit to these user ids.")
+        parser.add_argument("--prune", action="store_true", help="Delete slates of users not rebuilt in this run.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        user_ids = options["user_ids"] or active_user_ids(options["active_days"])
+        stored = rebuild_slates(
+            user_ids,
+            processes=max(1, options["processes"]),
+            chunk_size=max(1, options["chunk_size"]),
+        )
+        message = f"Stored {stored} slate(s) in {time.perf_counter() - started:.1f}s"
+        if options["prune"] and not options["user_ids"]:
+            message += f"; pruned {prune_slates(user_ids)} stale slate(s)"
+        self.stdout.write(self.style.SUCCESS(message + "."))
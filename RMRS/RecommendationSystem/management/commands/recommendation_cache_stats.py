@@ -0,0 +1,36 @@
+"""Report hit/miss counters of the shared recommendation result cache."""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+
+from RecommendationSystem.result_cache import (
+    reset_result_cache_stats,
+    result_cache_stats,
+    shared_cache_enabled,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Print hit/miss counts for shared recommendation rankings. Counters live in "
+        "the RECOMMENDATION_CACHE backend, which must be shared (Redis, Memcached, ...) "
+        "for this command to see the web workers' counts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Zero the counters after reporting.")
+
+    def handle(self, *args, **options):
+        if not shared_cache_enabled():
+            raise CommandError(
+                "RECOMMENDATION_CACHE uses a per-process backend, so the web workers' counters "
+                "are not visible here. Point it at a shared cache such as Redis or Memcached."
+            )
+        stats = result_cache_stats()
+        self.stdout.write(
+            f"hits={stats['hits']} misses={stats['misses']} hit_rate={stats['hit_rate']:.1%}"
+        )
+        if options["reset"]:
+            reset_result_cache_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
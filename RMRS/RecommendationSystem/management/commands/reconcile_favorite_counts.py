@@ -0,0 +1,32 @@
+"""Repair drift in the denormalized meal and restaurant favorite counters."""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from RecommendationSystem.services import reconcile_favorite_counts
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute Meal.favorite_count and Restaurant.favorite_count from the "
+        "favorites table and rewrite only the rows that drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report drifted rows without writing them.",
+        )
+
+    def handle(self, *args, **options):
+        meals, restaurants = reconcile_favorite_counts(
+            batch_size=max(1, options["batch_size"]),
+            dry_run=options["dry_run"],
+        )
+        verb = "would be updated" if options["dry_run"] else "updated"
+        self.stdout.write(
+            self.style.SUCCESS(f"{meals} meal(s) and {restaurants} restaurant(s) {verb}.")
+        )
@@ -0,0 +1,86 @@
+"""Replay past selections and favorites against recommendation strategies."""
+
+from __future__ import annotations
+
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from RecommendationSystem.replay import STRATEGIES, replay, resolve_strategy, scratch_database
+
+
+def _parse_moment(value: str) -> datetime:
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date or datetime: {value}")
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment) and timezone.is_aware(timezone.now()):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the database into a throwaway test database, wind the copy back to --as-of, "
+        "ask each strategy for k meals per user who later selected or favorited something, "
+        "and report hit-rate@k, catalog coverage, p50/p95/p99 latency and queries per request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--strategy",
+            action="append",
+            dest="strategies",
+            help=(
+                f"Built-in strategy ({', '.join(STRATEGIES)}) or dotted path to a "
+                "callable(engine, k). Repeatable; defaults to all built-ins."
+            ),
+        )
+        parser.add_argument("--as-of", help="Snapshot date/datetime (default: 7 days ago).")
+        parser.add_argument("--until", help="Ignore interactions at or after this date/datetime.")
+        parser.add_argument("--k", type=int, default=6)
+        parser.add_argument("--max-users", type=int, default=None)
+        parser.add_argument(
+            "--skip-models",
+            action="store_true",
+            help="Do not retrain collaborative-filtering and similarity tables on the snapshot.",
+        )
+        parser.add_argument(
+            "--with-index",
+            action="store_true",
+            help="Also run every strategy with the in-memory catalog index enabled.",
+        )
+
+    def handle(self, *args, **options):
+        as_of = _parse_moment(options["as_of"]) if options["as_of"] else timezone.now() - timedelta(days=7)
+        until = _parse_moment(options["until"]) if options["until"] else None
+        try:
+            strategies = {name: resolve_strategy(name) for name in options["strategies"] or STRATEGIES}
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+        with scratch_database():
+            reports = replay(
+                strategies,
+                as_of,
+                until=until,
+                k=options["k"],
+                max_users=options["max_users"],
+                retrain=not options["skip_models"],
+                catalog_index_modes=(False, True) if options["with_index"] else (False,),
+            )
+        requests = reports[0].requests if reports else 0
+        self.stdout.write(f"Replayed {requests} user(s) against the snapshot at {as_of:%Y-%m-%d %H:%M}.")
+        self.stdout.write(
+            f"{'strategy':<22} {'hit@' + str(options['k']):>7} {'coverage':>9} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}"
+        )
+        for report in reports:
+            self.stdout.write(
+                f"{report.name:<22} {report.hit_rate:>7.3f} {report.coverage:>9.3f} "
+                f"{report.latency(50):>8.2f} {report.latency(95):>8.2f} {report.latency(99):>8.2f} "
+                f"{report.mean_queries:>8.1f}"
+            )
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:06
+
+import django.db.models.deletion
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RecommendationSystem', '0002_alter_recommendationhistory_recommended_at_and_more'),
+        ('UserSideApp', '0007_userpreference_recommendation_cooldown_days'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonalizedRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('meal_ids', models.JSONField(default=list)),
+                ('scores', models.JSONField(default=list)),
+                ('model_version', models.CharField(max_length=32)),
+                ('generated_at', models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now())),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='personalized_recommendation', to='UserSideApp.appuser')),
+            ],
+            options={
+                'db_table': 'personalized_recommendations',
+            },
+        ),
+    ]
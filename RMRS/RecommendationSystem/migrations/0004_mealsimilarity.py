@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MerchantSideApp', '0011_meal_favorite_count'),
+        ('RecommendationSystem', '0003_personalizedrecommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MealSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('meal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='MerchantSideApp.meal')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbor_of', to='MerchantSideApp.meal')),
+            ],
+            options={
+                'db_table': 'meal_similarities',
+                'constraints': [models.UniqueConstraint(fields=('meal', 'rank'), name='uniq_meal_similarity_rank')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MerchantSideApp', '0011_meal_favorite_count'),
+        ('RecommendationSystem', '0004_mealsimilarity'),
+        ('UserSideApp', '0007_userpreference_recommendation_cooldown_days'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('impressions', models.PositiveIntegerField(default=0)),
+                ('selections', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'recommendation_daily_stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recommendationhistory',
+            index=models.Index(fields=['user', 'was_selected', 'recommended_at'], name='idx_rec_history_cooldown'),
+        ),
+        migrations.AddField(
+            model_name='recommendationdailystat',
+            name='meal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendation_daily_stats', to='MerchantSideApp.meal'),
+        ),
+        migrations.AddField(
+            model_name='recommendationdailystat',
+            name='restaurant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendation_daily_stats', to='MerchantSideApp.restaurant'),
+        ),
+        migrations.AddIndex(
+            model_name='recommendationdailystat',
+            index=models.Index(fields=['restaurant', 'date'], name='idx_rec_daily_stat_restaurant'),
+        ),
+        migrations.AddConstraint(
+            model_name='recommendationdailystat',
+            constraint=models.UniqueConstraint(fields=('date', 'meal'), name='uniq_rec_daily_stat_meal'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:26
+
+import django.db.models.deletion
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RecommendationSystem', '0005_history_retention'),
+        ('UserSideApp', '0007_userpreference_recommendation_cooldown_days'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationSlate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('primary_ids', models.JSONField(default=list)),
+                ('primary_source', models.CharField(blank=True, max_length=20)),
+                ('sections', models.JSONField(default=list)),
+                ('generated_at', models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now())),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='recommendation_slate', to='UserSideApp.appuser')),
+            ],
+            options={
+                'db_table': 'recommendation_slates',
+                'indexes': [models.Index(fields=['generated_at'], name='idx_rec_slate_generated')],
+            },
+        ),
+    ]
@@ -30,8 +30,111 @@ class RecommendationHistory(models.Model):
 		indexes = [
 			models.Index(fields=["user"], name="idx_rec_history_user"),
 			models.Index(fields=["recommended_at"], name="idx_recommended_at"),
+			models.Index(
+				fields=["user", "was_selected", "recommended_at"],
+				name="idx_rec_history_cooldown",
+			),
 		]
 
 	def __str__(self) -> str:
 		base = f"Meal {self.meal_id} for restaurant {self.restaurant_id}"
 		return f"{base} at {self.recommended_at:%Y-%m-%d %H:%M:%S}"
+
+
+class RecommendationDailyStat(models.Model):
+	"""Daily per-meal impression and selection counts rolled up from archived history."""
+
+	date = models.DateField()
+	meal = models.ForeignKey(
+		"MerchantSideApp.Meal",
+		related_name="recommendation_daily_stats",
+		on_delete=models.CASCADE,
+	)
+	restaurant = models.ForeignKey(
+		"MerchantSideApp.Restaurant",
+		related_name="recommendation_daily_stats",
+		on_delete=models.CASCADE,
+	)
+	impressions = models.PositiveIntegerField(default=0)
+	selections = models.PositiveIntegerField(default=0)
+
+	class Meta:
+		db_table = "recommendation_daily_stats"
+		constraints = [
+			models.UniqueConstraint(fields=["date", "meal"], name="uniq_rec_daily_stat_meal"),
+		]
+		indexes = [
+			models.Index(fields=["restaurant", "date"], name="idx_rec_daily_stat_restaurant"),
+		]
+
+	def __str__(self) -> str:
+		return f"{self.date}: meal {self.meal_id} shown {self.impressions}, picked {self.selections}"
+
+
+class PersonalizedRecommendation(models.Model):
+	"""Precomputed collaborative-filtering picks for one user."""
+
+	user = models.OneToOneField(
+		"UserSideApp.AppUser",
+		related_name="personalized_recommendation",
+		on_delete=models.CASCADE,
+	)
+	meal_ids = models.JSONField(default=list)
+	scores = models.JSONField(default=list)
+	model_version = models.CharField(max_length=32)
+	generated_at = models.DateTimeField(auto_now=True, db_default=Now())
+
+	class Meta:
+		db_table = "personalized_recommendations"
+
+	def __str__(self) -> str:
+		return f"Personalized picks for user {self.user_id} ({self.model_version})"
+
+
+class RecommendationSlate(models.Model):
+	"""Ready-made default recommendation page (meal ids and section reasons) for one user."""
+
+	user = models.OneToOneField(
+		"UserSideApp.AppUser",
+		related_name="recommendation_slate",
+		on_delete=models.CASCADE,
+	)
+	primary_ids = models.JSONField(default=list)
+	primary_source = models.CharField(max_length=20, blank=True)
+	sections = models.JSONField(default=list)
+	generated_at = models.DateTimeField(auto_now=True, db_default=Now())
+
+	class Meta:
+		db_table = "recommendation_slates"
+		indexes = [
+			models.Index(fields=["generated_at"], name="idx_rec_slate_generated"),
+		]
+
+	def __str__(self) -> str:
+		return f"Slate for user {self.user_id} at {self.generated_at:%Y-%m-%d %H:%M}"
+
+
+class MealSimilarity(models.Model):
+	"""Top-K item-to-item neighbors computed offline from co-favorites and co-reviews."""
+
+	meal = models.ForeignKey(
+		"MerchantSideApp.Meal",
+		related_name="neighbors",
+		on_delete=models.CASCADE,
+	)
+	neighbor = models.ForeignKey(
+		"MerchantSideApp.Meal",
+		related_name="neighbor_of",
+		on_delete=models.CASCADE,
+	)
+	rank = models.PositiveSmallIntegerField()
+	score = models.FloatField()
+
+	class Meta:
+		db_table = "meal_similarities"
+		constraints = [
+			models.UniqueConstraint(fields=["meal", "rank"], name="uniq_meal_similarity_rank"),
+		]
+
+	def __str__(self) -> str:
+		return f"Meal {self.meal_id} ~ {self.neighbor_id} ({self.score:.3f})"
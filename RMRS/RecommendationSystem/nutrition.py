@@ -0,0 +1,180 @@
+"""In-process macro matrix for nutrition-aware recommendations.
+
+Every meal with a ``NutritionInfo`` row is one row of a ``float32`` matrix
+(calories, protein, carbohydrate, fat, sodium), sorted by meal id. Scoring a user's
+remaining daily budget against all candidates is then a single vectorized
+distance computation. ``_persist_meal_nutrition`` refreshes the affected
+row after each write; other processes pick changes up on the next reload.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+from django.conf import settings
+
+from MerchantSideApp.models import NutritionInfo
+
+
+MACROS = ("calories", "protein", "carbohydrate", "fat", "sodium")
+DEFAULT_DAILY_TARGETS = {
+    "calories": 2000.0,
+    "protein": 75.0,
+    "carbohydrate": 250.0,
+    "fat": 65.0,
+    "sodium": 2000.0,
+}
+MAIN_MEALS = ("breakfast", "lunch", "dinner")
+# Going over the remaining budget costs more than falling short of it.
+OVERSHOOT_WEIGHT = 2.0
+# Upper limits rather than targets: falling short of them costs nothing.
+LIMITS = ("sodium",)
+VALUE_DTYPE = np.float32
+UNDERSHOOT_WEIGHTS = np.array([0.0 if macro in LIMITS else 1.0 for macro in MACROS], dtype=VALUE_DTYPE)
+
+
+def daily_targets() -> np.ndarray:
+    targets = {**DEFAULT_DAILY_TARGETS, **getattr(settings, "RECOMMENDATION_DAILY_TARGETS", {})}
+    return np.array([float(targets[macro]) for macro in MACROS], dtype=VALUE_DTYPE)
+
+
+def meal_target(consumed: Iterable[float], meals_logged: int, targets: Optional[np.ndarray] = None) -> np.ndarray:
+    """What one more meal should contribute: the remaining budget split over the main meals left."""
+    targets = daily_targets() if targets is None else targets
+    remaining = np.maximum(targets - np.asarray(list(consumed), dtype=VALUE_DTYPE), 0)
+    return remaining / max(1, len(MAIN_MEALS) - meals_logged)
+
+
+def fit_distances(values: np.ndarray, target: np.ndarray, scale: Optional[np.ndarray] = None) -> np.ndarray:
+    """Weighted distance of each macro row from ``target``, scaled by the daily targets."""
+    scale = daily_targets() if scale is None else scale
+    diff = (values - target) / scale
+    diff = np.where(diff > 0, diff * OVERSHOOT_WEIGHT, diff * UNDERSHOOT_WEIGHTS)
+    return np.sqrt(np.einsum("ij,ij->i", diff, diff))
+
+
+class MacroMatrix:
+    """Meal ids (sorted) and their macro vectors."""
+
+    def __init__(self):
+        self.meal_id = np.empty(0, dtype=np.int64)
+        self.values = np.empty((0, len(MACROS)), dtype=VALUE_DTYPE)
+
+    def __len__(self) -> int:
+        return int(self.meal_id.size)
+
+    def load(self, rows: Iterable[tuple]) -> None:
+        rows = list(rows)
+        meal_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        values = np.array([row[1:] for row in rows], dtype=VALUE_DTYPE).reshape(len(rows), len(MACROS))
+        order = np.argsort(meal_ids, kind="stable")
+        self.meal_id = meal_ids[order]
+        self.values = values[order]
+
+    def position(self, meal_id: int) -> Optional[int]:
+        pos = int(np.searchsorted(self.meal_id, meal_id))
+        if pos < len(self) and self.meal_id[pos] == meal_id:
+            return pos
+        return None
+
+    def upsert(self, meal_id: int, vector) -> None:
+        vector = np.asarray(vector, dtype=VALUE_DTYPE)
+        pos = self.position(meal_id)
+        if pos is not None:
+            self.values[pos] = vector
+            return
+        pos = int(np.searchsorted(self.meal_id, meal_id))
+        self.meal_id = np.insert(self.meal_id, pos, meal_id)
+        self.values = np.insert(self.values, pos, vector, axis=0)
+
+    def remove(self, meal_id: int) -> None:
+        pos = self.position(meal_id)
+        if pos is not None:
+            self.meal_id = np.delete(self.meal_id, pos)
+            self.values = np.delete(self.values, pos, axis=0)
+
+    def copy(self) -> "MacroMatrix":
+        clone = MacroMatrix()
+        clone.meal_id = self.meal_id.copy()
+        clone.values = self.values.copy()
+        return clone
+
+    def rank(self, target: np.ndarray, candidate_ids: np.ndarray, limit: int) -> np.ndarray:
+        """Ids of the ``limit`` candidates closest to ``target``, best first."""
+        rows = np.flatnonzero(np.isin(self.meal_id, candidate_ids))
+        if not rows.size or limit <= 0:
+            return np.empty(0, dtype=np.int64)
+        distances = fit_distances(self.values[rows], target)
+        if rows.size > limit:
+            best = np.argpartition(distances, limit - 1)[:limit]
+            rows, distances = rows[best], distances[best]
+        order = np.lexsort((self.meal_id[rows], distances))
+        return self.meal_id[rows[order]]
+
+
+def nutrition_rows(meal_ids: Optional[Iterable[int]] = None):
+    qs = NutritionInfo.objects.all()
+    if meal_ids is not None:
+        qs = qs.filter(meal_id__in=list(meal_ids))
+    return qs.values_list("meal_id", *MACROS)
+
+
+class NutritionMatrixIndex:
+    """Process-wide macro matrix with lazy loading and incremental updates."""
+
+    def __init__(self, max_age: Optional[float] = None):
+        self._lock = threading.RLock()
+        self._matrix: Optional[MacroMatrix] = None
+        self._loaded_at = 0.0
+        self._max_age = max_age
+
+    @property
+    def max_age(self) -> float:
+        if self._max_age is not None:
+            return self._max_age
+        return float(getattr(settings, "RECOMMENDATION_CATALOG_MAX_AGE", 300))
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._matrix is not None
+
+    def matrix(self) -> MacroMatrix:
+        with self._lock:
+            expired = self.max_age and time.monotonic() - self._loaded_at > self.max_age
+            if self._matrix is None or expired:
+                self.reload()
+            return self._matrix
+
+    def reload(self) -> None:
+        matrix = MacroMatrix()
+        matrix.load(nutrition_rows())
+        with self._lock:
+            self._matrix = matrix
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._matrix = None
+
+    def refresh_meals(self, meal_ids: Iterable[int]) -> None:
+        """Re-read the given meals' nutrition into a loaded matrix."""
+        meal_ids = list(meal_ids)
+        if not meal_ids or not self.is_loaded:
+            return
+        rows: Dict[int, tuple] = {row[0]: row[1:] for row in nutrition_rows(meal_ids)}
+        with self._lock:
+            if self._matrix is None:
+                return
+            matrix = self._matrix.copy()
+            for meal_id in meal_ids:
+                if meal_id in rows:
+                    matrix.upsert(meal_id, rows[meal_id])
+                else:
+                    matrix.remove(meal_id)
+            self._matrix = matrix
+
+
+nutrition_matrix = NutritionMatrixIndex()
@@ -0,0 +1,256 @@
+"""Offline replay of recommendation strategies against past interactions.
+
+Every user who selected a recommended meal or added a favorite after
+``as_of`` becomes one replay request. Inside a transaction that is always
+rolled back, the database is wound back to ``as_of`` (later interactions,
+meal records and meals are deleted, favorite counters reconciled, offline
+models optionally retrained). That only ever happens on a throwaway
+database: :func:`scratch_database` copies the live one into a test
+database first, and :func:`point_in_time` refuses to run anywhere else. Each strategy is then asked for ``k`` meals
+per user. The report gives hit-rate@k (the user later picked one of them),
+catalog coverage, latency percentiles and queries per request.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.backends.base.creation import TEST_DATABASE_PREFIX
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.module_loading import import_string
+
+from MerchantSideApp.models import Meal
+from UserSideApp.models import AppUser, DailyMealRecord, Favorite, Review
+from UserSideApp.services import RecommendationEngine
+
+from .catalog import catalog_index
+from .collaborative import train_and_store
+from .dietary import dietary_index
+from .models import MealSimilarity, PersonalizedRecommendation, RecommendationHistory
+from .nutrition import nutrition_matrix
+from .services import reconcile_favorite_counts
+from .similarity import rebuild_meal_similarity
+
+
+REPLAY_CACHE = "recommendation-replay"
+
+Strategy = Callable[[RecommendationEngine, int], Iterable]
+
+
+def _page_meals(engine: RecommendationEngine, k: int):
+    filters = engine.filters_from_preferences(getattr(engine.user, "preferences", None), k)
+    page = engine.build_page("preferences", filters)
+    meals = list(page.primary)
+    for section in page.sections:
+        meals.extend(section.meals)
+    return meals[:k]
+
+
+STRATEGIES: Dict[str, Strategy] = {
+    "preferences": lambda engine, k: engine.preference_recommendations(k),
+    "random": lambda engine, k: engine.random_meals(k),
+    "popular": lambda engine, k: engine.popular_meals(k),
+    "budget": lambda engine, k: engine.budget_friendly(k),
+    "for_you": lambda engine, k: engine.personalized_meals(k),
+    "fits_budget": lambda engine, k: engine.nutrition_fit_meals(k),
+    "new_experiences": lambda engine, k: engine.new_experiences(k),
+    "page": _page_meals,
+}
+
+
+def resolve_strategy(name: str) -> Strategy:
+    """A built-in strategy name or the dotted path of ``callable(engine, k)``."""
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    try:
+        return import_string(name)
+    except ImportError as exc:
+        raise ValueError(f"Unknown recommendation strategy: {name}") from exc
+
+
+def replay_targets(
+    as_of: datetime,
+    until: Optional[datetime] = None,
+    max_users: Optional[int] = None,
+) -> Dict[int, Set[int]]:
+    """``{user_id: meal ids selected or favorited after as_of}``."""
+    selections = RecommendationHistory.objects.filter(
+        was_selected=True,
+        recommended_at__gte=as_of,
+        user__isnull=False,
+    )
+    favorites = Favorite.objects.filter(created_at__gte=as_of)
+    if until is not None:
+        selections = selections.filter(recommended_at__lt=until)
+        favorites = favorites.filter(created_at__lt=until)
+    targets: Dict[int, Set[int]] = defaultdict(set)
+    for user_id, meal_id in selections.values_list("user_id", "meal_id").union(
+        favorites.values_list("user_id", "meal_id")
+    ):
+        targets[user_id].add(meal_id)
+    user_ids = sorted(targets)[:max_users] if max_users else sorted(targets)
+    return {user_id: targets[user_id] for user_id in user_ids}
+
+
+def _reset_indexes() -> None:
+    catalog_index.invalidate()
+    dietary_index.invalidate()
+    nutrition_matrix.invalidate()
+
+
+class _Rollback(Exception):
+    pass
+
+
+def on_scratch_database() -> bool:
+    """Whether the default connection points at a test database rather than the live one."""
+    name = str(connection.settings_dict["NAME"] or "")
+    test_name = (connection.settings_dict.get("TEST") or {}).get("NAME")
+    return name.startswith(TEST_DATABASE_PREFIX) or name == test_name or "mode=memory" in name or name == ":memory:"
+
+
+@contextmanager
+def scratch_database(verbosity: int = 0):
+    """Run the block against a throwaway test database holding a copy of the live data."""
+    if on_scratch_database():
+        yield
+        return
+    data = connection.creation.serialize_db_to_string()
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        # Loading the copy must not schedule slate rebuilds against it.
+        with override_settings(RECOMMENDATION_SLATES=False):
+            connection.creation.deserialize_db_from_string(data)
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+@contextmanager
+def point_in_time(as_of: datetime, retrain: bool = True):
+    """Wind the database back to ``as_of`` for the duration of the block, then roll back.
+
+    Raises ``ValueError`` unless the default connection is a test database
+    (see :func:`scratch_database`). Recommendation caches are redirected to
+    a private in-memory cache so neither side sees the other's entries, and
+    slate refreshes are switched off.
+    """
+    if not on_scratch_database():
+        raise ValueError(
+            "point_in_time deletes rows; run it inside scratch_database(), not on the live database."
+        )
+    replay_caches = {
+        **settings.CACHES,
+        REPLAY_CACHE: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": REPLAY_CACHE},
+    }
+    with override_settings(CACHES=replay_caches, RECOMMENDATION_CACHE=REPLAY_CACHE, RECOMMENDATION_SLATES=False):
+        _reset_indexes()
+        try:
+            with transaction.atomic():
+                RecommendationHistory.objects.filter(recommended_at__gte=as_of).delete()
+                Favorite.objects.filter(created_at__gte=as_of).delete()
+                Review.objects.filter(created_at__gte=as_of).delete()
+                DailyMealRecord.objects.filter(date__gte=as_of.date()).delete()
+                Meal.objects.filter(created_at__gte=as_of).delete()
+                reconcile_favorite_counts()
+                PersonalizedRecommendation.objects.all().delete()
+                MealSimilarity.objects.all().delete()
+                if retrain:
+                    train_and_store()
+                    rebuild_meal_similarity()
+                _reset_indexes()
+                caches[REPLAY_CACHE].clear()
+                yield
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            caches[REPLAY_CACHE].clear()
+            _reset_indexes()
+
+
+@dataclass
+class StrategyReport:
+    name: str
+    k: int
+    requests: int = 0
+    hits: int = 0
+    recommended: Set[int] = field(default_factory=set)
+    latencies_ms: List[float] = field(default_factory=list)
+    queries: List[int] = field(default_factory=list)
+    catalog_size: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.requests if self.requests else 0.0
+
+    @property
+    def coverage(self) -> float:
+        return len(self.recommended) / self.catalog_size if self.catalog_size else 0.0
+
+    def latency(self, percentile: float) -> float:
+        return float(np.percentile(self.latencies_ms, percentile)) if self.latencies_ms else 0.0
+
+    @property
+    def mean_queries(self) -> float:
+        return float(np.mean(self.queries)) if self.queries else 0.0
+
+
+def _meal_ids(results: Iterable) -> List[int]:
+    return [int(getattr(item, "pk", item)) for item in results]
+
+
+def evaluate(name: str, strategy: Strategy, targets: Dict[int, Set[int]], k: int) -> StrategyReport:
+    """Run ``strategy`` once per target user against the current database state."""
+    report = StrategyReport(
+        name=name,
+        k=k,
+        catalog_size=Meal.objects.filter(is_recommendable=True).count(),
+    )
+    users = AppUser.objects.in_bulk(list(targets))
+    for user_id, picked in targets.items():
+        user = users.get(user_id)
+        if user is None:
+            continue
+        engine = RecommendationEngine(user)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            recommended = _meal_ids(strategy(engine, k))[:k]
+            elapsed = time.perf_counter() - started
+        report.requests += 1
+        report.hits += bool(picked.intersection(recommended))
+        report.recommended.update(recommended)
+        report.latencies_ms.append(elapsed * 1000)
+        report.queries.append(len(queries))
+    return report
+
+
+def replay(
+    strategies: Dict[str, Strategy],
+    as_of: datetime,
+    until: Optional[datetime] = None,
+    k: int = 6,
+    max_users: Optional[int] = None,
+    retrain: bool = True,
+    catalog_index_modes: Iterable[bool] = (False,),
+) -> List[StrategyReport]:
+    """Evaluate every strategy (under each catalog-index mode) on the ``as_of`` snapshot."""
+    targets = replay_targets(as_of, until, max_users)
+    reports = []
+    with point_in_time(as_of, retrain=retrain):
+        for use_index in catalog_index_modes:
+            with override_settings(RECOMMENDATION_CATALOG_INDEX=use_index):
+                for name, strategy in strategies.items():
+                    caches[REPLAY_CACHE].clear()
+                    label = f"{name}+index" if use_index else name
+                    reports.append(evaluate(label, strategy, targets, k))
+    return reports
@@ -0,0 +1,156 @@
+"""Shared cache of user-independent ranked meal id lists.
+
+Rankings are keyed by a normalized :class:`RecommendationFilters` hash, the
+ordering and a catalog version stamp. Meal and restaurant writes bump the
+stamp (see ``signals``), which orphans every cached ranking at once.
+Favorite writes only bump a second stamp that keys the orderings in
+``FAVORITE_ORDERINGS``, so rating-ordered rankings survive them. Lists are
+over-fetched so per-user cooldown filtering and truncation can happen after
+the hit.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from dataclasses import asdict
+from functools import partial
+from typing import Callable, Dict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+
+VERSION_KEY = "recommendation:catalog-version"
+FAVORITES_VERSION_KEY = "recommendation:favorites-version"
+RANKING_KEY = "recommendation:ranking:{version}:{source}:{ordering}:{digest}"
+STATS_KEY = "recommendation:ranking-stats:{outcome}"
+ID_DTYPE = np.int32
+# Orderings that read favorite counts.
+FAVORITE_ORDERINGS = frozenset({"popular"})
+# Backends private to one process: other workers never see their writes or invalidations.
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def _cache():
+    return caches[getattr(settings, "RECOMMENDATION_CACHE", "default")]
+
+
+def shared_cache_enabled() -> bool:
+    """True when ``RECOMMENDATION_CACHE`` is a backend every worker shares (Redis, Memcached, ...)."""
+    return not isinstance(_cache(), PROCESS_LOCAL_BACKENDS)
+
+
+def result_cache_ttl() -> int:
+    return int(getattr(settings, "RECOMMENDATION_RESULT_CACHE_TTL", 300))
+
+
+def result_cache_depth() -> int:
+    return int(getattr(settings, "RECOMMENDATION_RESULT_CACHE_DEPTH", 60))
+
+
+def filters_digest(filters) -> str:
+    """Stable hash of the filter values that shape a ranking (``limit`` excluded)."""
+    values = asdict(filters)
+    values.pop("limit", None)
+    normalized = {
+        name: (value.strip().casefold() or None) if isinstance(value, str) else value
+        for name, value in values.items()
+    }
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _version(key: str) -> int:
+    version = _cache().get(key)
+    if version is None:
+        version = _bump(key)
+    return version
+
+
+def _bump(key: str) -> int:
+    version = time.time_ns()
+    _cache().set(key, version, None)
+    return version
+
+
+def catalog_version() -> int:
+    return _version(VERSION_KEY)
+
+
+def ranking_version(ordering: str) -> str:
+    """Version stamp of rankings by ``ordering``: the catalog's, plus favorites' where they matter."""
+    if ordering in FAVORITE_ORDERINGS:
+        return f"{catalog_version()}.{_version(FAVORITES_VERSION_KEY)}"
+    return str(catalog_version())
+
+
+def invalidate_rankings() -> None:
+    """Orphan every cached ranking now and once the current transaction commits."""
+    _bump(VERSION_KEY)
+    transaction.on_commit(partial(_bump, VERSION_KEY))
+
+
+def invalidate_favorite_rankings() -> None:
+    """Orphan the rankings in ``FAVORITE_ORDERINGS`` now and once the current transaction commits."""
+    _bump(FAVORITES_VERSION_KEY)
+    transaction.on_commit(partial(_bump, FAVORITES_VERSION_KEY))
+
+
+def _record(outcome: str) -> None:
+    cache = _cache()
+    key = STATS_KEY.format(outcome=outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def result_cache_stats() -> Dict[str, float]:
+    cache = _cache()
+    hits = cache.get(STATS_KEY.format(outcome="hit"), 0)
+    misses = cache.get(STATS_KEY.format(outcome="miss"), 0)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
+
+
+def reset_result_cache_stats() -> None:
+    _cache().delete_many([STATS_KEY.format(outcome="hit"), STATS_KEY.format(outcome="miss")])
+
+
+def cached_ranking(
+    source: str,
+    filters,
+    ordering: str,
+    compute: Callable[[int], np.ndarray],
+) -> np.ndarray:
+    """Return the shared ranking, calling ``compute(depth)`` on a miss.
+
+    ``compute`` must return up to ``depth`` meal ids best first without any
+    per-user exclusions applied.
+    """
+    ttl = result_cache_ttl()
+    depth = result_cache_depth()
+    if ttl <= 0:
+        return np.asarray(compute(depth), dtype=ID_DTYPE)
+    cache = _cache()
+    key = RANKING_KEY.format(
+        version=ranking_version(ordering),
+        source=source,
+        ordering=ordering,
+        digest=filters_digest(filters),
+    )
+    packed = cache.get(key)
+    if packed is not None:
+        _record("hit")
+        return np.frombuffer(packed, dtype=ID_DTYPE)
+    _record("miss")
+    ranked = np.asarray(compute(depth), dtype=ID_DTYPE)
+    cache.set(key, ranked.tobytes(), ttl)
+    return ranked
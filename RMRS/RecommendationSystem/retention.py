@@ -0,0 +1,130 @@
+"""Archive old recommendation history into compressed files and daily rollups.
+
+Rows older than the widest cooldown window are no longer read by the
+request path. :func:`archive_history` moves them out of the hot table in
+small id-ordered chunks: each chunk is appended to a gzip JSON-lines file,
+folded into :class:`RecommendationDailyStat`, and deleted in its own short
+transaction, so no statement holds locks for long.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import RecommendationDailyStat, RecommendationHistory
+from .services import MAX_COOLDOWN_DAYS
+
+
+ARCHIVE_FIELDS = ("id", "user_id", "meal_id", "restaurant_id", "recommended_at", "was_selected")
+
+
+@dataclass
+class ArchiveResult:
+    archived: int = 0
+    chunks: int = 0
+    path: Optional[Path] = None
+
+
+def archive_cutoff(days: Optional[int] = None) -> datetime:
+    """Rows older than this are safe to archive; never inside the cooldown window."""
+    return timezone.now() - timedelta(days=max(days or MAX_COOLDOWN_DAYS, MAX_COOLDOWN_DAYS))
+
+
+def _rollup(rows: List[Dict]) -> Dict[Tuple, List[int]]:
+    """``{(date, meal_id): [restaurant_id, impressions, selections]}`` for one chunk."""
+    totals: Dict[Tuple, List[int]] = defaultdict(lambda: [0, 0, 0])
+    for row in rows:
+        entry = totals[(row["recommended_at"].date(), row["meal_id"])]
+        entry[0] = row["restaurant_id"]
+        entry[2 if row["was_selected"] else 1] += 1
+    return totals
+
+
+def _apply_rollup(totals: Dict[Tuple, List[int]]) -> None:
+    dates = {day for day, _meal_id in totals}
+    meal_ids = {meal_id for _day, meal_id in totals}
+    existing = {
+        (stat.date, stat.meal_id): stat
+        for stat in RecommendationDailyStat.objects.select_for_update().filter(
+            date__in=dates,
+            meal_id__in=meal_ids,
+        )
+    }
+    changed, created = [], []
+    for key, (restaurant_id, impressions, selections) in totals.items():
+        stat = existing.get(key)
+        if stat is None:
+            created.append(
+                RecommendationDailyStat(
+                    date=key[0],
+                    meal_id=key[1],
+                    restaurant_id=restaurant_id,
+                    impressions=impressions,
+                    selections=selections,
+                )
+            )
+        else:
+            stat.impressions += impressions
+            stat.selections += selections
+            changed.append(stat)
+    if changed:
+        RecommendationDailyStat.objects.bulk_update(changed, ["impressions", "selections"])
+    if created:
+        RecommendationDailyStat.objects.bulk_create(created)
+
+
+def archive_history(
+    output_dir: Path,
+    days: Optional[int] = None,
+    chunk_size: int = 5000,
+    max_chunks: Optional[int] = None,
+    dry_run: bool = False,
+) -> ArchiveResult:
+    """Move history rows older than the cutoff into ``output_dir`` and the rollup table.
+
+    Each chunk is written and fsynced before its delete commits, so a crash
+    can at worst leave a row both archived and still in the table (it is
+    archived again next run), never lose one.
+    """
+    cutoff = archive_cutoff(days)
+    old_rows = RecommendationHistory.objects.filter(recommended_at__lt=cutoff)
+    result = ArchiveResult()
+    if dry_run:
+        result.archived = old_rows.count()
+        return result
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    result.path = output_dir / f"recommendation_history_{timezone.now():%Y%m%d%H%M%S}.jsonl.gz"
+    last_id = 0
+    with gzip.open(result.path, "at", encoding="utf-8") as archive:
+        while max_chunks is None or result.chunks < max_chunks:
+            rows = list(
+                old_rows.filter(pk__gt=last_id).order_by("pk").values(*ARCHIVE_FIELDS)[:chunk_size]
+            )
+            if not rows:
+                break
+            for row in rows:
+                archive.write(json.dumps(row, default=str, ensure_ascii=False) + "\n")
+            archive.flush()
+            os.fsync(archive.fileno())
+            with transaction.atomic():
+                _apply_rollup(_rollup(rows))
+                RecommendationHistory.objects.filter(pk__in=[row["id"] for row in rows]).delete()
+            last_id = rows[-1]["id"]
+            result.archived += len(rows)
+            result.chunks += 1
+    if not result.archived:
+        result.path.unlink(missing_ok=True)
+        result.path = None
+    return result
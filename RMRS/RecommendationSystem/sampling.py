@@ -0,0 +1,74 @@
+"""Uniform random sampling helpers that avoid ``ORDER BY RAND()``."""
+
+from __future__ import annotations
+
+import math
+import random
+from typing import List, Optional
+
+from django.db.models import QuerySet
+
+
+DEFAULT_OVERSAMPLE = 3
+DEFAULT_MAX_ROUNDS = 4
+
+
+def _pk_bounds(model) -> tuple[Optional[int], Optional[int]]:
+    """Smallest and largest primary key, each read straight off the pk index.
+
+    Two single-ended lookups are used instead of one ``MIN()/MAX()``
+    aggregate because not every backend can answer the combined aggregate
+    from the index alone.
+    """
+    pks = model._default_manager.values_list("pk", flat=True)
+    return pks.order_by("pk").first(), pks.order_by("-pk").first()
+
+
+def sample_queryset(
+    queryset: QuerySet,
+    limit: int,
+    *,
+    oversample: int = DEFAULT_OVERSAMPLE,
+    max_rounds: int = DEFAULT_MAX_ROUNDS,
+    rng: Optional[random.Random] = None,
+) -> List:
+    """Return up to ``limit`` uniformly random rows of ``queryset``.
+
+    Random primary keys are drawn from the table's id range and looked up
+    with an indexed ``pk IN (...)`` query; every surviving row is equally
+    likely to be hit, so taking hits in probe order yields a uniform sample.
+    Each round widens the probe set to cope with id gaps and filtered-out
+    rows. When the candidate set is too sparse for probing to converge, the
+    remainder falls back to ``ORDER BY RAND()`` over what is left.
+    """
+    if limit <= 0:
+        return []
+    rng = rng or random.SystemRandom()
+    low, high = _pk_bounds(queryset.model)
+    if low is None:
+        return []
+
+    span = high - low + 1
+    picked = []
+    picked_ids = set()
+    tried: set[int] = set()
+    for round_number in range(max_rounds):
+        need = limit - len(picked)
+        if need <= 0 or len(tried) >= span:
+            break
+        probe_count = min(span - len(tried), math.ceil(need * oversample * 2 ** round_number))
+        probes = [pk for pk in rng.sample(range(low, high + 1), probe_count) if pk not in tried]
+        tried.update(probes)
+        found = {obj.pk: obj for obj in queryset.filter(pk__in=probes)}
+        for pk in probes:
+            obj = found.get(pk)
+            if obj is not None and pk not in picked_ids:
+                picked.append(obj)
+                picked_ids.add(pk)
+                if len(picked) == limit:
+                    return picked
+
+    need = limit - len(picked)
+    if need > 0 and len(tried) < span:
+        picked.extend(queryset.exclude(pk__in=picked_ids).order_by("?")[:need])
+    return picked
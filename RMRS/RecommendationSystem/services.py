@@ -4,8 +4,13 @@ from datetime import timedelta
 from typing import Iterable
 
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Count, Exists, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
+from MerchantSideApp.models import Meal, Restaurant
+from UserSideApp.models import Favorite
+
 from .models import RecommendationHistory
 
 
@@ -71,3 +76,76 @@ def recent_selected_meal_ids(user, days: int | None = None) -> Iterable[int]:
         .values_list("meal_id", flat=True)
         .distinct()
     )
+
+
+def recently_selected(user, days: int | None = None) -> Exists:
+    """Correlated ``EXISTS`` over the cooldown window, for anti-joins against meals."""
+    window_days = max(1, days) if days is not None else get_recommendation_cooldown_days(user)
+    cutoff = timezone.now() - timedelta(days=window_days)
+    return Exists(
+        RecommendationHistory.objects.filter(
+            user=user,
+            meal=OuterRef("pk"),
+            was_selected=True,
+            recommended_at__gte=cutoff,
+        )
+    )
+
+
+def adjust_favorite_count(meal, delta: int) -> None:
+    """Apply a favorite delta to the meal and restaurant counters in place.
+
+    Uses ``F()`` expressions so concurrent favorites never lose updates;
+    decrements never take a counter below zero.
+    """
+    if meal is None or not delta:
+        return
+    meals = Meal.objects.filter(pk=meal.pk)
+    restaurants = Restaurant.objects.filter(pk=meal.restaurant_id)
+    if delta < 0:
+        meals = meals.filter(favorite_count__gte=-delta)
+        restaurants = restaurants.filter(favorite_count__gte=-delta)
+    meals.update(favorite_count=F("favorite_count") + delta)
+    restaurants.update(favorite_count=F("favorite_count") + delta)
+
+
+def reconcile_favorite_counts(batch_size: int = 500, dry_run: bool = False) -> tuple[int, int]:
+    """Rewrite drifted favorite counters from the favorites table.
+
+    Only rows whose stored counter differs from the actual count are
+    written. Returns the number of meals and restaurants that drifted.
+    """
+    meal_totals = (
+        Favorite.objects.filter(meal=OuterRef("pk"))
+        .order_by()
+        .values("meal")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    drifted_meals = [
+        Meal(pk=pk, favorite_count=actual)
+        for pk, actual in Meal.objects.annotate(actual=Coalesce(Subquery(meal_totals), 0))
+        .exclude(favorite_count=F("actual"))
+        .values_list("pk", "actual")
+        .iterator(chunk_size=batch_size)
+    ]
+    if drifted_meals and not dry_run:
+        Meal.objects.bulk_update(drifted_meals, ["favorite_count"], batch_size=batch_size)
+
+    restaurant_totals = (
+        Favorite.objects.filter(meal__restaurant=OuterRef("pk"))
+        .order_by()
+        .values("meal__restaurant")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    drifted_restaurants = [
+        Restaurant(pk=pk, favorite_count=actual)
+        for pk, actual in Restaurant.objects.annotate(actual=Coalesce(Subquery(restaurant_totals), 0))
+        .exclude(favorite_count=F("actual"))
+        .values_list("pk", "actual")
+        .iterator(chunk_size=batch_size)
+    ]
+    if drifted_restaurants and not dry_run:
+        Restaurant.objects.bulk_update(drifted_restaurants, ["favorite_count"], batch_size=batch_size)
+    return len(drifted_meals), len(drifted_restaurants)
@@ -0,0 +1,145 @@
+"""Signal receivers keeping recommendation indexes and caches fresh."""
+
+from __future__ import annotations
+
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from MerchantSideApp.models import Meal, MealTag, Restaurant, Tag
+from UserSideApp.models import Favorite, MealComponent, Review, UserPreference
+
+from .autocomplete import autocomplete_index
+from .catalog import catalog_index
+from .dietary import dietary_index
+from .exclusions import invalidate_user_exclusions
+from .fulltext import search_index
+from .models import RecommendationHistory
+from .result_cache import invalidate_favorite_rankings, invalidate_rankings
+from .slates import schedule_slate_refresh
+
+
+@receiver(post_save, sender=Meal, dispatch_uid="catalog_meal_saved")
+def _catalog_meal_saved(sender, instance: Meal, **kwargs):
+    transaction.on_commit(partial(catalog_index.refresh_meals, [instance.pk]))
+
+
+@receiver(post_delete, sender=Meal, dispatch_uid="catalog_meal_deleted")
+def _catalog_meal_deleted(sender, instance: Meal, **kwargs):
+    transaction.on_commit(partial(catalog_index.remove_meal, instance.pk))
+
+
+@receiver(post_save, sender=Restaurant, dispatch_uid="catalog_restaurant_saved")
+def _catalog_restaurant_saved(sender, instance: Restaurant, created: bool = False, **kwargs):
+    if created:
+        return
+    transaction.on_commit(partial(catalog_index.refresh_restaurant, instance.pk))
+
+
+@receiver(post_save, sender=Favorite, dispatch_uid="catalog_favorite_saved")
+def _catalog_favorite_saved(sender, instance: Favorite, created: bool = False, **kwargs):
+    if created:
+        transaction.on_commit(partial(catalog_index.adjust_favorites, instance.meal_id, 1))
+
+
+@receiver(post_delete, sender=Favorite, dispatch_uid="catalog_favorite_deleted")
+def _catalog_favorite_deleted(sender, instance: Favorite, **kwargs):
+    transaction.on_commit(partial(catalog_index.adjust_favorites, instance.meal_id, -1))
+
+
+@receiver(post_delete, sender=Meal, dispatch_uid="dietary_meal_deleted")
+@receiver(post_save, sender=MealTag, dispatch_uid="dietary_meal_tag_saved")
+@receiver(post_delete, sender=MealTag, dispatch_uid="dietary_meal_tag_deleted")
+@receiver(post_save, sender=MealComponent, dispatch_uid="dietary_component_saved")
+@receiver(post_delete, sender=MealComponent, dispatch_uid="dietary_component_deleted")
+def _dietary_meal_changed(sender, instance, **kwargs):
+    meal_id = instance.pk if sender is Meal else instance.meal_id
+    if meal_id:
+        transaction.on_commit(partial(dietary_index.refresh_meals, [meal_id]))
+        if sender is not Meal:
+            invalidate_rankings()
+
+
+@receiver(m2m_changed, sender=Meal.tags.through, dispatch_uid="dietary_meal_tags_changed")
+def _dietary_meal_tags_changed(sender, instance, action: str, reverse: bool, pk_set=None, **kwargs):
+    if action not in {"post_add", "post_remove", "post_clear"}:
+        return
+    if not reverse:
+        transaction.on_commit(partial(dietary_index.refresh_meals, [instance.pk]))
+    elif pk_set:
+        transaction.on_commit(partial(dietary_index.refresh_meals, sorted(pk_set)))
+    else:
+        transaction.on_commit(dietary_index.invalidate)
+    invalidate_rankings()
+
+
+@receiver(post_save, sender=Tag, dispatch_uid="dietary_tag_saved")
+@receiver(post_delete, sender=Tag, dispatch_uid="dietary_tag_deleted")
+def _dietary_tag_changed(sender, **kwargs):
+    dietary_index.invalidate()
+    transaction.on_commit(dietary_index.invalidate)
+    invalidate_rankings()
+
+
+@receiver(post_save, sender=RecommendationHistory, dispatch_uid="exclusions_history_saved")
+def _exclusions_history_saved(sender, instance: RecommendationHistory, **kwargs):
+    if instance.was_selected:
+        invalidate_user_exclusions(instance.user_id)
+
+
+@receiver(post_save, sender=Favorite, dispatch_uid="exclusions_favorite_saved")
+@receiver(post_delete, sender=Favorite, dispatch_uid="exclusions_favorite_deleted")
+@receiver(post_save, sender=Review, dispatch_uid="exclusions_review_saved")
+@receiver(post_delete, sender=Review, dispatch_uid="exclusions_review_deleted")
+def _exclusions_seen_changed(sender, instance, **kwargs):
+    invalidate_user_exclusions(instance.user_id)
+
+
+@receiver(post_save, sender=UserPreference, dispatch_uid="exclusions_preference_saved")
+def _exclusions_preference_saved(sender, instance: UserPreference, **kwargs):
+    invalidate_user_exclusions(instance.user_id)
+
+
+@receiver(post_save, sender=Meal, dispatch_uid="rankings_meal_saved")
+@receiver(post_delete, sender=Meal, dispatch_uid="rankings_meal_deleted")
+@receiver(post_save, sender=Restaurant, dispatch_uid="rankings_restaurant_saved")
+@receiver(post_delete, sender=Restaurant, dispatch_uid="rankings_restaurant_deleted")
+def _rankings_catalog_changed(sender, **kwargs):
+    invalidate_rankings()
+
+
+@receiver(post_save, sender=Favorite, dispatch_uid="rankings_favorite_saved")
+@receiver(post_delete, sender=Favorite, dispatch_uid="rankings_favorite_deleted")
+def _rankings_favorites_changed(sender, **kwargs):
+    invalidate_favorite_rankings()
+
+
+@receiver(post_save, sender=UserPreference, dispatch_uid="slates_preference_saved")
+def _slates_preference_saved(sender, instance: UserPreference, **kwargs):
+    schedule_slate_refresh(instance.user_id, discard=True)
+
+
+@receiver(post_save, sender=Meal, dispatch_uid="search_meal_saved")
+@receiver(post_delete, sender=Meal, dispatch_uid="search_meal_deleted")
+def _search_meal_changed(sender, instance: Meal, **kwargs):
+    transaction.on_commit(partial(search_index.refresh, "meal", [instance.pk]))
+
+
+@receiver(post_save, sender=Restaurant, dispatch_uid="search_restaurant_saved")
+@receiver(post_delete, sender=Restaurant, dispatch_uid="search_restaurant_deleted")
+def _search_restaurant_changed(sender, instance: Restaurant, **kwargs):
+    transaction.on_commit(partial(search_index.refresh, "restaurant", [instance.pk]))
+
+
+@receiver(post_save, sender=Meal, dispatch_uid="autocomplete_meal_saved")
+@receiver(post_delete, sender=Meal, dispatch_uid="autocomplete_meal_deleted")
+def _autocomplete_meal_changed(sender, instance: Meal, **kwargs):
+    transaction.on_commit(partial(autocomplete_index.refresh_meals, [instance.pk]))
+
+
+@receiver(post_save, sender=Restaurant, dispatch_uid="autocomplete_restaurant_saved")
+@receiver(post_delete, sender=Restaurant, dispatch_uid="autocomplete_restaurant_deleted")
+def _autocomplete_restaurant_changed(sender, instance: Restaurant, **kwargs):
+    transaction.on_commit(partial(autocomplete_index.refresh_restaurant, instance.pk))
@@ -0,0 +1,146 @@
+"""Offline item-to-item similarity from co-favorites and co-reviews.
+
+The batch job (``build_meal_similarity``) computes cosine similarity between
+meal columns of a binary user×meal matrix with sparse products and keeps the
+top-K neighbors per meal in :class:`MealSimilarity`. Request-time callers
+only read those rows by key.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+from scipy import sparse
+
+from MerchantSideApp.models import Meal
+from UserSideApp.models import Favorite, Review
+
+from .models import MealSimilarity
+
+
+# Reviews below this rating do not count as liking the meal.
+MIN_POSITIVE_RATING = 3
+
+
+def _liked_pairs() -> Iterable[Tuple[int, int]]:
+    yield from Favorite.objects.values_list("user_id", "meal_id").iterator()
+    yield from (
+        Review.objects.filter(rating__gte=MIN_POSITIVE_RATING)
+        .values_list("user_id", "meal_id")
+        .iterator()
+    )
+
+
+def build_like_matrix(pairs: Optional[Iterable[Tuple[int, int]]] = None) -> Tuple[sparse.csc_matrix, np.ndarray]:
+    """Binary user×meal matrix (CSC) plus the meal id of each column."""
+    users: List[int] = []
+    meals: List[int] = []
+    for user_id, meal_id in pairs if pairs is not None else _liked_pairs():
+        users.append(user_id)
+        meals.append(meal_id)
+    _, user_index = np.unique(np.array(users, dtype=np.int64), return_inverse=True)
+    meal_ids, meal_index = np.unique(np.array(meals, dtype=np.int64), return_inverse=True)
+    matrix = sparse.coo_matrix(
+        (np.ones(len(users), dtype=np.float32), (user_index, meal_index)),
+        shape=(int(user_index.max()) + 1 if users else 0, meal_ids.size),
+    ).tocsc()
+    matrix.data[:] = 1.0  # a favorite plus a review still counts once
+    return matrix, meal_ids
+
+
+def top_k_neighbors(
+    matrix: sparse.csc_matrix,
+    top_k: int = 20,
+    min_support: int = 1,
+    block_size: int = 1000,
+) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+    """Cosine top-K neighbors per column, computed one column block at a time.
+
+    ``min_support`` is the minimum number of users two meals must share.
+    Returns ``{column: (neighbor_columns, scores)}`` sorted best first.
+    """
+    n_items = matrix.shape[1]
+    counts = np.asarray(matrix.sum(axis=0)).ravel()
+    norms = np.sqrt(np.maximum(counts, 1.0))
+    matrix_t = matrix.T.tocsr()
+    neighbors: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+    for start in range(0, n_items, block_size):
+        stop = min(start + block_size, n_items)
+        co_counts = (matrix_t[start:stop] @ matrix).tocsr()
+        for offset in range(stop - start):
+            column = start + offset
+            row_start, row_end = co_counts.indptr[offset], co_counts.indptr[offset + 1]
+            cols = co_counts.indices[row_start:row_end]
+            shared = co_counts.data[row_start:row_end]
+            keep = (cols != column) & (shared >= min_support)
+            cols, shared = cols[keep], shared[keep]
+            if not cols.size:
+                continue
+            scores = shared / (norms[column] * norms[cols])
+            if cols.size > top_k:
+                best = np.argpartition(-scores, top_k - 1)[:top_k]
+                cols, scores = cols[best], scores[best]
+            order = np.lexsort((cols, -scores))
+            neighbors[column] = (cols[order], scores[order])
+    return neighbors
+
+
+def store_neighbors(
+    neighbors: Dict[int, Tuple[np.ndarray, np.ndarray]],
+    meal_ids: np.ndarray,
+    batch_size: int = 1000,
+) -> int:
+    """Replace the similarity table with the freshly computed neighbors."""
+    rows = [
+        MealSimilarity(
+            meal_id=int(meal_ids[column]),
+            neighbor_id=int(meal_ids[neighbor]),
+            rank=rank,
+            score=round(float(score), 6),
+        )
+        for column, (cols, scores) in neighbors.items()
+        for rank, (neighbor, score) in enumerate(zip(cols, scores), start=1)
+    ]
+    with transaction.atomic():
+        MealSimilarity.objects.all().delete()
+        MealSimilarity.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def rebuild_meal_similarity(top_k: int = 20, min_support: int = 1, block_size: int = 1000) -> Tuple[int, int]:
+    """Full batch run; returns ``(meals_with_neighbors, rows_written)``."""
+    matrix, meal_ids = build_like_matrix()
+    if not matrix.nnz:
+        return 0, store_neighbors({}, meal_ids)
+    neighbors = top_k_neighbors(matrix, top_k=top_k, min_support=min_support, block_size=block_size)
+    return len(neighbors), store_neighbors(neighbors, meal_ids)
+
+
+def similar_meals(meal, limit: int = 4):
+    """Available neighbors of ``meal`` best first, via one indexed join."""
+    return list(
+        Meal.objects.filter(
+            neighbor_of__meal=meal,
+            is_recommendable=True,
+        )
+        .select_related("restaurant")
+        .order_by("neighbor_of__rank")[:limit]
+    )
+
+
+def neighbors_of(meal_ids: List[int], limit: int) -> List[int]:
+    """Neighbors of several seed meals ranked by summed similarity, seeds excluded."""
+    if not meal_ids:
+        return []
+    ranked = (
+        MealSimilarity.objects.filter(meal_id__in=meal_ids)
+        .exclude(neighbor_id__in=meal_ids)
+        .values("neighbor_id")
+        .annotate(total=Sum("score"))
+        .order_by("-total", "neighbor_id")
+        .values_list("neighbor_id", flat=True)
+    )
+    return list(ranked[:limit])
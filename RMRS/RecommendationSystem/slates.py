@@ -0,0 +1,187 @@
+"""Precomputed default recommendation pages ("slates") per user.
+
+``build_recommendation_slates`` runs the engine's default strategy for
+every (recently) active user across a process pool and stores the meal ids
+and section reasons in :class:`RecommendationSlate`. A single user's slate
+is rebuilt in a background thread after login or a preference change. The
+random-recommendation views serve a fresh slate with one row read plus one
+hydration query, and compute the page live when there is none.
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+from UserSideApp.models import AppUser, DailyMealRecord, Favorite
+from UserSideApp.services import RecommendationEngine, RecommendationPage
+
+from .catalog import CatalogColumns
+from .models import RecommendationHistory, RecommendationSlate
+
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def slates_enabled() -> bool:
+    return bool(getattr(settings, "RECOMMENDATION_SLATES", False))
+
+
+def slate_max_age() -> int:
+    return int(getattr(settings, "RECOMMENDATION_SLATE_MAX_AGE", 36 * 3600))
+
+
+def compute_slate(user: AppUser, pool: Optional[CatalogColumns] = None) -> RecommendationSlate:
+    """Run the default ("preferences") strategy for ``user`` without saving.
+
+    ``pool`` is a shared candidate pool to start from instead of loading one.
+    """
+    engine = RecommendationEngine(user, pool=pool)
+    filters = engine.filters_from_preferences(getattr(user, "preferences", None))
+    page = engine.build_page("preferences", filters)
+    return RecommendationSlate(
+        user=user,
+        primary_ids=[meal.pk for meal in page.primary],
+        primary_source=page.primary_source or "",
+        sections=[
+            {
+                "key": section.key,
+                "title": section.title,
+                "subtitle": section.subtitle,
+                "meal_ids": [meal.pk for meal in section.meals],
+            }
+            for section in page.sections
+        ],
+        generated_at=timezone.now(),
+    )
+
+
+def store_slates(slates: List[RecommendationSlate]) -> int:
+    RecommendationSlate.objects.bulk_create(
+        slates,
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=["primary_ids", "primary_source", "sections", "generated_at"],
+    )
+    return len(slates)
+
+
+def build_slates(user_ids: Iterable[int], batch_size: int = 200) -> int:
+    """Compute and upsert slates for ``user_ids`` in batches; returns how many were stored."""
+    user_ids = list(user_ids)
+    stored = 0
+    for start in range(0, len(user_ids), batch_size):
+        users = AppUser.objects.filter(pk__in=user_ids[start:start + batch_size]).select_related("preferences")
+        # One user-independent pool per batch; each engine only adds its user's own candidates.
+        pool = RecommendationEngine().candidate_pool()
+        stored += store_slates([compute_slate(user, pool) for user in users])
+    return stored
+
+
+def _init_worker() -> None:
+    import django
+
+    django.setup()
+    connections.close_all()
+
+
+def _build_chunk(user_ids: List[int]) -> int:
+    try:
+        return build_slates(user_ids)
+    finally:
+        connections.close_all()
+
+
+def rebuild_slates(user_ids: Iterable[int], processes: int = 1, chunk_size: int = 200) -> int:
+    """Build slates for ``user_ids``, spreading chunks over ``processes`` worker processes."""
+    user_ids = list(user_ids)
+    if processes <= 1 or len(user_ids) <= chunk_size:
+        return build_slates(user_ids, chunk_size)
+    chunks = [user_ids[start:start + chunk_size] for start in range(0, len(user_ids), chunk_size)]
+    # Children must not share the parent's database sockets.
+    connections.close_all()
+    context = multiprocessing.get_context(
+        "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    )
+    with context.Pool(processes, initializer=_init_worker) as pool:
+        return sum(pool.imap_unordered(_build_chunk, chunks))
+
+
+def active_user_ids(days: Optional[int] = None) -> List[int]:
+    """All users, or those with history, favorites or meal records in the last ``days`` days."""
+    if not days:
+        return list(AppUser.objects.order_by("pk").values_list("pk", flat=True))
+    since = timezone.now() - timedelta(days=days)
+    active = (
+        RecommendationHistory.objects.filter(recommended_at__gte=since, user__isnull=False)
+        .values_list("user_id", flat=True)
+        .union(
+            Favorite.objects.filter(created_at__gte=since).values_list("user_id", flat=True),
+            DailyMealRecord.objects.filter(date__gte=since.date()).values_list("user_id", flat=True),
+        )
+    )
+    return sorted(set(active))
+
+
+def prune_slates(keep_user_ids: Iterable[int]) -> int:
+    """Delete slates of users outside ``keep_user_ids``."""
+    deleted, _ = RecommendationSlate.objects.exclude(user_id__in=list(keep_user_ids)).delete()
+    return deleted
+
+
+def fresh_slate_page(engine: RecommendationEngine) -> Optional[RecommendationPage]:
+    """The user's stored default page if slates are on and it is fresh enough."""
+    user_id = getattr(engine.user, "pk", None)
+    if not user_id or not slates_enabled():
+        return None
+    cutoff = timezone.now() - timedelta(seconds=slate_max_age())
+    row = (
+        RecommendationSlate.objects.filter(user_id=user_id, generated_at__gte=cutoff)
+        .values_list("primary_ids", "primary_source", "sections")
+        .first()
+    )
+    if row is None:
+        return None
+    page = engine.page_from_ids(*row)
+    if not page.primary:
+        return None
+    return page
+
+
+def _refresh_user_slate(user_id: int) -> None:
+    try:
+        build_slates([user_id])
+    except Exception:  # pragma: no cover - logged, the live page still works
+        logger.exception("Rebuilding the recommendation slate for user %s failed", user_id)
+    finally:
+        close_old_connections()
+
+
+def _submit(user_id: int) -> None:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="recommendation-slates")
+    _executor.submit(_refresh_user_slate, user_id)
+
+
+def schedule_slate_refresh(user_id: Optional[int], discard: bool = False) -> None:
+    """Rebuild one user's slate off the request thread once the transaction commits.
+
+    ``discard`` deletes the current slate first, for changes (such as new
+    preferences) that make it wrong rather than merely old.
+    """
+    if not user_id or not slates_enabled():
+        return
+    if discard:
+        RecommendationSlate.objects.filter(user_id=user_id).delete()
+    transaction.on_commit(partial(_submit, user_id))
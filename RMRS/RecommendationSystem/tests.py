@@ -1,17 +1,61 @@
+import gzip
+import json
+import random
+import shutil
+import tempfile
 from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-from django.test import TestCase
+import numpy as np
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.utils import timezone
 
-from MerchantSideApp.models import Meal, Restaurant
-from RecommendationSystem.models import RecommendationHistory
-from RecommendationSystem.services import record_user_choice, recent_selected_meal_ids
-from UserSideApp.models import AppUser, UserPreference
+from MerchantSideApp import taxonomy
+from MerchantSideApp.geo import haversine_km
+from MerchantSideApp.models import Allergen, Meal, MealAllergen, NutritionInfo, Restaurant, Tag
+from MerchantSideApp.views.utils import _persist_meal_nutrition
+from RecommendationSystem.autocomplete import HEAD_LENGTH, autocomplete_index
+from RecommendationSystem.catalog import catalog_index
+from RecommendationSystem.collaborative import build_interaction_matrix
+from RecommendationSystem.dietary import bitset_contains, bitset_ids, dietary_index, to_bitset
+from RecommendationSystem.fulltext import TextIndex, _phrase, keyword_search, runs, search_backend, search_index, tokens
+from RecommendationSystem.exclusions import cooldown_meal_ids, get_user_exclusions, invalidate_user_exclusions
+from RecommendationSystem.impressions import ImpressionBuffer, impression_buffer
+from RecommendationSystem.models import (
+	MealSimilarity,
+	PersonalizedRecommendation,
+	RecommendationDailyStat,
+	RecommendationHistory,
+	RecommendationSlate,
+)
+from RecommendationSystem.nutrition import meal_target, nutrition_matrix
+from RecommendationSystem.replay import point_in_time, replay
+from RecommendationSystem.retention import archive_history
+from RecommendationSystem.result_cache import catalog_version, filters_digest, result_cache_stats
+from RecommendationSystem.sampling import sample_queryset
+from RecommendationSystem.services import (
+	adjust_favorite_count,
+	recent_selected_meal_ids,
+	reconcile_favorite_counts,
+	record_user_choice,
+)
+from RecommendationSystem.similarity import similar_meals
+from RecommendationSystem.slates import build_slates, fresh_slate_page
+from UserSideApp.auth_utils import SESSION_USER_KEY
+from UserSideApp.models import AppUser, DailyMealRecord, Favorite, MealComponent, Review, UserPreference
 from UserSideApp.services import RecommendationEngine, RecommendationFilters
 
 
 class RecommendationHistoryTests(TestCase):
 	def setUp(self):
+		cache.clear()
 		self.user = AppUser.objects.create(
 			username="history-user",
 			email="history@example.com",
@@ -88,3 +132,1168 @@ class RecommendationHistoryTests(TestCase):
 		preference.save()
 		again_results = RecommendationEngine(self.user).apply_filters(filters)
 		self.assertIn(self.meal, again_results)
+
+
+@override_settings(RECOMMENDATION_CATALOG_INDEX=True)
+class CatalogIndexTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		catalog_index.invalidate()
+		self.addCleanup(catalog_index.invalidate)
+		self.user = AppUser.objects.create(
+			username="catalog-user",
+			email="catalog@example.com",
+			password_hash="dummy",
+		)
+		self.cheap = Restaurant.objects.create(
+			name="平價小館",
+			cuisine_type="台式料理",
+			city="台北市",
+			district="信義區",
+			price_range=Restaurant.PriceRange.LOW,
+			rating=4.5,
+		)
+		self.fancy = Restaurant.objects.create(
+			name="高級餐廳",
+			cuisine_type="日式",
+			city="台中市",
+			price_range=Restaurant.PriceRange.HIGH,
+			rating=4.8,
+		)
+		self.veggie = Meal.objects.create(
+			restaurant=self.cheap,
+			name="素食便當",
+			category="主食",
+			is_vegetarian=True,
+		)
+		self.spicy = Meal.objects.create(
+			restaurant=self.cheap,
+			name="麻辣鍋",
+			category="鍋物",
+			is_spicy=True,
+		)
+		self.sushi = Meal.objects.create(
+			restaurant=self.fancy,
+			name="握壽司",
+			category="主食",
+		)
+
+	def test_filters_match_database_results(self):
+		engine = RecommendationEngine(self.user)
+		cases = [
+			RecommendationFilters(limit=5),
+			RecommendationFilters(cuisine_type="台式", limit=5),
+			RecommendationFilters(category="主食", limit=5),
+			RecommendationFilters(city="台北", district="信義", limit=5),
+			RecommendationFilters(price_range=Restaurant.PriceRange.HIGH, limit=5),
+			RecommendationFilters(is_vegetarian=True, avoid_spicy=True, limit=5),
+		]
+		for filters in cases:
+			indexed = engine.apply_filters(filters)
+			with self.settings(RECOMMENDATION_CATALOG_INDEX=False):
+				expected = RecommendationEngine(self.user).apply_filters(filters)
+			self.assertEqual([meal.pk for meal in indexed], [meal.pk for meal in expected])
+
+	def test_candidate_stage_runs_no_queries(self):
+		engine = RecommendationEngine(self.user)
+		engine.apply_filters(RecommendationFilters(limit=1))
+		with self.assertNumQueries(1):
+			meals = engine.budget_friendly(4)
+		self.assertEqual({meal.pk for meal in meals}, {self.veggie.pk, self.spicy.pk})
+		with self.assertNumQueries(1):
+			self.assertEqual(engine.mild_flavor(1), [self.sushi])
+
+	def test_index_tracks_saves_and_favorites(self):
+		engine = RecommendationEngine(self.user)
+		self.assertEqual(engine.vegetarian_spotlight(4), [self.veggie])
+		with self.captureOnCommitCallbacks(execute=True):
+			self.sushi.is_vegetarian = True
+			self.sushi.save()
+			Favorite.objects.create(user=self.user, meal=self.spicy)
+		self.assertEqual(engine.vegetarian_spotlight(4), [self.sushi, self.veggie])
+		popular = engine.popular_meals(1)
+		self.assertEqual(popular, [self.spicy])
+		self.assertEqual(popular[0].favorite_count, 1)
+		with self.captureOnCommitCallbacks(execute=True):
+			self.fancy.is_active = False
+			self.fancy.save()
+		self.assertEqual(engine.vegetarian_spotlight(4), [self.veggie])
+
+	def test_updates_leave_held_snapshots_untouched(self):
+		snapshot = catalog_index.columns()
+		favorites = snapshot.favorite_count.copy()
+		vegetarian = snapshot.is_vegetarian.copy()
+		with self.captureOnCommitCallbacks(execute=True):
+			self.sushi.is_vegetarian = True
+			self.sushi.save()
+			Favorite.objects.create(user=self.user, meal=self.spicy)
+		self.assertIsNot(catalog_index.columns(), snapshot)
+		self.assertTrue(np.array_equal(snapshot.favorite_count, favorites))
+		self.assertTrue(np.array_equal(snapshot.is_vegetarian, vegetarian))
+		self.assertEqual(catalog_index.columns().favorite_counts([self.spicy.pk]), {self.spicy.pk: 1})
+
+	def test_index_respects_cooldown(self):
+		record_user_choice(self.user, self.veggie)
+		results = RecommendationEngine(self.user).apply_filters(RecommendationFilters(limit=5))
+		self.assertNotIn(self.veggie, results)
+		self.assertIn(self.sushi, results)
+
+
+class DietaryIndexTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		catalog_index.invalidate()
+		dietary_index.invalidate()
+		self.addCleanup(catalog_index.invalidate)
+		self.addCleanup(dietary_index.invalidate)
+		self.user = AppUser.objects.create(
+			username="dietary-user",
+			email="dietary@example.com",
+			password_hash="dummy",
+		)
+		restaurant = Restaurant.objects.create(name="標籤餐廳", rating=4.0)
+		self.low_carb, self.protein = Tag.objects.create(name="低醣"), Tag.objects.create(name="高蛋白")
+		self.salad = Meal.objects.create(restaurant=restaurant, name="雞胸沙拉")
+		self.salad.tags.add(self.low_carb, self.protein)
+		self.noodles = Meal.objects.create(restaurant=restaurant, name="花生涼麵")
+		self.noodles.tags.add(self.protein)
+		MealComponent.objects.create(meal=self.noodles, name="花生醬", metadata={"allergens": ["花生"]})
+		self.rice = Meal.objects.create(restaurant=restaurant, name="白飯")
+
+	def test_bitset_helpers(self):
+		bitset = to_bitset([3, 70, 3])
+		self.assertEqual(bitset_ids(bitset).tolist(), [3, 70])
+		self.assertEqual(bitset_contains(bitset, np.array([3, 4, 70, 500])).tolist(), [True, False, True, False])
+		self.assertEqual(to_bitset([]), 0)
+
+	def test_filters_match_database_results(self):
+		engine = RecommendationEngine(self.user)
+		data = {"include_tags": "高蛋白", "exclude_allergens": "ＰＥＡＮＵＴ, 花生"}
+		cases = [
+			RecommendationFilters(include_tags=("高蛋白",), limit=5),
+			RecommendationFilters(include_tags=("高蛋白", "低醣"), limit=5),
+			RecommendationFilters(include_tags=("不存在",), limit=5),
+			RecommendationFilters(exclude_allergens=("花生",), limit=5),
+			engine.filters_from_data(data, 5),
+		]
+		expected_ids = [
+			{self.salad.pk, self.noodles.pk},
+			{self.salad.pk},
+			set(),
+			{self.salad.pk, self.rice.pk},
+			{self.salad.pk},
+		]
+		for filters, expected in zip(cases, expected_ids):
+			indexed = engine.apply_filters(filters)
+			with self.settings(RECOMMENDATION_CATALOG_INDEX=False):
+				from_db = RecommendationEngine(self.user).apply_filters(filters)
+			self.assertEqual({meal.pk for meal in indexed}, expected)
+			self.assertEqual([meal.pk for meal in indexed], [meal.pk for meal in from_db])
+
+	def test_postings_follow_tag_and_component_changes(self):
+		selection = lambda: dietary_index.selection(("低醣",), ("花生",))
+		self.assertEqual(bitset_ids(selection().include).tolist(), [self.salad.pk])
+		with self.captureOnCommitCallbacks(execute=True):
+			self.rice.tags.add(self.low_carb)
+			MealComponent.objects.create(meal=self.salad, name="花生粉", metadata={"allergens": "花生"})
+		mask = selection().mask(np.array([self.salad.pk, self.noodles.pk, self.rice.pk]))
+		self.assertEqual(mask.tolist(), [False, False, True])
+		self.assertIsNone(dietary_index.selection())
+
+	def test_allergen_filter_ignores_stale_process_state(self):
+		filters = RecommendationFilters(exclude_allergens=("芝麻",), limit=5)
+		engine = RecommendationEngine(self.user)
+		self.assertIn(self.rice, engine.apply_filters(filters))
+		taxonomy.allergen_ids("芝麻")
+		# Written elsewhere: no save() signals reach this process's caches and postings.
+		sesame = Allergen.objects.bulk_create([Allergen(name="芝麻", key="芝麻")])[0]
+		MealAllergen.objects.bulk_create([MealAllergen(meal=self.rice, allergen=sesame)])
+		for catalog_index_enabled in (True, False):
+			with self.settings(RECOMMENDATION_CATALOG_INDEX=catalog_index_enabled):
+				self.assertNotIn(self.rice, RecommendationEngine(self.user).apply_filters(filters))
+				page = RecommendationEngine(self.user).build_primary("filters", filters)
+				self.assertNotIn(self.rice, page.primary)
+
+
+class SearchIndexTests(TestCase):
+	def setUp(self):
+		search_index.invalidate()
+		self.addCleanup(search_index.invalidate)
+		self.restaurant = Restaurant.objects.create(name="麵屋一燈", address="台北市中山區", cuisine_type="日式拉麵")
+		self.ramen = Meal.objects.create(restaurant=self.restaurant, name="濃厚魚介沾麵", description="豚骨魚介湯頭")
+		self.other = Restaurant.objects.create(name="巷口小吃", cuisine_type="台式")
+		self.rice = Meal.objects.create(restaurant=self.other, name="滷肉飯", description="")
+
+	def test_tokens_fold_width_and_case(self):
+		self.assertEqual(runs("ＡＢＣ拉麵, Ramen!"), ["abc拉麵", "ramen"])
+		self.assertEqual(tokens("拉麵", unigrams=False), ["拉麵"])
+		self.assertEqual(sorted(tokens("拉麵")), ["拉", "拉麵", "麵"])
+
+	def test_text_index_ranks_by_bm25_and_tracks_removals(self):
+		index = TextIndex()
+		index.upsert(1, "牛肉麵 牛肉 牛肉")
+		index.upsert(2, "紅燒牛肉麵加上很多很多其他的配料與小菜")
+		index.upsert(3, "牛 肉")
+		scores = index.search("牛肉")
+		self.assertEqual(set(scores), {1, 2})
+		self.assertGreater(scores[1], scores[2])
+		self.assertEqual(set(index.search("牛")), {1, 2, 3})
+		index.remove(1)
+		index.upsert(2, "炒飯")
+		self.assertEqual(index.search("牛肉"), {})
+		self.assertEqual(len(index), 2)
+
+	def test_scores_match_across_restaurants_and_meals(self):
+		self.assertEqual(set(search_index.scores("restaurant", "沾麵")), {self.restaurant.pk})
+		self.assertEqual(set(search_index.scores("meal", "一燈")), {self.ramen.pk})
+		self.assertEqual(search_index.scores("meal", "不存在"), {})
+
+	def test_saves_and_deletes_update_loaded_index(self):
+		self.assertEqual(set(search_index.scores("meal", "滷肉")), {self.rice.pk})
+		with self.captureOnCommitCallbacks(execute=True):
+			self.rice.name = "雞肉飯"
+			self.rice.save()
+			Meal.objects.create(restaurant=self.restaurant, name="滷肉拉麵")
+			self.other.name = "巷口雞肉"
+			self.other.save()
+		self.assertEqual(
+			{Meal.objects.get(pk=pk).name for pk in search_index.scores("meal", "滷肉")},
+			{"滷肉拉麵"},
+		)
+		self.assertEqual(set(search_index.scores("restaurant", "雞肉")), {self.other.pk})
+		with self.captureOnCommitCallbacks(execute=True):
+			self.other.delete()
+		self.assertEqual(search_index.scores("meal", "雞肉"), {})
+
+	def test_mysql_backend_matches_short_runs_with_like(self):
+		self.assertEqual(_phrase("拉麵 丼"), '+"拉麵"')
+		with self.settings(RECOMMENDATION_SEARCH_BACKEND="mysql"):
+			meals = keyword_search(Meal.objects.all(), "meal", "燈")
+			restaurants = keyword_search(Restaurant.objects.all(), "restaurant", "介")
+			self.assertEqual(list(meals), [self.ramen])
+			self.assertEqual(list(restaurants), [self.restaurant])
+		self.assertIn("UNION", str(meals.query))
+
+	def test_auto_backend_skips_servers_without_ngram_parser(self):
+		servers = {
+			(False, (8, 0, 36)): "mysql",
+			(False, (5, 7, 5)): "index",
+			(True, (10, 11, 6)): "index",
+		}
+		for (mariadb, version), expected in servers.items():
+			server = mock.Mock(vendor="mysql", mysql_is_mariadb=mariadb, mysql_version=version)
+			with self.subTest(mariadb=mariadb, version=version), mock.patch("RecommendationSystem.fulltext.connection", server):
+				self.assertEqual(search_backend(), expected)
+
+
+class AutocompleteIndexTests(TestCase):
+	def setUp(self):
+		autocomplete_index.invalidate()
+		self.addCleanup(autocomplete_index.invalidate)
+		self.mos = Restaurant.objects.create(name="ＭＯＳ Burger", city="臺北市", district="信義區", cuisine_type="美式", rating=4.2)
+		self.mister = Restaurant.objects.create(name="Mister Donut", city="台北市", district="大安區", cuisine_type="美式", rating=4.6)
+		self.closed = Restaurant.objects.create(name="Moonlight", cuisine_type="日式", rating=5.0, is_active=False)
+		self.burger = Meal.objects.create(restaurant=self.mos, name="摩斯漢堡")
+		self.rice_burger = Meal.objects.create(restaurant=self.mos, name="摩斯米漢堡")
+		Meal.objects.filter(pk=self.rice_burger.pk).update(favorite_count=5)
+
+	def labels(self, query, kinds=("restaurant",), limit=8):
+		return [suggestion.label for suggestion in autocomplete_index.suggest(query, kinds, limit)]
+
+	def test_prefix_matching_folds_width_case_and_ranks_by_rating(self):
+		self.assertEqual(self.labels("m"), ["Mister Donut", "ＭＯＳ Burger"])
+		self.assertEqual(self.labels("ｍｏ"), ["ＭＯＳ Burger"])
+		self.assertEqual(self.labels("mos bur"), ["ＭＯＳ Burger"])
+		self.assertEqual(self.labels("m", limit=1), ["Mister Donut"])
+		self.assertEqual(self.labels("摩斯", kinds=("meal",)), ["摩斯米漢堡", "摩斯漢堡"])
+		self.assertEqual(self.labels("   "), [])
+
+	def test_short_prefix_heads_match_range_scan(self):
+		index = autocomplete_index._loaded()["restaurant"]
+		for prefix in ("m", "mi", "mo", "z"):
+			self.assertLessEqual(len(prefix), HEAD_LENGTH)
+			self.assertEqual(index.search(prefix, 8), [index.items[i] for i in index._top(index._range(prefix), 8)])
+
+	def test_cuisine_and_district_suggestions_count_open_restaurants(self):
+		suggestions = autocomplete_index.suggest("美", ("cuisine",))
+		self.assertEqual([(s.label, s.rank) for s in suggestions], [("美式", (2,))])
+		self.assertEqual(autocomplete_index.suggest("日", ("cuisine",)), [])
+		self.assertEqual(self.labels("臺北", kinds=("district",)), [])
+		self.assertEqual({s.detail for s in autocomplete_index.suggest("信義", ("district",))}, {"臺北市"})
+
+	def test_saves_update_loaded_index(self):
+		self.assertEqual(self.labels("m"), ["Mister Donut", "ＭＯＳ Burger"])
+		with self.captureOnCommitCallbacks(execute=True):
+			self.mos.is_active = False
+			self.mos.save()
+			self.closed.is_active = True
+			self.closed.save()
+			Meal.objects.create(restaurant=self.mister, name="摩斯風甜甜圈")
+		self.assertEqual(self.labels("m"), ["Moonlight", "Mister Donut"])
+		self.assertEqual(self.labels("摩斯", kinds=("meal",)), ["摩斯風甜甜圈"])
+		with self.captureOnCommitCallbacks(execute=True):
+			self.mister.delete()
+		self.assertEqual(self.labels("m"), ["Moonlight"])
+		self.assertEqual(self.labels("摩", kinds=("meal",)), [])
+		self.assertEqual(self.labels("日", kinds=("cuisine",)), ["日式"])
+
+
+class RandomSamplingTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = AppUser.objects.create(
+			username="sampling-user",
+			email="sampling@example.com",
+			password_hash="dummy",
+		)
+		self.restaurant = Restaurant.objects.create(name="抽樣餐廳")
+		self.closed = Restaurant.objects.create(name="休息餐廳", is_active=False)
+		self.meals = [
+			Meal.objects.create(restaurant=self.restaurant, name=f"餐點 {index}")
+			for index in range(30)
+		]
+		Meal.objects.create(restaurant=self.closed, name="不供應")
+		Meal.objects.create(restaurant=self.restaurant, name="下架", is_available=False)
+
+	def test_sample_returns_distinct_available_meals(self):
+		qs = Meal.objects.filter(is_available=True, restaurant__is_active=True)
+		sample = sample_queryset(qs, 6, rng=random.Random(7))
+		self.assertEqual(len(sample), 6)
+		self.assertEqual(len({meal.pk for meal in sample}), 6)
+		self.assertTrue(set(sample) <= set(self.meals))
+
+	def test_sample_falls_back_when_candidates_are_sparse(self):
+		qs = Meal.objects.filter(pk__in=[self.meals[0].pk, self.meals[-1].pk])
+		sample = sample_queryset(qs, 5, max_rounds=1, rng=random.Random(1))
+		self.assertEqual({meal.pk for meal in sample}, {self.meals[0].pk, self.meals[-1].pk})
+
+	def test_random_meals_honor_cooldown(self):
+		for meal in self.meals[:27]:
+			record_user_choice(self.user, meal)
+		picked = RecommendationEngine(self.user).random_meals(6)
+		self.assertEqual(set(picked), set(self.meals[27:]))
+
+
+class RecommendationPageTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		nutrition_matrix.invalidate()
+		self.user = AppUser.objects.create(
+			username="page-user",
+			email="page@example.com",
+			password_hash="dummy",
+		)
+		self.cheap = Restaurant.objects.create(
+			name="平價小館",
+			price_range=Restaurant.PriceRange.LOW,
+			rating=4.2,
+		)
+		self.fancy = Restaurant.objects.create(
+			name="高級餐廳",
+			price_range=Restaurant.PriceRange.HIGH,
+			rating=4.8,
+		)
+		self.meals = [
+			Meal.objects.create(
+				restaurant=self.cheap if index % 2 else self.fancy,
+				name=f"頁面餐點 {index}",
+				category="主食",
+				is_vegetarian=index % 3 == 0,
+				is_spicy=index % 4 == 0,
+			)
+			for index in range(16)
+		]
+
+	def _page_ids(self, page):
+		ids = [meal.pk for meal in page.primary]
+		for section in page.sections:
+			ids.extend(meal.pk for meal in section.meals)
+		return ids
+
+	def test_build_page_uses_constant_queries(self):
+		engine = RecommendationEngine(self.user)
+		with self.assertNumQueries(15):
+			page = engine.build_page("filters", RecommendationFilters(limit=4))
+		self.assertEqual(len(page.primary), 4)
+		self.assertEqual(page.primary_source, "filters")
+
+	@override_settings(RECOMMENDATION_RESULT_CACHE_DEPTH=3)
+	def test_bounded_pool_holds_only_ranking_heads(self):
+		engine = RecommendationEngine(self.user)
+		self.assertLess(len(engine.shared_pool()), len(self.meals))
+		page = engine.build_page("filters", RecommendationFilters(limit=4), section_limit=4)
+		ids = self._page_ids(page)
+		self.assertEqual(len(ids), len(set(ids)))
+		budget = next(section for section in page.sections if section.key == "budget")
+		self.assertEqual(len(budget.meals), 4)
+		self.assertTrue(all(meal.restaurant_id == self.cheap.pk for meal in budget.meals))
+
+	def test_sections_do_not_repeat_meals(self):
+		page = RecommendationEngine(self.user).build_page("random", RecommendationFilters(limit=4))
+		ids = self._page_ids(page)
+		self.assertEqual(len(ids), len(set(ids)))
+		self.assertEqual(
+			[section.key for section in page.sections],
+			[key for key, _title, _subtitle in RecommendationEngine.SECONDARY_SECTIONS],
+		)
+
+	def test_empty_primary_falls_back_to_popular(self):
+		page = RecommendationEngine(self.user).build_page(
+			"filters", RecommendationFilters(cuisine_type="不存在的料理", limit=3)
+		)
+		self.assertEqual(page.primary_source, "popular")
+		self.assertEqual(len(page.primary), 3)
+
+	def test_new_experiences_skip_seen_meals(self):
+		Favorite.objects.create(user=self.user, meal=self.meals[0])
+		Review.objects.create(user=self.user, meal=self.meals[1], restaurant=self.meals[1].restaurant, rating=5)
+		page = RecommendationEngine(self.user).build_page(None, RecommendationFilters(limit=2), section_limit=16)
+		section = next(section for section in page.sections if section.key == "new_experiences")
+		self.assertNotIn(self.meals[0], section.meals)
+		self.assertNotIn(self.meals[1], section.meals)
+
+	@override_settings(RECOMMENDATION_CATALOG_INDEX=True)
+	def test_index_and_database_pools_agree(self):
+		catalog_index.invalidate()
+		self.addCleanup(catalog_index.invalidate)
+		filters = RecommendationFilters(price_range=Restaurant.PriceRange.HIGH, limit=3)
+		indexed = RecommendationEngine(self.user).build_page("filters", filters)
+		with self.settings(RECOMMENDATION_CATALOG_INDEX=False):
+			loaded = RecommendationEngine(self.user).build_page("filters", filters)
+		self.assertEqual(self._page_ids(indexed), self._page_ids(loaded))
+
+	def test_primary_alone_needs_pool_and_hydration(self):
+		engine = RecommendationEngine(self.user)
+		engine.build_primary("filters", RecommendationFilters(limit=4))  # warm the shared rankings
+		# Hydration and the two exclusion reads (uncached without a shared cache backend);
+		# the pool rows are shared with the first engine.
+		with self.assertNumQueries(3):
+			page = RecommendationEngine(self.user).build_primary("filters", RecommendationFilters(limit=4))
+		full = RecommendationEngine(self.user).build_page("filters", RecommendationFilters(limit=4))
+		self.assertEqual(page.primary, full.primary)
+		self.assertEqual(page.sections, [])
+
+	def test_section_on_its_own_skips_excluded_meals(self):
+		engine = RecommendationEngine(self.user)
+		first = engine.build_section("budget", limit=3)
+		self.assertEqual(len(first.meals), 3)
+		self.assertTrue(all(meal.restaurant_id == self.cheap.pk for meal in first.meals))
+		second = engine.build_section("budget", [meal.pk for meal in first.meals], limit=3)
+		self.assertFalse(set(first.meals) & set(second.meals))
+		with self.assertRaises(ValueError):
+			engine.build_section("unknown")
+
+
+class FavoriteCounterTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = AppUser.objects.create(
+			username="counter-user",
+			email="counter@example.com",
+			password_hash="dummy",
+		)
+		self.restaurant = Restaurant.objects.create(name="收藏餐廳")
+		self.meal = Meal.objects.create(restaurant=self.restaurant, name="招牌飯")
+		self.other_meal = Meal.objects.create(restaurant=self.restaurant, name="小菜")
+
+	def test_reconcile_repairs_drift(self):
+		Favorite.objects.create(user=self.user, meal=self.meal)
+		Meal.objects.filter(pk=self.other_meal.pk).update(favorite_count=5)
+		call_command("reconcile_favorite_counts", "--dry-run", stdout=StringIO())
+		self.other_meal.refresh_from_db()
+		self.assertEqual(self.other_meal.favorite_count, 5)
+		out = StringIO()
+		call_command("reconcile_favorite_counts", stdout=out)
+		self.assertIn("2 meal(s) and 1 restaurant(s) updated", out.getvalue())
+		self.meal.refresh_from_db()
+		self.other_meal.refresh_from_db()
+		self.restaurant.refresh_from_db()
+		self.assertEqual((self.meal.favorite_count, self.other_meal.favorite_count), (1, 0))
+		self.assertEqual(self.restaurant.favorite_count, 1)
+
+	def test_popular_meals_order_by_stored_counter(self):
+		adjust_favorite_count(self.other_meal, 3)
+		adjust_favorite_count(self.other_meal, -1)
+		popular = RecommendationEngine(self.user).popular_meals(2)
+		self.assertEqual(popular, [self.other_meal, self.meal])
+		self.assertEqual(popular[0].favorite_count, 2)
+
+
+class UserExclusionCacheTests(TestCase):
+	def setUp(self):
+		# Exclusion sets are only cached in a backend all workers share.
+		cache_dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, cache_dir)
+		shared = override_settings(
+			CACHES={"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": cache_dir}}
+		)
+		shared.enable()
+		self.addCleanup(shared.disable)
+		cache.clear()
+		self.user = AppUser.objects.create(
+			username="exclusion-user",
+			email="exclusion@example.com",
+			password_hash="dummy",
+		)
+		self.restaurant = Restaurant.objects.create(name="排除餐廳")
+		self.meals = [
+			Meal.objects.create(restaurant=self.restaurant, name=f"排除餐點 {index}")
+			for index in range(5)
+		]
+
+	def test_cached_sets_skip_queries(self):
+		record_user_choice(self.user, self.meals[0])
+		Favorite.objects.create(user=self.user, meal=self.meals[1])
+		first = get_user_exclusions(self.user)
+		with self.assertNumQueries(0):
+			second = get_user_exclusions(self.user)
+		self.assertEqual(list(second.selected_ids), [self.meals[0].pk])
+		self.assertEqual(list(second.seen_ids), list(first.seen_ids))
+		self.assertEqual(second.selected_ids.dtype, np.int32)
+
+	def test_writes_invalidate_cached_sets(self):
+		self.assertEqual(list(cooldown_meal_ids(self.user)), [])
+		record_user_choice(self.user, self.meals[2])
+		self.assertEqual(list(cooldown_meal_ids(self.user)), [self.meals[2].pk])
+		Review.objects.create(user=self.user, meal=self.meals[3], restaurant=self.restaurant, rating=4)
+		self.assertEqual(list(get_user_exclusions(self.user).seen_ids), [self.meals[3].pk])
+		Review.objects.filter(user=self.user).delete()
+		self.assertEqual(list(get_user_exclusions(self.user).seen_ids), [])
+
+	def test_cooldown_window_follows_preference(self):
+		history = record_user_choice(self.user, self.meals[4])
+		RecommendationHistory.objects.filter(pk=history.pk).update(
+			recommended_at=timezone.now() - timedelta(days=10)
+		)
+		invalidate_user_exclusions(self.user.pk)
+		self.assertEqual(list(cooldown_meal_ids(self.user)), [])
+		UserPreference.objects.create(user=self.user, recommendation_cooldown_days=14)
+		self.user.refresh_from_db()
+		self.assertEqual(list(cooldown_meal_ids(self.user)), [self.meals[4].pk])
+
+	def test_process_local_cache_reads_the_database(self):
+		with self.settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+			get_user_exclusions(self.user)
+			# Another worker's selection must show up although nothing here was invalidated.
+			RecommendationHistory.objects.create(
+				user=self.user, meal=self.meals[0], restaurant=self.restaurant, was_selected=True
+			)
+			with self.assertNumQueries(2):
+				self.assertEqual(list(get_user_exclusions(self.user).selected_ids), [self.meals[0].pk])
+
+	def test_heavy_history_uses_anti_join(self):
+		for meal in self.meals[:4]:
+			record_user_choice(self.user, meal)
+		Favorite.objects.create(user=self.user, meal=self.meals[4])
+		engine = RecommendationEngine(self.user)
+		with CaptureQueriesContext(connection) as queries:
+			self.assertEqual(engine.new_experiences(5), [])
+		self.assertNotIn(str(self.meals[4].pk) + ")", queries.captured_queries[-1]["sql"])
+		self.assertIn("EXISTS", queries.captured_queries[-1]["sql"])
+
+
+class CollaborativeFilterTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.users = [
+			AppUser.objects.create(
+				username=f"cf-user-{index}",
+				email=f"cf{index}@example.com",
+				password_hash="dummy",
+			)
+			for index in range(4)
+		]
+		self.restaurant = Restaurant.objects.create(name="協同餐廳")
+		self.meals = [
+			Meal.objects.create(restaurant=self.restaurant, name=f"協同餐點 {index}")
+			for index in range(6)
+		]
+		# Users 0-2 share a taste for meals 0-2; user 3 only likes meal 5.
+		for user in self.users[:3]:
+			for meal in self.meals[:3]:
+				if (user, meal) != (self.users[2], self.meals[2]):
+					Favorite.objects.create(user=user, meal=meal)
+		Favorite.objects.create(user=self.users[3], meal=self.meals[5])
+		record_user_choice(self.users[0], self.meals[3])
+
+	def test_interaction_matrix_sums_sources(self):
+		interactions = build_interaction_matrix()
+		self.assertEqual(interactions.matrix.shape, (4, 5))
+		row = list(interactions.user_ids).index(self.users[0].pk)
+		col = list(interactions.meal_ids).index(self.meals[3].pk)
+		self.assertGreater(interactions.matrix[row, col], 0)
+
+	def test_command_stores_picks_served_by_engine(self):
+		out = StringIO()
+		call_command("train_collaborative_filter", "--factors", "4", "--seed", "3", stdout=out)
+		self.assertIn("stored picks for 4 user(s)", out.getvalue())
+		stored = PersonalizedRecommendation.objects.get(user=self.users[2])
+		self.assertEqual(stored.meal_ids[0], self.meals[2].pk)
+		self.assertNotIn(self.meals[0].pk, stored.meal_ids)
+
+		engine = RecommendationEngine(self.users[2])
+		self.assertEqual(engine.personalized_meals(1), [self.meals[2]])
+		page = engine.build_page("random", RecommendationFilters(limit=1))
+		for_you = next(section for section in page.sections if section.key == "for_you")
+		self.assertTrue(set(for_you.meals) <= set(self.meals))
+
+	def test_personalized_meals_respect_cooldown(self):
+		PersonalizedRecommendation.objects.create(
+			user=self.users[3],
+			meal_ids=[self.meals[4].pk, self.meals[1].pk],
+			scores=[0.9, 0.5],
+			model_version="test",
+		)
+		record_user_choice(self.users[3], self.meals[4])
+		self.assertEqual(RecommendationEngine(self.users[3]).personalized_meals(2), [self.meals[1]])
+
+
+class MealSimilarityTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.users = [
+			AppUser.objects.create(
+				username=f"sim-user-{index}",
+				email=f"sim{index}@example.com",
+				password_hash="dummy",
+			)
+			for index in range(3)
+		]
+		self.restaurant = Restaurant.objects.create(name="相似餐廳")
+		self.meals = [
+			Meal.objects.create(restaurant=self.restaurant, name=f"相似餐點 {index}")
+			for index in range(4)
+		]
+		for user in self.users[:2]:
+			Favorite.objects.create(user=user, meal=self.meals[0])
+			Favorite.objects.create(user=user, meal=self.meals[1])
+		Review.objects.create(user=self.users[2], meal=self.meals[0], restaurant=self.restaurant, rating=5)
+		Review.objects.create(user=self.users[2], meal=self.meals[2], restaurant=self.restaurant, rating=4)
+		Review.objects.create(user=self.users[2], meal=self.meals[3], restaurant=self.restaurant, rating=1)
+
+	def test_command_keeps_top_k_neighbors(self):
+		call_command("build_meal_similarity", "--top-k", "1", stdout=StringIO())
+		self.assertEqual(
+			list(
+				MealSimilarity.objects.filter(meal=self.meals[0]).values_list("neighbor_id", "rank")
+			),
+			[(self.meals[1].pk, 1)],
+		)
+		self.assertFalse(MealSimilarity.objects.filter(neighbor=self.meals[3]).exists())
+
+	def test_similar_dishes_and_liked_section(self):
+		call_command("build_meal_similarity", stdout=StringIO())
+		self.assertEqual(similar_meals(self.meals[0]), [self.meals[1], self.meals[2]])
+		with self.assertNumQueries(1):
+			similar_meals(self.meals[2])
+
+		newcomer = AppUser.objects.create(
+			username="sim-newcomer",
+			email="newcomer@example.com",
+			password_hash="dummy",
+		)
+		Favorite.objects.create(user=newcomer, meal=self.meals[0])
+		page = RecommendationEngine(newcomer).build_page(None, RecommendationFilters(limit=1))
+		section = next(section for section in page.sections if section.key == "because_you_liked")
+		self.assertEqual(section.title, "因為你喜歡「相似餐點 0」")
+		self.assertTrue(section.meals)
+		self.assertNotIn(self.meals[0], section.meals)
+		self.assertTrue(set(section.meals) <= {self.meals[1], self.meals[2]})
+		for meal in self.meals[2:]:
+			Favorite.objects.create(user=newcomer, meal=meal)
+		page = RecommendationEngine(newcomer).build_page(None, RecommendationFilters(limit=1))
+		section = next(section for section in page.sections if section.key == "because_you_liked")
+		self.assertEqual(section.title, "因為你喜歡「相似餐點 3」、「相似餐點 2」等 3 道餐點")
+
+	def test_meal_detail_lists_similar_dishes(self):
+		call_command("build_meal_similarity", stdout=StringIO())
+		response = self.client.get(reverse("merchantsideapp:meal_detail", args=[self.meals[0].slug]))
+		self.assertContains(response, "相似餐點")
+		self.assertContains(response, self.meals[1].get_absolute_url())
+
+
+class SharedResultCacheTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.users = [
+			AppUser.objects.create(
+				username=f"shared-user-{index}",
+				email=f"shared{index}@example.com",
+				password_hash="dummy",
+			)
+			for index in range(2)
+		]
+		self.restaurant = Restaurant.objects.create(
+			name="共享餐廳",
+			price_range=Restaurant.PriceRange.LOW,
+			rating=4.0,
+		)
+		self.meals = [
+			Meal.objects.create(restaurant=self.restaurant, name=f"共享餐點 {index}")
+			for index in range(5)
+		]
+
+	def test_second_user_hits_cache_and_applies_own_cooldown(self):
+		record_user_choice(self.users[1], self.meals[0])
+		first = RecommendationEngine(self.users[0]).budget_friendly(3)
+		self.assertEqual(result_cache_stats()["misses"], 1)
+		second = RecommendationEngine(self.users[1]).budget_friendly(3)
+		self.assertEqual(result_cache_stats()["hits"], 1)
+		self.assertEqual(first, self.meals[:3])
+		self.assertEqual(second, self.meals[1:4])
+
+	def test_filters_hash_ignores_limit_and_case(self):
+		self.assertEqual(
+			filters_digest(RecommendationFilters(cuisine_type=" Thai ", limit=3)),
+			filters_digest(RecommendationFilters(cuisine_type="thai", limit=9)),
+		)
+		self.assertNotEqual(
+			filters_digest(RecommendationFilters(cuisine_type="thai")),
+			filters_digest(RecommendationFilters(cuisine_type="thai", is_vegetarian=True)),
+		)
+
+	def test_catalog_writes_invalidate_rankings(self):
+		engine = RecommendationEngine(self.users[0])
+		self.assertEqual(engine.popular_meals(1), [self.meals[0]])
+		Favorite.objects.create(user=self.users[1], meal=self.meals[3])
+		adjust_favorite_count(self.meals[3], 1)
+		self.assertEqual(RecommendationEngine(self.users[0]).popular_meals(1), [self.meals[3]])
+		self.meals[3].is_available = False
+		self.meals[3].save()
+		self.assertEqual(RecommendationEngine(self.users[0]).popular_meals(1), [self.meals[0]])
+		self.assertEqual(result_cache_stats()["hits"], 0)
+
+	@override_settings(RECOMMENDATION_RESULT_CACHE_DEPTH=2)
+	def test_exhausted_ranking_falls_back_to_uncached_query(self):
+		for meal in self.meals[:2]:
+			record_user_choice(self.users[0], meal)
+		self.assertEqual(RecommendationEngine(self.users[0]).mild_flavor(2), self.meals[2:4])
+
+	def test_favorites_only_orphan_favorite_orderings(self):
+		RecommendationEngine(self.users[0]).budget_friendly(1)
+		RecommendationEngine(self.users[0]).popular_meals(1)
+		version = catalog_version()
+		Favorite.objects.create(user=self.users[1], meal=self.meals[3])
+		self.assertEqual(catalog_version(), version)
+		RecommendationEngine(self.users[0]).budget_friendly(1)
+		RecommendationEngine(self.users[0]).popular_meals(1)
+		self.assertEqual(result_cache_stats(), {"hits": 1, "misses": 3, "hit_rate": 0.25})
+
+	def test_stats_command_reports_and_resets(self):
+		with self.assertRaises(CommandError):
+			call_command("recommendation_cache_stats", stdout=StringIO())
+		cache_dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, cache_dir)
+		shared = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": cache_dir}}
+		with self.settings(CACHES=shared):
+			RecommendationEngine(self.users[0]).popular_meals(1)
+			RecommendationEngine(self.users[1]).popular_meals(1)
+			out = StringIO()
+			call_command("recommendation_cache_stats", "--reset", stdout=out)
+			self.assertIn("hits=1 misses=1 hit_rate=50.0%", out.getvalue())
+			self.assertEqual(result_cache_stats()["hits"], 0)
+
+
+class ImpressionBufferTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = AppUser.objects.create(
+			username="impression-user",
+			email="impression@example.com",
+			password_hash="dummy",
+		)
+		self.restaurant = Restaurant.objects.create(name="曝光餐廳")
+		self.meals = [
+			Meal.objects.create(restaurant=self.restaurant, name=f"曝光餐點 {index}")
+			for index in range(4)
+		]
+
+	def test_flush_writes_unselected_rows_in_one_insert(self):
+		buffer = ImpressionBuffer(flush_size=10, background=False)
+		self.assertEqual(buffer.log(self.user, self.meals), 4)
+		self.assertEqual(RecommendationHistory.objects.count(), 0)
+		with self.assertNumQueries(1):
+			self.assertEqual(buffer.flush(), 4)
+		self.assertEqual(
+			RecommendationHistory.objects.filter(user=self.user, was_selected=False).count(), 4
+		)
+		self.assertEqual(list(recent_selected_meal_ids(self.user)), [])
+		self.assertEqual(buffer.stats(), {"pending": 0, "written": 4, "dropped": 0})
+
+	def test_full_buffer_drops_and_counts(self):
+		buffer = ImpressionBuffer(capacity=3, background=False)
+		self.assertEqual(buffer.log(self.user, self.meals), 3)
+		self.assertEqual(buffer.log(self.user, self.meals[:1]), 0)
+		self.assertEqual(buffer.stats()["dropped"], 2)
+		self.assertEqual(buffer.log(AppUser(), self.meals), 0)
+
+	def test_stop_flushes_pending_rows(self):
+		buffer = ImpressionBuffer(background=False)
+		buffer.log(self.user, self.meals[:2])
+		buffer.stop()
+		self.assertEqual(RecommendationHistory.objects.count(), 2)
+
+	@override_settings(RECOMMENDATION_IMPRESSION_LOGGING=True)
+	def test_random_page_queues_shown_cards(self):
+		session = self.client.session
+		session[SESSION_USER_KEY] = self.user.pk
+		session.save()
+		with mock.patch.object(impression_buffer, "background", False):
+			self.client.get(reverse("usersideapp:random"))
+			self.assertEqual(RecommendationHistory.objects.count(), 0)
+			written = impression_buffer.flush()
+		self.assertEqual(written, len(self.meals))
+		self.assertEqual(
+			set(RecommendationHistory.objects.values_list("meal_id", flat=True)),
+			{meal.pk for meal in self.meals},
+		)
+
+
+class HistoryArchiveTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = AppUser.objects.create(
+			username="archive-user",
+			email="archive@example.com",
+			password_hash="dummy",
+		)
+		self.restaurant = Restaurant.objects.create(name="封存餐廳")
+		self.meal = Meal.objects.create(restaurant=self.restaurant, name="封存餐點")
+		self.old_day = timezone.now() - timedelta(days=45)
+		old_rows = [
+			RecommendationHistory.objects.create(
+				user=self.user,
+				meal=self.meal,
+				restaurant=self.restaurant,
+				was_selected=index == 0,
+			)
+			for index in range(5)
+		]
+		RecommendationHistory.objects.filter(pk__in=[row.pk for row in old_rows]).update(
+			recommended_at=self.old_day
+		)
+		self.recent = record_user_choice(self.user, self.meal)
+		self.output_dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.output_dir)
+
+	def test_archive_moves_old_rows_in_chunks(self):
+		out = StringIO()
+		call_command(
+			"archive_recommendation_history",
+			"--output-dir",
+			self.output_dir,
+			"--chunk-size",
+			"2",
+			stdout=out,
+		)
+		self.assertIn("Archived 5 row(s) in 3 chunk(s)", out.getvalue())
+		self.assertEqual(list(RecommendationHistory.objects.values_list("pk", flat=True)), [self.recent.pk])
+		stat = RecommendationDailyStat.objects.get()
+		self.assertEqual((stat.date, stat.impressions, stat.selections), (self.old_day.date(), 4, 1))
+		(archive_file,) = Path(self.output_dir).iterdir()
+		with gzip.open(archive_file, "rt", encoding="utf-8") as handle:
+			lines = [json.loads(line) for line in handle]
+		self.assertEqual(len(lines), 5)
+		self.assertEqual(lines[0]["meal_id"], self.meal.pk)
+
+	def test_days_below_cooldown_window_are_clamped(self):
+		out = StringIO()
+		call_command(
+			"archive_recommendation_history",
+			"--days",
+			"1",
+			"--dry-run",
+			"--output-dir",
+			self.output_dir,
+			stdout=out,
+		)
+		self.assertIn("5 row(s)", out.getvalue())
+		self.assertEqual(RecommendationHistory.objects.count(), 6)
+		self.assertEqual(list(Path(self.output_dir).iterdir()), [])
+
+	def test_rollup_accumulates_across_runs(self):
+		archive_history(Path(self.output_dir), max_chunks=1, chunk_size=3)
+		archive_history(Path(self.output_dir))
+		stat = RecommendationDailyStat.objects.get()
+		self.assertEqual(stat.impressions + stat.selections, 5)
+
+
+class NutritionFitTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		nutrition_matrix.invalidate()
+		self.user = AppUser.objects.create(
+			username="nutrition-user",
+			email="nutrition@example.com",
+			password_hash="dummy",
+		)
+		restaurant = Restaurant.objects.create(name="營養餐廳")
+		self.salad = self._meal(restaurant, "雞胸沙拉", 450, 35, 30, 15)
+		self.bento = self._meal(restaurant, "排骨便當", 700, 25, 85, 22)
+		self.fried = self._meal(restaurant, "炸雞桶", 1600, 60, 90, 100)
+
+	def _meal(self, restaurant, name, calories, protein, carbohydrate, fat, sodium=0):
+		meal = Meal.objects.create(restaurant=restaurant, name=name)
+		NutritionInfo.objects.create(
+			meal=meal,
+			calories=calories,
+			protein=protein,
+			carbohydrate=carbohydrate,
+			fat=fat,
+			sodium=sodium,
+		)
+		return meal
+
+	def _log(self, meal_type, calories, protein, carbs, fat, source_meal=None):
+		DailyMealRecord.objects.create(
+			user=self.user,
+			meal_type=meal_type,
+			meal_name=meal_type,
+			source_meal=source_meal,
+			calories=calories,
+			protein_grams=protein,
+			carb_grams=carbs,
+			fat_grams=fat,
+		)
+
+	def test_meal_target_splits_remaining_budget(self):
+		targets = np.array([2000, 75, 250, 65, 2000], dtype=np.float32)
+		np.testing.assert_allclose(
+			meal_target([1000, 25, 150, 65, 1400], 2, targets), [1000, 50, 100, 0, 600]
+		)
+		np.testing.assert_allclose(meal_target([0, 0, 0, 0, 0], 0, targets), targets / 3)
+
+	def test_sodium_logged_from_merchant_meals_counts_against_budget(self):
+		restaurant = Restaurant.objects.get(name="營養餐廳")
+		salty = self._meal(restaurant, "牛肉麵", 450, 35, 30, 15, sodium=1500)
+		miso = self._meal(restaurant, "味噌定食", 667, 25, 83, 22, sodium=600)
+		self.assertEqual(RecommendationEngine(self.user).nutrition_fit_meals(2), [miso, self.bento])
+		self._log(DailyMealRecord.MealType.BREAKFAST, 450, 35, 30, 15, source_meal=salty)
+		self.assertEqual(RecommendationEngine(self.user).nutrition_fit_meals(2), [self.bento, miso])
+
+	def test_ranks_meals_by_remaining_budget(self):
+		engine = RecommendationEngine(self.user)
+		self.assertEqual(engine.nutrition_fit_meals(3), [self.bento, self.salad, self.fried])
+		self._log(DailyMealRecord.MealType.BREAKFAST, 700, 25, 90, 25)
+		self._log(DailyMealRecord.MealType.LUNCH, 900, 30, 100, 30)
+		engine = RecommendationEngine(self.user)
+		self.assertEqual(engine.nutrition_fit_meals(3), [self.salad, self.bento, self.fried])
+
+	def test_persisting_nutrition_refreshes_loaded_matrix(self):
+		nutrition_matrix.matrix()
+		entries = [{"name": "炸雞", "calories": 500, "protein": 30, "carb": 40, "fat": 20}]
+		with self.captureOnCommitCallbacks(execute=True):
+			_persist_meal_nutrition(self.fried, entries)
+		matrix = nutrition_matrix.matrix()
+		np.testing.assert_allclose(matrix.values[matrix.position(self.fried.pk)], [500, 30, 40, 20, 0])
+		with self.captureOnCommitCallbacks(execute=True):
+			_persist_meal_nutrition(self.salad, [])
+		self.assertIsNone(nutrition_matrix.matrix().position(self.salad.pk))
+
+	def test_anonymous_users_get_no_budget_section(self):
+		page = RecommendationEngine().build_page("random", RecommendationFilters(limit=2))
+		section = next(section for section in page.sections if section.key == "fits_budget")
+		self.assertEqual(section.meals, [])
+
+
+class NearbyRecommendationTests(TestCase):
+	ORIGIN = (25.033, 121.5654)
+
+	def setUp(self):
+		cache.clear()
+		catalog_index.invalidate()
+		self.user = AppUser.objects.create(
+			username="nearby-user",
+			email="nearby@example.com",
+			password_hash="dummy",
+		)
+		# Roughly 0.3 km, 0.8 km and 2 km north of the origin.
+		self.close = self._meal("近的餐廳", 0.0027)
+		self.walkable = self._meal("走路可到", 0.0072)
+		self.far = self._meal("有點遠", 0.018)
+		Meal.objects.create(restaurant=Restaurant.objects.create(name="沒有座標"), name="無座標餐點")
+
+	def _meal(self, name, d_lat):
+		restaurant = Restaurant.objects.create(
+			name=name,
+			latitude=round(self.ORIGIN[0] + d_lat, 7),
+			longitude=self.ORIGIN[1],
+		)
+		return Meal.objects.create(restaurant=restaurant, name=f"{name}便當")
+
+	def _filters(self, radius_km=1.0, **kwargs):
+		return RecommendationFilters(near=self.ORIGIN, radius_km=radius_km, **kwargs)
+
+	def test_apply_filters_ranks_by_distance_within_radius(self):
+		engine = RecommendationEngine(self.user)
+		self.assertEqual(engine.apply_filters(self._filters()), [self.close, self.walkable])
+		self.assertEqual(engine.apply_filters(self._filters(5)), [self.close, self.walkable, self.far])
+
+	def test_catalog_index_matches_database_path(self):
+		with override_settings(RECOMMENDATION_CATALOG_INDEX=True):
+			meals = RecommendationEngine(self.user).apply_filters(self._filters())
+		self.assertEqual(meals, [self.close, self.walkable])
+
+	def test_catalog_measures_distance_only_inside_covering_cells(self):
+		catalog = catalog_index.columns()
+		with mock.patch("RecommendationSystem.catalog.haversine_km", wraps=haversine_km) as distance:
+			mask = catalog.filter_mask(self._filters(0.5))
+		self.assertEqual(catalog.meal_id[mask].tolist(), [self.close.pk])
+		self.assertLess(distance.call_args.args[2].size, 3)
+
+	def test_build_page_primary_is_nearest_first(self):
+		page = RecommendationEngine(self.user).build_page("filters", self._filters(limit=4))
+		self.assertEqual(page.primary, [self.close, self.walkable])
+		self.assertEqual(page.primary_source, "filters")
+
+	def test_filters_from_form_data(self):
+		engine = RecommendationEngine(self.user)
+		filters = engine.filters_from_data({"radius_km": 3.0, "latitude": 25.0, "longitude": 121.5})
+		self.assertEqual((filters.near, filters.radius_km), ((25.0, 121.5), 3.0))
+		self.assertIn("附近 3 公里", engine.describe_filters(filters))
+		self.assertIsNone(engine.filters_from_data({"radius_km": 3.0}).near)
+
+
+@override_settings(RECOMMENDATION_SLATES=True)
+class RecommendationSlateTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = AppUser.objects.create(
+			username="slate-user",
+			email="slate@example.com",
+			password_hash="dummy",
+		)
+		restaurant = Restaurant.objects.create(name="預算餐廳", rating=4.0)
+		self.meals = [
+			Meal.objects.create(restaurant=restaurant, name=f"預算餐點 {index}")
+			for index in range(20)
+		]
+
+	def _login(self):
+		session = self.client.session
+		session[SESSION_USER_KEY] = self.user.pk
+		session.save()
+
+	def test_command_stores_default_page(self):
+		out = StringIO()
+		call_command("build_recommendation_slates", "--processes", "1", stdout=out)
+		self.assertIn("Stored 1 slate(s)", out.getvalue())
+		slate = RecommendationSlate.objects.get(user=self.user)
+		self.assertEqual(len(slate.primary_ids), RecommendationEngine.DEFAULT_LIMIT)
+		self.assertEqual(
+			[section["key"] for section in slate.sections],
+			[key for key, _title, _subtitle in RecommendationEngine.SECONDARY_SECTIONS],
+		)
+
+	def test_batch_shares_one_candidate_pool(self):
+		other = AppUser.objects.create(username="slate-other", email="slate-other@example.com", password_hash="dummy")
+		shared_pool = RecommendationEngine.shared_pool
+		with mock.patch.object(RecommendationEngine, "shared_pool", autospec=True, side_effect=shared_pool) as loads:
+			self.assertEqual(build_slates([self.user.pk, other.pk]), 2)
+		self.assertEqual(loads.call_count, 1)
+
+	def test_random_page_is_served_from_fresh_slate(self):
+		build_slates([self.user.pk])
+		slate = RecommendationSlate.objects.get(user=self.user)
+		self._login()
+		with mock.patch.object(RecommendationEngine, "build_page", side_effect=AssertionError):
+			response = self.client.post(reverse("usersideapp:random_data"), {"action": "use_preferences"})
+		cards = response.json()["primary"]["cards"]
+		self.assertEqual([card["meal"]["id"] for card in cards], slate.primary_ids)
+
+	def test_slate_skips_meals_put_on_cooldown(self):
+		build_slates([self.user.pk])
+		chosen = Meal.objects.get(pk=RecommendationSlate.objects.get(user=self.user).primary_ids[0])
+		record_user_choice(self.user, chosen)
+		fresh_slate_page(RecommendationEngine(self.user))  # load the user's preferences
+		# Slate row, hydration and the two exclusion reads (uncached without a shared cache backend).
+		with self.assertNumQueries(4):
+			page = fresh_slate_page(RecommendationEngine(self.user))
+		self.assertNotIn(chosen, page.primary)
+		self.assertEqual(len(page.primary), RecommendationEngine.DEFAULT_LIMIT - 1)
+
+	def test_stale_or_disabled_slates_fall_back_to_live_pages(self):
+		build_slates([self.user.pk])
+		with override_settings(RECOMMENDATION_SLATES=False):
+			self.assertIsNone(fresh_slate_page(RecommendationEngine(self.user)))
+		RecommendationSlate.objects.update(generated_at=timezone.now() - timedelta(days=2))
+		self.assertIsNone(fresh_slate_page(RecommendationEngine(self.user)))
+
+	def test_preference_change_discards_and_rebuilds_slate(self):
+		build_slates([self.user.pk])
+		with mock.patch("RecommendationSystem.slates._submit") as submit:
+			with self.captureOnCommitCallbacks(execute=True):
+				UserPreference.objects.create(user=self.user, is_vegetarian=True)
+		self.assertFalse(RecommendationSlate.objects.filter(user=self.user).exists())
+		submit.assert_called_once_with(self.user.pk)
+
+
+def replay_first_meal(engine, k):
+	"""Pluggable replay strategy used by ``ReplayHarnessTests``."""
+	return list(Meal.objects.order_by("pk").values_list("pk", flat=True)[:k])
+
+
+class ReplayHarnessTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		restaurant = Restaurant.objects.create(name="回放餐廳", rating=4.0)
+		self.meals = [Meal.objects.create(restaurant=restaurant, name=f"回放餐點 {index}") for index in range(8)]
+		self.users = [
+			AppUser.objects.create(username=f"replay-{index}", email=f"replay{index}@example.com", password_hash="dummy")
+			for index in range(2)
+		]
+		self.as_of = timezone.now() - timedelta(days=3)
+		Meal.objects.update(created_at=self.as_of - timedelta(days=10))
+		past = Favorite.objects.create(user=self.users[0], meal=self.meals[5])
+		Favorite.objects.filter(pk=past.pk).update(created_at=self.as_of - timedelta(days=1))
+		Favorite.objects.create(user=self.users[0], meal=self.meals[0])
+		Favorite.objects.create(user=self.users[1], meal=self.meals[1])
+		reconcile_favorite_counts()
+
+	def test_snapshot_hides_later_interactions_and_rolls_back(self):
+		with point_in_time(self.as_of, retrain=False):
+			self.assertEqual(Favorite.objects.count(), 1)
+			self.assertEqual(Meal.objects.get(pk=self.meals[0].pk).favorite_count, 0)
+		self.assertEqual(Favorite.objects.count(), 3)
+		self.assertEqual(Meal.objects.get(pk=self.meals[0].pk).favorite_count, 1)
+
+	def test_snapshot_refuses_the_live_database(self):
+		with mock.patch.dict(connection.settings_dict, {"NAME": "rmrs", "TEST": {}}):
+			with self.assertRaises(ValueError):
+				with point_in_time(self.as_of, retrain=False):
+					pass
+		self.assertEqual(Favorite.objects.count(), 3)
+
+	def test_reports_hit_rate_and_coverage(self):
+		(report,) = replay(
+			{"first": replay_first_meal},
+			self.as_of,
+			k=1,
+			retrain=False,
+		)
+		self.assertEqual(report.requests, 2)
+		self.assertEqual(report.hit_rate, 0.5)
+		self.assertEqual(report.coverage, 1 / 8)
+		self.assertEqual(len(report.latencies_ms), 2)
+		self.assertEqual(report.queries, [1, 1])
+
+	def test_command_prints_a_row_per_strategy(self):
+		out = StringIO()
+		call_command(
+			"replay_recommendations",
+			"--strategy",
+			"popular",
+			"--strategy",
+			"RecommendationSystem.tests.replay_first_meal",
+			"--as-of",
+			self.as_of.isoformat(),
+			"--k",
+			"3",
+			stdout=out,
+		)
+		output = out.getvalue()
+		self.assertIn("Replayed 2 user(s)", output)
+		self.assertIn("hit@3", output)
+		self.assertRegex(output, r"popular\s+\d\.\d{3}")
+		self.assertIn("RecommendationSystem.tests.replay_first_meal", output)
+		self.assertEqual(PersonalizedRecommendation.objects.count(), 0)
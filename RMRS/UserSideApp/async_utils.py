@@ -0,0 +1,39 @@
+"""Helpers for running independent blocking work concurrently from async views."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Callable, List
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+
+def parallel_queries_enabled() -> bool:
+    return bool(getattr(settings, "ASYNC_PARALLEL_QUERIES", True))
+
+
+def _on_own_connection(func: Callable[[], Any]) -> Callable[[], Any]:
+    def run():
+        try:
+            return func()
+        finally:
+            close_old_connections()
+
+    return run
+
+
+async def gather_sync(*funcs: Callable[[], Any]) -> List[Any]:
+    """Run blocking callables concurrently and return their results in order.
+
+    With ``ASYNC_PARALLEL_QUERIES`` on, each callable runs in a worker thread
+    (``thread_sensitive=False``) with its own database connection, so the
+    wall-clock time tracks the slowest one. Only pass read-only work that
+    does not depend on the caller's open transaction. With the setting off
+    they run one after another on the shared sync thread.
+    """
+    if parallel_queries_enabled():
+        calls = [sync_to_async(_on_own_connection(func), thread_sensitive=False)() for func in funcs]
+        return list(await asyncio.gather(*calls))
+    return [await sync_to_async(func)() for func in funcs]
@@ -1,6 +1,7 @@
 from functools import wraps
 from typing import Callable, Optional, TypeVar
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.contrib import messages
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import redirect
@@ -29,12 +30,31 @@ def get_current_user(request: HttpRequest) -> Optional[AppUser]:
     return AppUser.objects.filter(pk=user_id).first()
 
 
+async def aget_current_user(request: HttpRequest) -> Optional[AppUser]:
+    user_id = await request.session.aget(SESSION_USER_KEY)
+    if not user_id:
+        return None
+    return await AppUser.objects.filter(pk=user_id).afirst()
+
+
 def user_login_required(view_func: ViewFunc) -> ViewFunc:
+    def _login_redirect(request: HttpRequest) -> HttpResponse:
+        messages.info(request, "請先登入以存取該頁面。")
+        return redirect("usersideapp:login")
+
+    if iscoroutinefunction(view_func):
+
+        async def _async_wrapped(request: HttpRequest, *args, **kwargs):
+            if not await request.session.aget(SESSION_USER_KEY):
+                return _login_redirect(request)
+            return await view_func(request, *args, **kwargs)
+
+        return markcoroutinefunction(wraps(view_func)(_async_wrapped))  # type: ignore[return-value]
+
     @wraps(view_func)
     def _wrapped(request: HttpRequest, *args, **kwargs):
         if not request.session.get(SESSION_USER_KEY):
-            messages.info(request, "請先登入以存取該頁面。")
-            return redirect("usersideapp:login")
+            return _login_redirect(request)
         return view_func(request, *args, **kwargs)
 
     return _wrapped  # type: ignore[return-value]
@@ -0,0 +1,166 @@
+"""Serialization of recommendation cards for the JSON endpoints.
+
+A recommendation payload carries a few dozen cards, and each one needs a
+meal URL, a restaurant URL and a price label. ``reverse()`` walks the
+resolver on every call, so the detail routes are reversed once into a
+prefix/suffix template around the slug (:class:`UrlTemplate`). Price labels
+come from a plain dict rather than ``get_price_range_display()``. The card
+fields are gathered into a slotted :class:`CardData` before they become the
+nested JSON shape. ``RECOMMENDATION_JSON_ENCODER = "orjson"`` encodes the
+response with orjson when it is installed.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, List
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.urls import get_script_prefix, get_urlconf, reverse
+
+from MerchantSideApp.models import Restaurant
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+logger = logging.getLogger(__name__)
+
+SLUG_PLACEHOLDER = "slug-placeholder"
+# What ``reverse()`` leaves unquoted in a path argument.
+URL_SAFE = "!$&'()*+,;=/~:@"
+PRICE_LABELS = dict(Restaurant.PriceRange.choices)
+MEAL_ROUTE = "merchantsideapp:meal_detail"
+RESTAURANT_ROUTE = "merchantsideapp:restaurant_detail"
+
+
+class UrlTemplate:
+    """A route taking one slug argument, reversed once and filled by concatenation."""
+
+    __slots__ = ("prefix", "suffix")
+
+    def __init__(self, route_name: str):
+        url = reverse(route_name, args=[SLUG_PLACEHOLDER])
+        self.prefix, found, self.suffix = url.partition(SLUG_PLACEHOLDER)
+        if not found or SLUG_PLACEHOLDER in self.suffix:
+            raise ValueError(f"Route {route_name} does not embed its slug exactly once")
+
+    def format(self, slug: str) -> str:
+        return f"{self.prefix}{quote(slug, safe=URL_SAFE)}{self.suffix}"
+
+
+@lru_cache(maxsize=32)
+def _compiled(route_name: str, script_prefix: str, urlconf) -> UrlTemplate:
+    return UrlTemplate(route_name)
+
+
+def url_template(route_name: str) -> UrlTemplate:
+    """The template for ``route_name`` under the active script prefix and URLconf."""
+    return _compiled(route_name, get_script_prefix(), get_urlconf() or settings.ROOT_URLCONF)
+
+
+@dataclass(slots=True)
+class CardData:
+    """Flat card fields; :meth:`as_dict` gives the JSON shape the page script reads."""
+
+    meal_id: int
+    meal_slug: str
+    meal_name: str
+    description: str
+    is_vegetarian: bool
+    is_spicy: bool
+    meal_url: str
+    restaurant_id: int
+    restaurant_slug: str
+    restaurant_name: str
+    cuisine_type: str
+    price_range: str
+    price_label: str
+    city: str
+    district: str
+    restaurant_url: str
+    favorite_count: int
+    reason: str
+
+    @classmethod
+    def from_card(cls, card: dict, meal_urls: UrlTemplate, restaurant_urls: UrlTemplate) -> "CardData":
+        meal = card["meal"]
+        restaurant = card["restaurant"]
+        price_range = restaurant.price_range or ""
+        return cls(
+            meal_id=meal.id,
+            meal_slug=meal.slug,
+            meal_name=meal.name,
+            description=meal.description or "",
+            is_vegetarian=bool(meal.is_vegetarian),
+            is_spicy=bool(meal.is_spicy),
+            meal_url=meal_urls.format(meal.slug),
+            restaurant_id=restaurant.id,
+            restaurant_slug=restaurant.slug,
+            restaurant_name=restaurant.name,
+            cuisine_type=restaurant.cuisine_type or "",
+            price_range=price_range,
+            price_label=PRICE_LABELS.get(price_range, price_range),
+            city=restaurant.city or "",
+            district=restaurant.district or "",
+            restaurant_url=restaurant_urls.format(restaurant.slug),
+            favorite_count=card.get("favorite_count", 0),
+            reason=card.get("reason") or "",
+        )
+
+    def as_dict(self) -> dict:
+        return {
+            "meal": {
+                "id": self.meal_id,
+                "slug": self.meal_slug,
+                "name": self.meal_name,
+                "description": self.description,
+                "isVegetarian": self.is_vegetarian,
+                "isSpicy": self.is_spicy,
+                "url": self.meal_url,
+            },
+            "restaurant": {
+                "id": self.restaurant_id,
+                "slug": self.restaurant_slug,
+                "name": self.restaurant_name,
+                "cuisineType": self.cuisine_type,
+                "priceRange": self.price_range,
+                "priceLabel": self.price_label,
+                "city": self.city,
+                "district": self.district,
+                "url": self.restaurant_url,
+            },
+            "favoriteCount": self.favorite_count,
+            "reason": self.reason,
+        }
+
+
+def serialize_cards(cards: Iterable[dict]) -> List[dict]:
+    """JSON-ready dicts for cards built by ``_build_recommendation_cards``."""
+    meal_urls = url_template(MEAL_ROUTE)
+    restaurant_urls = url_template(RESTAURANT_ROUTE)
+    return [CardData.from_card(card, meal_urls, restaurant_urls).as_dict() for card in cards]
+
+
+def json_encoder_name() -> str:
+    return str(getattr(settings, "RECOMMENDATION_JSON_ENCODER", "json")).lower()
+
+
+def _orjson_default(value):
+    return DjangoJSONEncoder().default(value)
+
+
+def json_response(payload: dict) -> HttpResponse:
+    """``JsonResponse`` for ``payload``, encoded with orjson when configured and available."""
+    if json_encoder_name() == "orjson":
+        if orjson is not None:
+            return HttpResponse(orjson.dumps(payload, default=_orjson_default), content_type="application/json")
+        logger.warning("RECOMMENDATION_JSON_ENCODER is orjson but orjson is not installed")
+    return JsonResponse(payload)
@@ -5,25 +5,41 @@ import json
 from django import forms
 from django.contrib.auth.hashers import check_password, make_password
 from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
 from django.db.models import Q
+from django.urls import reverse_lazy
 from django.utils import timezone
 
+from MerchantSideApp import taxonomy
 from MerchantSideApp.models import Meal, Restaurant
+from RecommendationSystem.services import adjust_favorite_count
 
 from .models import AppUser, DailyMealRecord, Favorite, NotificationSetting, Review, UserPreference
 
 
+AUTOCOMPLETE_URL = reverse_lazy("usersideapp:search_autocomplete")
+
+
+def restaurant_display_name(restaurant: Restaurant) -> str:
+    """How the restaurant typeahead shows a restaurant (``autocomplete.js`` builds the same)."""
+    location = f"{restaurant.city or ''}{restaurant.district or ''}"
+    return f"{restaurant.name}（{location}）" if location else restaurant.name
+
+
 def _meal_category_choices() -> list[tuple[str, str]]:
-    categories = (
-        Meal.objects.filter(category__isnull=False)
-        .exclude(category__exact="")
-        .values_list("category", flat=True)
-        .order_by("category")
-        .distinct()
-    )
-    choices = [("", "不限")]
-    choices.extend((category, category) for category in categories)
-    return choices
+    return [("", "不限"), *taxonomy.category_choices()]
+
+
+class TermListField(forms.CharField):
+    """Comma (or 、) separated free-text values, cleaned to a tuple."""
+
+    def to_python(self, value):
+        return taxonomy.split_terms(super().to_python(value))
+
+    def prepare_value(self, value):
+        if isinstance(value, (list, tuple)):
+            return ", ".join(value)
+        return value
 
 
 class MealCategoryChoiceMixin:
@@ -190,7 +206,19 @@ class MealRecordForm(forms.ModelForm):
         label="餐廳",
         required=False,
         queryset=Restaurant.objects.none(),
-        widget=forms.Select(attrs={"class": "select"}),
+        widget=forms.HiddenInput(),
+    )
+    restaurant_name = forms.CharField(
+        label="餐廳",
+        required=False,
+        widget=forms.TextInput(
+            attrs={
+                "placeholder": "輸入餐廳名稱搜尋",
+                "data-autocomplete-url": AUTOCOMPLETE_URL,
+                "data-autocomplete-kinds": "restaurant",
+                "data-autocomplete-target": "id_restaurant",
+            }
+        ),
     )
     source_meal = forms.ModelChoiceField(
         label="餐點",
@@ -253,7 +281,6 @@ class MealRecordForm(forms.ModelForm):
         self.fields["restaurant"].queryset = (
             Restaurant.objects.filter(is_active=True).order_by("name")
         )
-        self.fields["restaurant"].empty_label = "未指定"
         self.fields["source_meal"].queryset = Meal.objects.none()
         self.fields["source_meal"].empty_label = "請先選擇餐廳"
         selected_restaurant_id = self._determine_selected_restaurant()
@@ -266,6 +293,9 @@ class MealRecordForm(forms.ModelForm):
                 .order_by("name")
             )
             self.initial.setdefault("restaurant", selected_restaurant_id)
+            restaurant = Restaurant.objects.filter(pk=selected_restaurant_id).first()
+            if restaurant:
+                self.initial.setdefault("restaurant_name", restaurant_display_name(restaurant))
         if self.instance.pk and self.instance.source_meal_id:
             self.initial.setdefault("source_meal", self.instance.source_meal_id)
         self.fields["meal_name"].required = False
@@ -659,10 +689,14 @@ class FavoriteForm(forms.ModelForm):
         return meal
 
     def save(self, commit: bool = True):
-        favorite, _created = Favorite.objects.get_or_create(
-            user=self.user,
-            meal=self.cleaned_data["meal"],
-        )
+        meal = self.cleaned_data["meal"]
+        with transaction.atomic():
+            favorite, created = Favorite.objects.get_or_create(
+                user=self.user,
+                meal=meal,
+            )
+            if created:
+                adjust_favorite_count(meal, 1)
         return favorite
 
 
@@ -672,7 +706,12 @@ class RestaurantSearchForm(MealCategoryChoiceMixin, forms.Form):
         label="搜尋關鍵字",
         required=False,
         widget=forms.TextInput(
-            attrs={"placeholder": "輸入餐廳、餐點或關鍵字", "class": "search-input"}
+            attrs={
+                "placeholder": "輸入餐廳、餐點或關鍵字",
+                "class": "search-input",
+                "data-autocomplete-url": AUTOCOMPLETE_URL,
+                "data-autocomplete-kinds": "restaurant,meal",
+            }
         ),
     )
     city = forms.CharField(
@@ -686,14 +725,24 @@ class RestaurantSearchForm(MealCategoryChoiceMixin, forms.Form):
         label="行政區",
         required=False,
         widget=forms.TextInput(
-            attrs={"placeholder": "例：信義", "class": "filter-input"}
+            attrs={
+                "placeholder": "例：信義",
+                "class": "filter-input",
+                "data-autocomplete-url": AUTOCOMPLETE_URL,
+                "data-autocomplete-kinds": "district",
+            }
         ),
     )
     cuisine_type = forms.CharField(
         label="餐飲類型",
         required=False,
         widget=forms.TextInput(
-            attrs={"placeholder": "例：日式、火鍋", "class": "filter-input"}
+            attrs={
+                "placeholder": "例：日式、火鍋",
+                "class": "filter-input",
+                "data-autocomplete-url": AUTOCOMPLETE_URL,
+                "data-autocomplete-kinds": "cuisine",
+            }
         ),
     )
     category = forms.ChoiceField(
@@ -708,6 +757,20 @@ class RestaurantSearchForm(MealCategoryChoiceMixin, forms.Form):
         choices=[("", "不限")] + list(Restaurant.PriceRange.choices),
         widget=forms.Select(attrs={"class": "filter-input"}),
     )
+    include_tags = TermListField(
+        label="包含標籤",
+        required=False,
+        widget=forms.TextInput(
+            attrs={"placeholder": "例：低醣、高蛋白", "class": "filter-input"}
+        ),
+    )
+    exclude_allergens = TermListField(
+        label="排除過敏原",
+        required=False,
+        widget=forms.TextInput(
+            attrs={"placeholder": "例：花生、蝦", "class": "filter-input"}
+        ),
+    )
     latitude = forms.FloatField(required=False, widget=forms.HiddenInput())
     longitude = forms.FloatField(required=False, widget=forms.HiddenInput())
 
@@ -776,6 +839,31 @@ class RecommendationFilterForm(MealCategoryChoiceMixin, forms.Form):
     )
     is_vegetarian = forms.BooleanField(label="僅顯示素食", required=False)
     avoid_spicy = forms.BooleanField(label="避免辛辣", required=False)
+    include_tags = TermListField(
+        label="包含標籤",
+        required=False,
+        widget=forms.TextInput(attrs={"placeholder": "例如：低醣、高蛋白"}),
+    )
+    exclude_allergens = TermListField(
+        label="排除過敏原",
+        required=False,
+        widget=forms.TextInput(attrs={"placeholder": "例如：花生、蝦"}),
+    )
+    radius_km = forms.TypedChoiceField(
+        label="附近範圍",
+        required=False,
+        coerce=float,
+        empty_value=None,
+        choices=[
+            ("", "不限"),
+            ("0.5", "500 公尺內"),
+            ("1", "1 公里內"),
+            ("3", "3 公里內"),
+            ("5", "5 公里內"),
+        ],
+    )
+    latitude = forms.FloatField(required=False, widget=forms.HiddenInput())
+    longitude = forms.FloatField(required=False, widget=forms.HiddenInput())
     limit = forms.IntegerField(
         label="推薦數量",
         required=False,
@@ -789,6 +877,29 @@ class RecommendationFilterForm(MealCategoryChoiceMixin, forms.Form):
         limit = self.cleaned_data.get("limit") or 6
         return max(1, min(12, limit))
 
+    def clean_latitude(self):
+        value = self.cleaned_data.get("latitude")
+        if value is None:
+            return value
+        if not -90 <= value <= 90:
+            raise forms.ValidationError("緯度範圍需在 -90 到 90 之間。")
+        return value
+
+    def clean_longitude(self):
+        value = self.cleaned_data.get("longitude")
+        if value is None:
+            return value
+        if not -180 <= value <= 180:
+            raise forms.ValidationError("經度範圍需在 -180 到 180 之間。")
+        return value
+
+    def clean(self):
+        cleaned_data = super().clean()
+        located = cleaned_data.get("latitude") is not None and cleaned_data.get("longitude") is not None
+        if cleaned_data.get("radius_km") and not located:
+            raise forms.ValidationError("請先允許瀏覽器取得目前位置，才能搜尋附近餐點。")
+        return cleaned_data
+
     def normalized_filters(self):
         data = self.cleaned_data if hasattr(self, "cleaned_data") else self.initial
         return {
@@ -799,6 +910,11 @@ class RecommendationFilterForm(MealCategoryChoiceMixin, forms.Form):
             "district": (data.get("district") or "").strip() or None,
             "is_vegetarian": bool(data.get("is_vegetarian")),
             "avoid_spicy": bool(data.get("avoid_spicy")),
+            "include_tags": taxonomy.split_terms(data.get("include_tags")),
+            "exclude_allergens": taxonomy.split_terms(data.get("exclude_allergens")),
+            "radius_km": data.get("radius_km") or None,
+            "latitude": data.get("latitude"),
+            "longitude": data.get("longitude"),
             "limit": data.get("limit") or 6,
         }
 
@@ -819,3 +935,32 @@ NotificationSettingFormSet = forms.modelformset_factory(
     extra=0,
     can_delete=False,
 )
+
+
+class ViewportForm(forms.Form):
+    """Map bounds and zoom for the viewport search API; bounds are all or nothing."""
+
+    south = forms.FloatField(required=False, min_value=-90, max_value=90)
+    west = forms.FloatField(required=False, min_value=-180, max_value=180)
+    north = forms.FloatField(required=False, min_value=-90, max_value=90)
+    east = forms.FloatField(required=False, min_value=-180, max_value=180)
+    zoom = forms.IntegerField(required=False, min_value=0, max_value=22)
+    fit = forms.BooleanField(required=False)
+
+    BOUNDS = ("south", "west", "north", "east")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        given = [cleaned_data.get(name) is not None for name in self.BOUNDS]
+        if any(given) and not all(given):
+            raise forms.ValidationError("south、west、north、east 需同時提供。")
+        if all(given):
+            if cleaned_data["south"] > cleaned_data["north"]:
+                raise forms.ValidationError("south 不可大於 north。")
+            if cleaned_data.get("zoom") is None:
+                self.add_error("zoom", "提供範圍時需指定 zoom。")
+        return cleaned_data
+
+    @property
+    def has_bounds(self) -> bool:
+        return all(self.cleaned_data.get(name) is not None for name in self.BOUNDS)
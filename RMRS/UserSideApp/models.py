@@ -226,6 +226,18 @@ class MealComponent(models.Model):
 			raise ValidationError("必須指定飲食紀錄或餐點之一。")
 		super().clean()
 
+	def save(self, *args, **kwargs):
+		super().save(*args, **kwargs)
+		if self.meal_id:
+			self.meal.sync_allergens()
+
+	def delete(self, *args, **kwargs):
+		meal = self.meal if self.meal_id else None
+		result = super().delete(*args, **kwargs)
+		if meal is not None:
+			meal.sync_allergens()
+		return result
+
 	def __str__(self) -> str:
 		target = self.meal_record_id or self.meal_id
 		return f"Component {self.name} -> {target}"
@@ -0,0 +1,152 @@
+"""Keyset pagination and capped counts for search results.
+
+A page continues after the last row of the previous one, so it costs an
+index range scan rather than an ``OFFSET`` walk. The cursor is the signed
+list of that row's ordering values. Ordering keys must be non-null and end
+in a unique column (``pk``).
+
+Totals are counted up to a cap over a ``LIMIT``-ed subquery and shown as
+"1000+" beyond it. When the recommendation cache is shared by all workers,
+they are cached per normalized filter set and catalog version, so later
+pages of the same search do not count again.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.db.models import Q
+
+from RecommendationSystem.result_cache import catalog_version, shared_cache_enabled
+
+
+CURSOR_SALT = "usersideapp.search.cursor"
+COUNT_KEY = "search:count:{version}:{kind}:{digest}"
+
+
+@dataclass(frozen=True)
+class KeysetPage:
+    items: List[Any]
+    next_cursor: Optional[str]
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+
+@dataclass(frozen=True)
+class ResultCount:
+    """A total that stops counting at ``cap``; renders as "1000+" when it did."""
+
+    value: int
+    capped: bool = False
+
+    def __str__(self) -> str:
+        return f"{self.value}+" if self.capped else str(self.value)
+
+
+def count_cap() -> int:
+    return int(getattr(settings, "RECOMMENDATION_SEARCH_COUNT_CAP", 1000))
+
+
+def count_ttl() -> int:
+    return int(getattr(settings, "RECOMMENDATION_SEARCH_COUNT_TTL", 300))
+
+
+def _cache():
+    return caches[getattr(settings, "RECOMMENDATION_CACHE", "default")]
+
+
+def _json_value(value):
+    return str(value) if isinstance(value, Decimal) else value
+
+
+def encode_cursor(values: Sequence) -> str:
+    return signing.dumps([_json_value(value) for value in values], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token: Optional[str], size: int) -> Optional[list]:
+    """The key values in ``token``, or None when it is missing, forged or for another ordering."""
+    if not token:
+        return None
+    try:
+        values = signing.loads(token, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def _field(key: str) -> str:
+    return key.lstrip("-")
+
+
+def _after(ordering: Sequence[str], values: Sequence) -> Q:
+    """Rows strictly after ``values`` under ``ordering``."""
+    condition = Q()
+    equal = Q()
+    for key, value in zip(ordering, values):
+        lookup = "lt" if key.startswith("-") else "gt"
+        condition |= equal & Q(**{f"{_field(key)}__{lookup}": value})
+        equal &= Q(**{_field(key): value})
+    return condition
+
+
+def keyset_page(queryset, cursor: Optional[str], size: int) -> KeysetPage:
+    """The ``size`` rows of an ordered ``queryset`` that follow ``cursor``."""
+    ordering = [str(key) for key in queryset.query.order_by]
+    if not ordering or _field(ordering[-1]) not in {"pk", "id"}:
+        raise ValueError("Keyset pagination needs an ordering ending in the primary key")
+    values = decode_cursor(cursor, len(ordering))
+    if values is not None:
+        queryset = queryset.filter(_after(ordering, values))
+    rows = list(queryset[: size + 1])
+    if len(rows) <= size:
+        return KeysetPage(items=rows, next_cursor=None)
+    rows = rows[:size]
+    last = rows[-1]
+    return KeysetPage(items=rows, next_cursor=encode_cursor([getattr(last, _field(key)) for key in ordering]))
+
+
+def query_digest(cleaned_filters: dict) -> str:
+    """Stable hash of search filters with strings trimmed and casefolded."""
+    normalized = {
+        name: (value.strip().casefold() or None) if isinstance(value, str) else value
+        for name, value in cleaned_filters.items()
+    }
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def capped_count(queryset, cap: Optional[int] = None) -> ResultCount:
+    """Count the rows of ``queryset``, stopping at ``cap``."""
+    cap = count_cap() if cap is None else cap
+    counted = queryset.order_by().values("pk")[: cap + 1].count()
+    return ResultCount(value=min(counted, cap), capped=counted > cap)
+
+
+def cached_count(queryset, kind: str, cleaned_filters: dict) -> ResultCount:
+    """:func:`capped_count`, cached per normalized filters until the catalog changes.
+
+    Only cached in a shared cache: a per-process catalog version would keep
+    serving a stale total in every worker but the one that wrote.
+    """
+    ttl = count_ttl()
+    if ttl <= 0 or not shared_cache_enabled():
+        return capped_count(queryset)
+    cache = _cache()
+    key = COUNT_KEY.format(version=catalog_version(), kind=kind, digest=query_digest(cleaned_filters))
+    cached = cache.get(key)
+    if cached is not None:
+        return ResultCount(*cached)
+    count = capped_count(queryset)
+    cache.set(key, (count.value, count.capped), ttl)
+    return count
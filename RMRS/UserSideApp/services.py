@@ -1,15 +1,41 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import date, time, timedelta
-from typing import Dict, List, Optional, Tuple
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from django.db.models import Count, Q, Sum
+import numpy as np
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q, Sum
 from django.utils import timezone
 
+from MerchantSideApp import taxonomy
+from MerchantSideApp.geo import cells_q, covering_cells, haversine_km
 from MerchantSideApp.models import Meal, Restaurant
-from RecommendationSystem.services import recent_selected_meal_ids
+from RecommendationSystem.catalog import (
+    CatalogColumns,
+    catalog_index,
+    catalog_index_enabled,
+    catalog_rows,
+    shared_pool_cache,
+)
+from RecommendationSystem.dietary import dietary_index
+from RecommendationSystem.exclusions import UserExclusions, get_user_exclusions
+from RecommendationSystem.models import PersonalizedRecommendation
+from RecommendationSystem.nutrition import MAIN_MEALS, meal_target, nutrition_matrix
+from RecommendationSystem.result_cache import (
+    ID_DTYPE,
+    cached_ranking,
+    ranking_version,
+    result_cache_depth,
+    result_cache_ttl,
+)
+from RecommendationSystem.sampling import sample_queryset
+from RecommendationSystem.services import get_recommendation_cooldown_days, recently_selected
+from RecommendationSystem.similarity import neighbors_of
 
+from .async_utils import gather_sync
 from .models import (
     AppUser,
     DailyMealRecord,
@@ -29,6 +55,8 @@ class TodayMealStats:
     total_carbs: float
     total_fat: float
     by_meal_type: Dict[str, Dict[str, float]]
+    # Only records logged from a merchant meal carry sodium.
+    total_sodium: float = 0.0
 
 
 def get_week_bounds(target_date: date) -> Tuple[date, date]:
@@ -81,27 +109,34 @@ def recalculate_weekly_summary(user: AppUser, reference_date: Optional[date] = N
 
 def summarize_today(user: AppUser, target_date: Optional[date] = None) -> TodayMealStats:
     target_date = target_date or timezone.now().date()
-    qs = DailyMealRecord.objects.filter(user=user, date=target_date)
-    totals = qs.aggregate(
-        total_calories=Sum("calories"),
-        total_protein=Sum("protein_grams"),
-        total_carbs=Sum("carb_grams"),
-        total_fat=Sum("fat_grams"),
+    rows = (
+        DailyMealRecord.objects.filter(user=user, date=target_date)
+        .order_by("meal_type")
+        .values("meal_type")
+        .annotate(
+            calories=Sum("calories"),
+            protein=Sum("protein_grams"),
+            carbs=Sum("carb_grams"),
+            fat=Sum("fat_grams"),
+            sodium=Sum("source_meal__nutrition__sodium"),
+        )
     )
     per_type: Dict[str, Dict[str, float]] = {}
-    for record in qs:
-        stats = per_type.setdefault(record.meal_type, {
-            "calories": 0,
-            "protein": 0,
-        })
-        stats["calories"] += float(record.calories)
-        stats["protein"] += float(record.protein_grams)
+    totals = {"calories": 0.0, "protein": 0.0, "carbs": 0.0, "fat": 0.0, "sodium": 0.0}
+    for row in rows:
+        for key in totals:
+            totals[key] += float(row[key] or 0)
+        per_type[row["meal_type"]] = {
+            "calories": float(row["calories"] or 0),
+            "protein": float(row["protein"] or 0),
+        }
     return TodayMealStats(
-        total_calories=float(totals["total_calories"] or 0),
-        total_protein=float(totals["total_protein"] or 0),
-        total_carbs=float(totals["total_carbs"] or 0),
-        total_fat=float(totals["total_fat"] or 0),
+        total_calories=totals["calories"],
+        total_protein=totals["protein"],
+        total_carbs=totals["carbs"],
+        total_fat=totals["fat"],
         by_meal_type=per_type,
+        total_sodium=totals["sodium"],
     )
 
 
@@ -411,26 +446,132 @@ class RecommendationFilters:
     district: Optional[str] = None
     is_vegetarian: bool = False
     avoid_spicy: bool = False
+    include_tags: Tuple[str, ...] = ()
+    exclude_allergens: Tuple[str, ...] = ()
+    near: Optional[Tuple[float, float]] = None
+    radius_km: float = 1.0
     limit: int = 6
 
 
+@dataclass
+class RecommendationSection:
+    key: str
+    title: str
+    subtitle: str
+    meals: List[Meal] = field(default_factory=list)
+
+
+@dataclass
+class RecommendationPage:
+    """Primary picks plus secondary sections derived from one candidate pool."""
+
+    primary: List[Meal]
+    primary_source: Optional[str]
+    sections: List[RecommendationSection]
+
+
 class RecommendationEngine:
     """High-level helper inspired by the CLI RecommendationEngine."""
 
     DEFAULT_LIMIT = 6
+    SECTION_LIMIT = 4
+    SIMILARITY_SEEDS = 5
+    RANKING_ORDER_BY = {
+        "rating": ("-restaurant__rating", "name"),
+        "popular": ("-favorite_count", "-restaurant__rating", "name"),
+        "newest": ("-created_at",),
+    }
+    # Sections whose ranking is the same for every user apart from cooldown.
+    SHARED_SECTIONS = {
+        "popular": (RecommendationFilters(), "popular"),
+        "budget": (RecommendationFilters(price_range=Restaurant.PriceRange.LOW), "rating"),
+        "vegetarian": (RecommendationFilters(is_vegetarian=True), "rating"),
+        "mild": (RecommendationFilters(avoid_spicy=True), "rating"),
+    }
+    # Rankings whose top rows make up the user-independent part of the bounded pool.
+    # The unfiltered "rating" ranking is the primary list of users without preferences.
+    POOL_RANKINGS = (
+        *SHARED_SECTIONS.values(),
+        (RecommendationFilters(), "rating"),
+        (RecommendationFilters(), "newest"),
+    )
+    SECONDARY_SECTIONS = (
+        ("for_you", "為你推薦", "口味相近的使用者也喜歡"),
+        ("because_you_liked", "因為你喜歡{seed}", "與你收藏的餐點相似"),
+        ("fits_budget", "剛好的份量", "依今日剩餘的熱量與營養素挑選"),
+        ("popular", "熱門收藏", "依收藏數排序"),
+        ("budget", "親民價位", "低價位也能享受美味"),
+        ("vegetarian", "素食推薦", "友善素食選擇"),
+        ("mild", "清爽不辣", "適合想吃清淡的一天"),
+        ("new_experiences", "新的體驗", "你尚未收藏或評論過"),
+    )
 
-    def __init__(self, user: Optional[AppUser] = None):
+    def __init__(self, user: Optional[AppUser] = None, pool: Optional[CatalogColumns] = None):
+        """``pool`` is a :meth:`candidate_pool` built by another engine, shared to skip reloading it."""
         self.user = user
+        self._cooldown_ids: Optional[np.ndarray] = None
+        self._random_ids: Optional[np.ndarray] = None
+        self._liked_seeds: List[str] = []
+        self._prefetched: Dict[object, object] = {}
+        if pool is not None:
+            self._prefetched["pool"] = pool
+
+    def _memo(self, key: object, load):
+        """The value stored under ``key`` (by :meth:`aprefetch` or an earlier call), else ``load()``."""
+        if key not in self._prefetched:
+            self._prefetched[key] = load()
+        return self._prefetched[key]
+
+    def _catalog(self):
+        """Return the in-memory catalog columns when the index is enabled."""
+        if not catalog_index_enabled():
+            return None
+        return catalog_index.columns()
+
+    def _exclusions(self) -> UserExclusions:
+        """The user's cooldown and seen sets, read once per engine instance."""
+        return self._memo("exclusions", lambda: get_user_exclusions(self.user))
+
+    def _excluded_ids(self) -> np.ndarray:
+        """Meals inside the user's cooldown window."""
+        if self._cooldown_ids is None:
+            if getattr(self.user, "pk", None):
+                days = get_recommendation_cooldown_days(self.user)
+                self._cooldown_ids = self._exclusions().cooldown_ids(days)
+            else:
+                self._cooldown_ids = UserExclusions.empty().selected_ids
+        return self._cooldown_ids
+
+    def _hydrate(self, meal_ids: Iterable[int], catalog=None) -> List[Meal]:
+        """Load meals for ranked ids in one query, preserving the ranking."""
+        meal_ids = [int(meal_id) for meal_id in meal_ids]
+        if not meal_ids:
+            return []
+        meals = (
+            Meal.objects.filter(is_recommendable=True)
+            .select_related("restaurant")
+            .in_bulk(meal_ids)
+        )
+        counts = catalog.favorite_counts(meal_ids) if catalog is not None else {}
+        ordered = []
+        for meal_id in meal_ids:
+            meal = meals.get(meal_id)
+            if meal is None:
+                continue
+            meal.favorite_count = counts.get(meal_id, meal.favorite_count)
+            ordered.append(meal)
+        return ordered
+
+    def _catalog_top_k(self, catalog, mask, ordering: str, limit: int) -> List[Meal]:
+        return self._hydrate(catalog.top_k(mask, ordering, limit), catalog)
 
     def _base_queryset(self):
         qs = (
-            Meal.objects.filter(is_available=True, restaurant__is_active=True)
+            Meal.objects.filter(is_recommendable=True)
             .select_related("restaurant")
-            .annotate(favorite_count=Count("favorited_by"))
         )
         if getattr(self.user, "pk", None):
-            recent_ids = recent_selected_meal_ids(self.user)
-            qs = qs.exclude(pk__in=recent_ids)
+            qs = qs.exclude(recently_selected(self.user))
         return qs
 
     def _ensure_limit(self, limit: Optional[object]) -> int:
@@ -454,6 +595,11 @@ class RecommendationEngine:
         }
 
     def filters_from_data(self, data: Dict[str, object], limit: Optional[int] = None) -> RecommendationFilters:
+        latitude, longitude = data.get("latitude"), data.get("longitude")
+        radius_km = data.get("radius_km")
+        near = None
+        if latitude is not None and longitude is not None and radius_km:
+            near = (float(latitude), float(longitude))
         return RecommendationFilters(
             cuisine_type=str(data.get("cuisine_type") or "").strip() or None,
             category=str(data.get("category") or "").strip() or None,
@@ -462,6 +608,10 @@ class RecommendationEngine:
             district=str(data.get("district") or "").strip() or None,
             is_vegetarian=bool(data.get("is_vegetarian")),
             avoid_spicy=bool(data.get("avoid_spicy")),
+            include_tags=taxonomy.split_terms(data.get("include_tags")),
+            exclude_allergens=taxonomy.split_terms(data.get("exclude_allergens")),
+            near=near,
+            radius_km=float(radius_km) if near else RecommendationFilters.radius_km,
             limit=self._ensure_limit(limit or data.get("limit")),
         )
 
@@ -481,23 +631,92 @@ class RecommendationEngine:
             limit=self._ensure_limit(limit),
         )
 
-    def apply_filters(self, filters: RecommendationFilters) -> List[Meal]:
-        qs = self._base_queryset()
+    def _filter_queryset(self, qs, filters: RecommendationFilters):
         if filters.cuisine_type:
-            qs = qs.filter(restaurant__cuisine_type__icontains=filters.cuisine_type)
+            qs = qs.filter(restaurant__cuisine_ref__in=taxonomy.cuisine_ids(filters.cuisine_type))
         if filters.category:
-            qs = qs.filter(category__iexact=filters.category)
+            qs = qs.filter(category_ref__in=taxonomy.category_ids(filters.category))
         if filters.price_range:
             qs = qs.filter(restaurant__price_range=filters.price_range)
         if filters.city:
-            qs = qs.filter(restaurant__city__icontains=filters.city)
+            qs = qs.filter(restaurant__region_ref__in=taxonomy.city_ids(filters.city))
         if filters.district:
-            qs = qs.filter(restaurant__district__icontains=filters.district)
+            qs = qs.filter(restaurant__region_ref__in=taxonomy.district_ids(filters.district))
         if filters.is_vegetarian:
             qs = qs.filter(is_vegetarian=True)
         if filters.avoid_spicy:
             qs = qs.filter(Q(is_spicy=False) | Q(is_spicy__isnull=True))
-        return list(qs.order_by("-restaurant__rating", "name")[: filters.limit])
+        dietary = dietary_index.selection(filters.include_tags, filters.exclude_allergens)
+        if dietary is not None:
+            qs = dietary.apply(qs)
+        if filters.near:
+            cells = covering_cells(*filters.near, filters.radius_km)
+            qs = qs.filter(cells_q(cells, "restaurant__geohash"))
+        return qs
+
+    def _nearest_meals(self, filters: RecommendationFilters, limit: int) -> List[Meal]:
+        """Meals within ``filters.radius_km`` of ``filters.near``, closest first.
+
+        The geohash cells bound the candidate rows; exact distances are then
+        computed for those rows in one vectorized pass.
+        """
+        catalog = self._catalog()
+        if catalog is not None:
+            mask = catalog.filter_mask(filters, self._excluded_ids())
+            return self._hydrate(catalog.nearest(mask, *filters.near, limit), catalog)
+        return self._hydrate(self._nearest_ids(filters, limit))
+
+    def _nearest_ids(self, filters: RecommendationFilters, limit: int) -> List[int]:
+        rows = list(
+            self._filter_queryset(self._base_queryset(), filters)
+            .values_list("pk", "name", "restaurant__latitude", "restaurant__longitude")
+        )
+        if not rows:
+            return []
+        meal_ids, names, latitudes, longitudes = zip(*rows)
+        distances = haversine_km(*filters.near, np.array(latitudes, dtype=float), np.array(longitudes, dtype=float))
+        within = np.flatnonzero(distances <= filters.radius_km)
+        order = sorted(within, key=lambda row: (distances[row], names[row]))[:limit]
+        return [meal_ids[row] for row in order]
+
+    def _shared_ranking(self, filters: RecommendationFilters, ordering: str, pool=None, source: str = "db"):
+        """User-independent ranked ids for ``filters`` from the shared result cache."""
+        if pool is not None:
+            compute = lambda depth: pool.top_k(pool.filter_mask(filters), ordering, depth)
+        else:
+            recommendable = Meal.objects.filter(is_recommendable=True)
+            compute = lambda depth: list(
+                self._filter_queryset(recommendable, filters)
+                .order_by(*self.RANKING_ORDER_BY[ordering])
+                .values_list("pk", flat=True)[:depth]
+            )
+        if filters.exclude_allergens:
+            # Never serve an allergen filter from a ranking cached before another process's write.
+            return np.asarray(compute(result_cache_depth()), dtype=ID_DTYPE)
+        return cached_ranking(source, filters, ordering, compute)
+
+    @staticmethod
+    def _ranking_exhausted(ranked: np.ndarray, picked: np.ndarray, limit: int) -> bool:
+        """True when filtering left too few ids from a full-depth ranking, so deeper rows may qualify."""
+        return picked.size < limit and ranked.size >= result_cache_depth()
+
+    def _ranked_meals(self, filters: RecommendationFilters, ordering: str, limit: int) -> List[Meal]:
+        """Serve a shared ranking with this user's cooldown applied after the cache hit."""
+        if filters.near:
+            return self._nearest_meals(filters, limit)
+        catalog = self._catalog()
+        ranked = self._shared_ranking(filters, ordering, catalog, "index" if catalog is not None else "db")
+        picked = ranked[~np.isin(ranked, self._excluded_ids())][:limit]
+        if not self._ranking_exhausted(ranked, picked, limit):
+            return self._hydrate(picked, catalog)
+        if catalog is not None:
+            mask = catalog.filter_mask(filters, self._excluded_ids())
+            return self._catalog_top_k(catalog, mask, ordering, limit)
+        qs = self._filter_queryset(self._base_queryset(), filters)
+        return list(qs.order_by(*self.RANKING_ORDER_BY[ordering])[:limit])
+
+    def apply_filters(self, filters: RecommendationFilters) -> List[Meal]:
+        return self._ranked_meals(filters, "rating", filters.limit)
 
     def preference_recommendations(self, limit: Optional[int] = None) -> List[Meal]:
         preference = getattr(self.user, "preferences", None)
@@ -508,53 +727,433 @@ class RecommendationEngine:
         return self.random_meals(filters.limit)
 
     def random_meals(self, limit: Optional[int] = None) -> List[Meal]:
-        return list(
-            self._base_queryset()
-            .order_by("?")
-            [: self._ensure_limit(limit)]
-        )
+        limit = self._ensure_limit(limit)
+        catalog = self._catalog()
+        if catalog is not None:
+            mask = catalog.base_mask(self._excluded_ids())
+            return self._hydrate(catalog.sample(mask, limit), catalog)
+        if getattr(settings, "RECOMMENDATION_RANDOM_SAMPLING", "probe") == "order_by":
+            return list(self._base_queryset().order_by("?")[:limit])
+        return sample_queryset(self._base_queryset(), limit)
 
     def popular_meals(self, limit: Optional[int] = None) -> List[Meal]:
-        return list(
-            self._base_queryset()
-            .order_by("-favorite_count", "-restaurant__rating", "name")
-            [: self._ensure_limit(limit)]
-        )
+        filters, ordering = self.SHARED_SECTIONS["popular"]
+        return self._ranked_meals(filters, ordering, self._ensure_limit(limit))
 
     def budget_friendly(self, limit: Optional[int] = None) -> List[Meal]:
-        return list(
-            self._base_queryset()
-            .filter(restaurant__price_range=Restaurant.PriceRange.LOW)
-            .order_by("-restaurant__rating", "name")[: self._ensure_limit(limit)]
-        )
+        filters, ordering = self.SHARED_SECTIONS["budget"]
+        return self._ranked_meals(filters, ordering, self._ensure_limit(limit))
 
     def vegetarian_spotlight(self, limit: Optional[int] = None) -> List[Meal]:
-        return list(
-            self._base_queryset()
-            .filter(is_vegetarian=True)
-            .order_by("-restaurant__rating", "name")[: self._ensure_limit(limit)]
-        )
+        filters, ordering = self.SHARED_SECTIONS["vegetarian"]
+        return self._ranked_meals(filters, ordering, self._ensure_limit(limit))
 
     def mild_flavor(self, limit: Optional[int] = None) -> List[Meal]:
-        return list(
-            self._base_queryset()
-            .filter(Q(is_spicy=False) | Q(is_spicy__isnull=True))
-            .order_by("-restaurant__rating", "name")[: self._ensure_limit(limit)]
-        )
+        filters, ordering = self.SHARED_SECTIONS["mild"]
+        return self._ranked_meals(filters, ordering, self._ensure_limit(limit))
 
     def new_experiences(self, limit: Optional[int] = None) -> List[Meal]:
         qs = self._base_queryset()
-        if self.user:
-            seen_ids = set(
-                Favorite.objects.filter(user=self.user).values_list("meal_id", flat=True)
-            )
-            seen_ids.update(
-                Review.objects.filter(user=self.user).values_list("meal_id", flat=True)
+        if getattr(self.user, "pk", None):
+            qs = qs.exclude(
+                Exists(Favorite.objects.filter(user=self.user, meal=OuterRef("pk")))
+            ).exclude(
+                Exists(Review.objects.filter(user=self.user, meal=OuterRef("pk")))
             )
-            if seen_ids:
-                qs = qs.exclude(pk__in=seen_ids)
         return list(qs.order_by("-created_at")[: self._ensure_limit(limit)])
 
+    def _seen_meal_ids(self) -> np.ndarray:
+        """Meals the user already favorited or reviewed."""
+        return self._exclusions().seen_ids
+
+    def candidate_pool(
+        self,
+        strategy: Optional[str] = None,
+        filters: Optional[RecommendationFilters] = None,
+        sections: Iterable[str] = (),
+        section_limit: Optional[int] = None,
+    ) -> CatalogColumns:
+        """Candidate meals as catalog columns.
+
+        The catalog index when enabled. Otherwise a bounded pool: the
+        :meth:`shared_pool` plus the rows the primary ``strategy`` and the
+        given ``sections`` may pick for this user outside it (the filtered
+        ranking, nearest or sampled meals, collaborative, similar-dish and
+        nutrition picks), so a request never loads the whole catalog.
+        """
+        pool = self._memo("pool", self._base_pool)
+        if catalog_index_enabled():
+            return pool
+        ids = self._primary_candidate_ids(strategy, filters)
+        for key in sections:
+            ids.extend(self._section_candidate_ids(key, section_limit or self.SECTION_LIMIT))
+        missing = sorted({int(meal_id) for meal_id in ids if pool.position(meal_id) is None})
+        if not missing:
+            return pool
+        return pool.extended(catalog_rows(missing, recommendable_only=True))
+
+    def _base_pool(self) -> CatalogColumns:
+        catalog = self._catalog()
+        if catalog is not None:
+            return catalog
+        return self.shared_pool()
+
+    def shared_pool(self) -> CatalogColumns:
+        """Rows of the top ``result_cache_depth()`` ids of every ``POOL_RANKINGS`` entry.
+
+        The rankings are indexed ``ORDER BY ... LIMIT`` queries served from
+        the shared result cache, and the rows are kept process-wide until
+        one of those rankings changes version, so a warm call costs no
+        query at all.
+        """
+        versions = sorted({ranking_version(ordering) for _filters, ordering in self.POOL_RANKINGS})
+        return shared_pool_cache.columns(
+            (result_cache_depth(), *versions), self._load_shared_pool, result_cache_ttl()
+        )
+
+    def _load_shared_pool(self) -> CatalogColumns:
+        ids = set()
+        for filters, ordering in self.POOL_RANKINGS:
+            ids.update(self._shared_ranking(filters, ordering).tolist())
+        pool = CatalogColumns()
+        pool.load(catalog_rows(sorted(ids), recommendable_only=True) if ids else ())
+        return pool
+
+    def _primary_candidate_ids(self, strategy: Optional[str], filters: Optional[RecommendationFilters]) -> List[int]:
+        """Ids the primary picks of ``strategy`` may need beyond the shared pool."""
+        if filters is None:
+            return []
+        ids: List[int] = []
+        if strategy in ("filters", "preferences"):
+            if filters.near:
+                ids = self._nearest_ids(filters, result_cache_depth())
+            else:
+                ranked = self._shared_ranking(filters, "rating")
+                ids = ranked[~np.isin(ranked, self._excluded_ids())].tolist()
+        if strategy == "random" or (strategy == "preferences" and not ids):
+            self._random_ids = np.array(
+                [meal.pk for meal in sample_queryset(self._base_queryset(), filters.limit)], dtype=np.int64
+            )
+            ids.extend(self._random_ids.tolist())
+        return ids
+
+    def _section_candidate_ids(self, key: str, limit: int) -> List[int]:
+        """Ids a per-user section may pick that no shared ranking covers."""
+        if key == "for_you":
+            return list(self._personalized_ids())
+        if key == "because_you_liked":
+            return list(self._similar_to_recent_favorites(limit * 5))
+        if key == "fits_budget":
+            target = self._nutrition_target()
+            if target is None:
+                return []
+            matrix = nutrition_matrix.matrix()
+            candidates = matrix.meal_id[~np.isin(matrix.meal_id, self._excluded_ids())]
+            return matrix.rank(target, candidates, result_cache_depth()).tolist()
+        return []
+
+    def _sample(self, pool: CatalogColumns, available, limit: int) -> np.ndarray:
+        """Random ids among ``available``; a bounded pool draws from the meals sampled into it."""
+        if self._random_ids is not None:
+            available = available & np.isin(pool.meal_id, self._random_ids)
+        return pool.sample(available, limit)
+
+    def _personalized_ids(self) -> List[int]:
+        """Precomputed collaborative-filtering picks, best first (one indexed read)."""
+        if not getattr(self.user, "pk", None):
+            return []
+        return self._memo(
+            "personalized",
+            lambda: (
+                PersonalizedRecommendation.objects.filter(user=self.user)
+                .values_list("meal_ids", flat=True)
+                .first()
+            )
+            or [],
+        )
+
+    def personalized_meals(self, limit: Optional[int] = None) -> List[Meal]:
+        """Serve the "為你推薦" list, skipping meals on cooldown or no longer offered."""
+        limit = self._ensure_limit(limit)
+        ranked = np.array(self._personalized_ids(), dtype=np.int64)
+        if not ranked.size:
+            return []
+        ranked = ranked[~np.isin(ranked, self._excluded_ids())]
+        catalog = self._catalog()
+        if catalog is not None:
+            available = catalog.meal_id[catalog.base_mask()]
+            return self._hydrate(ranked[np.isin(ranked, available)][:limit], catalog)
+        meals = self._base_queryset().in_bulk(ranked.tolist())
+        return [meals[meal_id] for meal_id in ranked.tolist() if meal_id in meals][:limit]
+
+    def _similar_to_recent_favorites(self, limit: int) -> List[int]:
+        """Neighbors of the user's latest favorites from the precomputed similarity table."""
+        if not getattr(self.user, "pk", None):
+            return []
+        return self._memo(("similar", limit), lambda: self._load_similar(limit))
+
+    def _load_similar(self, limit: int) -> List[int]:
+        seeds = list(
+            Favorite.objects.filter(user=self.user)
+            .order_by("-created_at")
+            .values_list("meal_id", "meal__name")[: self.SIMILARITY_SEEDS]
+        )
+        if not seeds:
+            return []
+        self._liked_seeds = [name for _meal_id, name in seeds]
+        return neighbors_of([meal_id for meal_id, _name in seeds], limit)
+
+    def _seed_label(self) -> str:
+        """The favorites behind "因為你喜歡…": up to two names, then how many in total."""
+        names = [f"「{name}」" for name in self._liked_seeds]
+        if len(names) <= 2:
+            return "、".join(names)
+        return f"{'、'.join(names[:2])}等 {len(names)} 道餐點"
+
+    def _nutrition_target(self) -> Optional[np.ndarray]:
+        """Macros one more meal should bring today, from the user's logged meals."""
+        if not getattr(self.user, "pk", None):
+            return None
+        return self._memo("nutrition_target", self._load_nutrition_target)
+
+    def _load_nutrition_target(self) -> np.ndarray:
+        today = summarize_today(self.user)
+        consumed = (
+            today.total_calories,
+            today.total_protein,
+            today.total_carbs,
+            today.total_fat,
+            today.total_sodium,
+        )
+        logged = sum(1 for meal_type in today.by_meal_type if meal_type in MAIN_MEALS)
+        return meal_target(consumed, logged)
+
+    def nutrition_fit_meals(self, limit: Optional[int] = None) -> List[Meal]:
+        """Meals closest to the user's remaining daily budget, skipping cooldown picks."""
+        target = self._nutrition_target()
+        if target is None:
+            return []
+        pool = self.candidate_pool(sections=("fits_budget",))
+        available = pool.base_mask(self._excluded_ids())
+        ranked = nutrition_matrix.matrix().rank(target, pool.meal_id[available], self._ensure_limit(limit))
+        return self._hydrate(ranked, pool)
+
+    def _pool_ranking(
+        self,
+        pool: CatalogColumns,
+        filters: RecommendationFilters,
+        ordering: str,
+        available,
+        limit: int,
+        shown=(),
+    ):
+        """Top ``limit`` of a shared ranking among ``available`` pool rows, skipping ``shown`` ids."""
+        if filters.near:
+            return pool.nearest(available & pool.filter_mask(filters), *filters.near, limit)
+        if catalog_index_enabled():
+            ranked = self._shared_ranking(filters, ordering, pool, "index")
+        else:
+            ranked = self._shared_ranking(filters, ordering)
+        picked = ranked[np.isin(ranked, pool.meal_id[available])][:limit]
+        if self._ranking_exhausted(ranked, picked, limit):
+            picked = self._deeper_ids(pool, filters, ordering, available, limit, shown)
+        return picked
+
+    def _deeper_ids(self, pool: CatalogColumns, filters, ordering: str, available, limit: int, exclude_ids=()):
+        """Top ``limit`` ids of a ranking among ``available`` rows, past the cached depth.
+
+        A bounded pool only holds the top of each ranking, so the remainder
+        comes from the database, skipping pool rows that are not available
+        and ``exclude_ids`` (which may lie outside the pool).
+        """
+        if catalog_index_enabled():
+            return pool.top_k(available & pool.filter_mask(filters), ordering, limit)
+        skipped = [*pool.meal_id[~available].tolist(), *(int(meal_id) for meal_id in exclude_ids)]
+        qs = self._filter_queryset(self._base_queryset(), filters).exclude(pk__in=skipped)
+        ids = qs.order_by(*self.RANKING_ORDER_BY[ordering]).values_list("pk", flat=True)[:limit]
+        return np.array(list(ids), dtype=np.int64)
+
+    def _section_candidates(self, pool: CatalogColumns, key: str, available, limit: int, shown=()):
+        if key == "because_you_liked":
+            ranked = np.array(self._similar_to_recent_favorites(limit * 5), dtype=np.int64)
+            return ranked[np.isin(ranked, pool.meal_id[available])][:limit]
+        if key == "fits_budget":
+            target = self._nutrition_target()
+            if target is None:
+                return np.empty(0, dtype=np.int64)
+            return nutrition_matrix.matrix().rank(target, pool.meal_id[available], limit)
+        if key == "for_you":
+            ranked = np.array(self._personalized_ids(), dtype=np.int64)
+            return ranked[np.isin(ranked, pool.meal_id[available])][:limit]
+        if key in self.SHARED_SECTIONS:
+            filters, ordering = self.SHARED_SECTIONS[key]
+            return self._pool_ranking(pool, filters, ordering, available, limit, shown)
+        if key == "new_experiences":
+            seen = self._seen_meal_ids()
+            fresh = available & ~np.isin(pool.meal_id, seen)
+            picked = pool.top_k(fresh, "newest", limit)
+            if picked.size < limit and not catalog_index_enabled():
+                filters = RecommendationFilters()
+                if self._ranking_exhausted(self._shared_ranking(filters, "newest"), picked, limit):
+                    picked = self._deeper_ids(pool, filters, "newest", fresh, limit, [*seen.tolist(), *shown])
+            return picked
+        raise ValueError(f"Unknown recommendation section: {key}")
+
+    def _primary_ids(self, pool: CatalogColumns, strategy: Optional[str], filters: RecommendationFilters, available):
+        """Primary pick ids and the strategy that produced them ("popular" when falling back)."""
+        limit = filters.limit
+        source = strategy
+        primary_ids = np.empty(0, dtype=np.int64)
+        if strategy in ("filters", "preferences"):
+            primary_ids = self._pool_ranking(pool, filters, "rating", available, limit)
+            if not primary_ids.size and strategy == "preferences":
+                primary_ids = self._sample(pool, available, limit)
+        elif strategy == "random":
+            primary_ids = self._sample(pool, available, limit)
+        if not primary_ids.size:
+            popular_filters, ordering = self.SHARED_SECTIONS["popular"]
+            primary_ids = self._pool_ranking(pool, popular_filters, ordering, available, limit)
+            source = "popular"
+        return primary_ids, source
+
+    def build_primary(self, strategy: Optional[str], filters: RecommendationFilters) -> RecommendationPage:
+        """The primary picks of :meth:`build_page` alone, with no sections.
+
+        Costs the candidate pool plus one hydration query, so the page can
+        show its first cards before any section is computed.
+        """
+        pool = self.candidate_pool(strategy, filters)
+        available = pool.base_mask(self._excluded_ids())
+        primary_ids, source = self._primary_ids(pool, strategy, filters, available)
+        return RecommendationPage(primary=self._hydrate(primary_ids, pool), primary_source=source, sections=[])
+
+    def build_section(
+        self,
+        key: str,
+        exclude_ids: Iterable[int] = (),
+        limit: Optional[int] = None,
+    ) -> RecommendationSection:
+        """One secondary section on its own, skipping ``exclude_ids`` (meals already shown).
+
+        Raises ``ValueError`` for a key outside ``SECONDARY_SECTIONS``.
+        """
+        titles = {section_key: (title, subtitle) for section_key, title, subtitle in self.SECONDARY_SECTIONS}
+        if key not in titles:
+            raise ValueError(f"Unknown recommendation section: {key}")
+        limit = limit or self.SECTION_LIMIT
+        pool = self.candidate_pool(sections=(key,), section_limit=limit)
+        available = pool.base_mask(self._excluded_ids())
+        exclude = np.fromiter((int(meal_id) for meal_id in exclude_ids), dtype=np.int64)
+        if exclude.size:
+            available &= ~np.isin(pool.meal_id, exclude)
+        ids = self._section_candidates(pool, key, available, limit, exclude.tolist())
+        title, subtitle = titles[key]
+        return RecommendationSection(
+            key=key,
+            title=title.format(seed=self._seed_label()),
+            subtitle=subtitle,
+            meals=self._hydrate(ids, pool),
+        )
+
+    async def aprefetch(self, section_limit: Optional[int] = None, sections: bool = True) -> None:
+        """Load the independent per-request reads of :meth:`build_page` concurrently.
+
+        The shared candidate pool, cooldown ids, collaborative picks, favorite
+        neighbors, today's nutrition target and the macro matrix do not
+        depend on each other. Afterwards ``build_page`` only issues the
+        hydration query, plus (without the catalog index) one query for the
+        user's own candidate rows. ``sections=False`` loads only what
+        :meth:`build_primary` needs.
+        """
+        if not sections:
+            results = await gather_sync(self._base_pool, self._excluded_ids)
+            self._prefetched["pool"] = results[0]
+            return
+        section_limit = section_limit or self.SECTION_LIMIT
+        similar_key = ("similar", section_limit * 5)
+        results = await gather_sync(
+            self._base_pool,
+            self._personalized_ids,
+            partial(self._similar_to_recent_favorites, section_limit * 5),
+            self._nutrition_target,
+            self._excluded_ids,
+            nutrition_matrix.matrix,
+        )
+        self._prefetched.update(zip(("pool", "personalized", similar_key, "nutrition_target"), results))
+
+    def build_page(
+        self,
+        strategy: Optional[str],
+        filters: RecommendationFilters,
+        section_limit: Optional[int] = None,
+    ) -> RecommendationPage:
+        """Compute the primary picks, fallbacks and every secondary section in one pass.
+
+        ``strategy`` is ``"filters"``, ``"preferences"`` (filters with a
+        random fallback), ``"random"`` or ``None``. When the primary picks
+        come back empty they fall back to popular meals, reported through
+        ``primary_source``. Meals already shown are skipped by later sections.
+        """
+        section_limit = section_limit or self.SECTION_LIMIT
+        section_keys = [key for key, _title, _subtitle in self.SECONDARY_SECTIONS]
+        pool = self.candidate_pool(strategy, filters, section_keys, section_limit)
+        available = pool.base_mask(self._excluded_ids())
+        primary_ids, source = self._primary_ids(pool, strategy, filters, available)
+
+        used = primary_ids
+        section_ids = []
+        for key, _title, _subtitle in self.SECONDARY_SECTIONS:
+            remaining = available & ~np.isin(pool.meal_id, used)
+            ids = self._section_candidates(pool, key, remaining, section_limit, used.tolist())
+            section_ids.append(ids)
+            used = np.concatenate([used, ids])
+
+        meals = {meal.pk: meal for meal in self._hydrate(used, pool)}
+        sections = [
+            RecommendationSection(
+                key=key,
+                title=title.format(seed=self._seed_label()),
+                subtitle=subtitle,
+                meals=[meals[int(meal_id)] for meal_id in ids if int(meal_id) in meals],
+            )
+            for (key, title, subtitle), ids in zip(self.SECONDARY_SECTIONS, section_ids)
+        ]
+        return RecommendationPage(
+            primary=[meals[int(meal_id)] for meal_id in primary_ids if int(meal_id) in meals],
+            primary_source=source,
+            sections=sections,
+        )
+
+    def page_from_ids(
+        self,
+        primary_ids: List[int],
+        primary_source: Optional[str],
+        sections: List[Dict[str, object]],
+    ) -> RecommendationPage:
+        """Rebuild a page from stored ids, dropping meals now on cooldown or unavailable.
+
+        ``sections`` holds ``key``/``title``/``subtitle``/``meal_ids`` dicts.
+        All meals are loaded with one query.
+        """
+        excluded = set(self._excluded_ids().tolist())
+        ids = [meal_id for meal_id in primary_ids if meal_id not in excluded]
+        for section in sections:
+            ids.extend(meal_id for meal_id in section["meal_ids"] if meal_id not in excluded)
+        meals = {meal.pk: meal for meal in self._hydrate(ids, self._catalog())}
+        return RecommendationPage(
+            primary=[meals[meal_id] for meal_id in primary_ids if meal_id in meals],
+            primary_source=primary_source,
+            sections=[
+                RecommendationSection(
+                    key=section["key"],
+                    title=section["title"],
+                    subtitle=section["subtitle"],
+                    meals=[meals[meal_id] for meal_id in section["meal_ids"] if meal_id in meals],
+                )
+                for section in sections
+            ],
+        )
+
     def describe_filters(self, filters: RecommendationFilters) -> str:
         parts: List[str] = []
         if filters.cuisine_type:
@@ -572,4 +1171,7 @@ class RecommendationEngine:
             parts.append("僅素食")
         if filters.avoid_spicy:
             parts.append("不辣")
+        if filters.near:
+            radius = f"{filters.radius_km:g} 公里" if filters.radius_km >= 1 else f"{filters.radius_km * 1000:.0f} 公尺"
+            parts.append(f"附近 {radius}")
         return " · ".join(parts) if parts else "隨機推薦"
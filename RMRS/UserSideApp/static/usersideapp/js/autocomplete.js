@@ -0,0 +1,97 @@
+(function () {
+    // Inputs with data-autocomplete-url get a <datalist> filled from the
+    // autocomplete endpoint as the user types. With data-autocomplete-target
+    // the chosen suggestion's id is written to that (hidden) field.
+    const DEBOUNCE_MS = 120;
+
+    function optionValue(suggestion, useDetail) {
+        return useDetail && suggestion.detail
+            ? suggestion.label + "（" + suggestion.detail + "）"
+            : suggestion.label;
+    }
+
+    function attach(input, index) {
+        const url = input.dataset.autocompleteUrl;
+        const kinds = input.dataset.autocompleteKinds || "";
+        const target = input.dataset.autocompleteTarget
+            ? document.getElementById(input.dataset.autocompleteTarget)
+            : null;
+        const useDetail = Boolean(target);
+        const list = document.createElement("datalist");
+        list.id = (input.id || "autocomplete") + "-suggestions-" + index;
+        input.after(list);
+        input.setAttribute("list", list.id);
+        input.setAttribute("autocomplete", "off");
+
+        const ids = new Map();
+        const cache = new Map();
+        let timer = null;
+        let latest = "";
+
+        function render(suggestions) {
+            list.innerHTML = "";
+            suggestions.forEach((suggestion) => {
+                const value = optionValue(suggestion, useDetail);
+                ids.set(value, String(suggestion.id));
+                const option = document.createElement("option");
+                option.value = value;
+                if (!useDetail && suggestion.detail) {
+                    option.label = suggestion.detail;
+                }
+                list.appendChild(option);
+            });
+        }
+
+        function syncTarget() {
+            if (!target) {
+                return;
+            }
+            const id = ids.get(input.value) || "";
+            if (target.value !== id) {
+                target.value = id;
+                target.dispatchEvent(new Event("change", { bubbles: true }));
+            }
+        }
+
+        function fetchSuggestions(query) {
+            if (cache.has(query)) {
+                render(cache.get(query));
+                return;
+            }
+            const requestUrl = new URL(url, window.location.origin);
+            requestUrl.searchParams.set("q", query);
+            if (kinds) {
+                requestUrl.searchParams.set("kind", kinds);
+            }
+            fetch(requestUrl.toString(), { headers: { "X-Requested-With": "XMLHttpRequest" } })
+                .then((response) => (response.ok ? response.json() : { suggestions: [] }))
+                .then((data) => {
+                    const suggestions = data.suggestions || [];
+                    cache.set(query, suggestions);
+                    if (query === latest) {
+                        render(suggestions);
+                    }
+                })
+                .catch(() => {});
+        }
+
+        input.addEventListener("input", function () {
+            syncTarget();
+            const query = input.value.trim();
+            latest = query;
+            clearTimeout(timer);
+            if (!query) {
+                list.innerHTML = "";
+                return;
+            }
+            timer = setTimeout(() => fetchSuggestions(query), DEBOUNCE_MS);
+        });
+        input.addEventListener("change", syncTarget);
+
+        if (target && target.value && input.value) {
+            ids.set(input.value, target.value);
+        }
+    }
+
+    document.querySelectorAll("input[data-autocomplete-url]").forEach(attach);
+})();
@@ -1,4 +1,24 @@
 (function () {
+    // Secondary sections arrive as placeholders and are fetched one at a time
+    // as they scroll into view. Each request asks for more cards than a
+    // section shows and drops meals already on the page here, so the URL
+    // stays the same for every page and the browser can reuse the response.
+    // The cards actually rendered are then reported as impressions.
+    const SECTION_CARDS = 4;
+    const SECTION_FETCH_LIMIT = 12;
+    let sectionQueue = Promise.resolve();
+    const sectionObserver = "IntersectionObserver" in window
+        ? new IntersectionObserver((entries) => {
+            entries.forEach((entry) => {
+                if (entry.isIntersecting) {
+                    sectionObserver.unobserve(entry.target);
+                    queueSection(entry.target);
+                }
+            });
+        }, { rootMargin: "200px" })
+        : null;
+    observeSections(document);
+
     const form = document.querySelector(".recommendation-filter");
     if (!form) {
         return;
@@ -8,6 +28,19 @@
         return;
     }
 
+    const radiusSelect = form.querySelector('[name="radius_km"]');
+    if (radiusSelect && navigator.geolocation) {
+        radiusSelect.addEventListener("change", () => {
+            if (!radiusSelect.value || form.querySelector('[name="latitude"]').value) {
+                return;
+            }
+            navigator.geolocation.getCurrentPosition((position) => {
+                form.querySelector('[name="latitude"]').value = position.coords.latitude.toFixed(6);
+                form.querySelector('[name="longitude"]').value = position.coords.longitude.toFixed(6);
+            });
+        });
+    }
+
     let lastAction = "filters";
     const submitButtons = form.querySelectorAll('button[type="submit"]');
     submitButtons.forEach((button) => {
@@ -105,6 +138,78 @@
         sections.forEach((section) => {
             wrapper.appendChild(createSectionElement(section));
         });
+        observeSections(wrapper);
+    }
+
+    function observeSections(root) {
+        root.querySelectorAll("[data-section-url]").forEach((element) => {
+            if (sectionObserver) {
+                sectionObserver.observe(element);
+            } else {
+                queueSection(element);
+            }
+        });
+    }
+
+    function queueSection(element) {
+        sectionQueue = sectionQueue.then(() => loadSection(element));
+    }
+
+    function shownMealIds() {
+        return Array.from(document.querySelectorAll("[data-meal-id]"), (card) => card.dataset.mealId);
+    }
+
+    function loadSection(element) {
+        if (!element.isConnected) {
+            return Promise.resolve();
+        }
+        const url = new URL(element.dataset.sectionUrl, window.location.origin);
+        url.searchParams.set("limit", SECTION_FETCH_LIMIT);
+        return fetch(url, { headers: { "X-Requested-With": "XMLHttpRequest" } })
+            .then((response) => {
+                if (!response.ok) {
+                    throw new Error(`HTTP ${response.status}`);
+                }
+                return response.json();
+            })
+            .then((section) => {
+                if (!element.isConnected) {
+                    return;
+                }
+                const shown = new Set(shownMealIds());
+                section.cards = (section.cards || [])
+                    .filter((card) => !shown.has(String(card.meal.id)))
+                    .slice(0, SECTION_CARDS);
+                if (!section.cards.length) {
+                    element.remove();
+                    return;
+                }
+                element.replaceWith(createSectionElement(section));
+                reportImpressions(section.cards);
+            })
+            .catch((error) => {
+                console.error("Recommendation section failed:", error);
+                const status = element.querySelector("[data-section-status]");
+                if (status) {
+                    status.textContent = "無法載入此區塊。";
+                }
+            });
+    }
+
+    function reportImpressions(cards) {
+        const wrapper = document.getElementById("secondary-sections");
+        const url = wrapper && wrapper.dataset.impressionUrl;
+        const token = document.querySelector('[name="csrfmiddlewaretoken"]');
+        if (!url || !token) {
+            return;
+        }
+        const body = new FormData();
+        body.set("csrfmiddlewaretoken", token.value);
+        cards.forEach((card) => body.append("meal", card.meal.id));
+        if (navigator.sendBeacon && navigator.sendBeacon(url, body)) {
+            return;
+        }
+        fetch(url, { method: "POST", body, keepalive: true }).catch(() => {});
     }
 
     function updateErrors(errors) {
@@ -165,6 +270,14 @@
         head.appendChild(title);
         head.appendChild(subtitle);
         sectionEl.appendChild(head);
+        if (section.cards === null && section.url) {
+            sectionEl.dataset.sectionUrl = section.url;
+            const status = document.createElement("p");
+            status.dataset.sectionStatus = "";
+            status.textContent = "載入中…";
+            sectionEl.appendChild(status);
+            return sectionEl;
+        }
         if (!cardCount) {
             const empty = document.createElement("p");
             empty.textContent = "目前沒有資料可以顯示。";
@@ -183,6 +296,9 @@
     function createCardElement(card) {
         const wrapper = document.createElement("div");
         wrapper.className = "recommendation-card";
+        if (card.meal && card.meal.id) {
+            wrapper.dataset.mealId = card.meal.id;
+        }
 
         const titleRow = document.createElement("div");
         titleRow.className = "card-title-row";
@@ -0,0 +1,242 @@
+(function () {
+    // The map is a static shell: on every pan or zoom it asks the viewport
+    // API for the matching restaurants inside the visible bounds. Zoomed out,
+    // the server answers with per-cell counts instead of individual points.
+    const container = document.getElementById("search-map");
+    if (!container || typeof L === "undefined") {
+        return;
+    }
+    const hint = document.querySelector("[data-map-hint]");
+
+    function number(value) {
+        const parsed = parseFloat(value);
+        return Number.isFinite(parsed) ? parsed : null;
+    }
+
+    function showHint(message) {
+        if (!hint) {
+            return;
+        }
+        hint.textContent = message || "";
+        hint.hidden = !message;
+    }
+
+    const userLat = number(container.dataset.userLat);
+    const userLon = number(container.dataset.userLon);
+    const hasUser = userLat !== null && userLon !== null;
+    const center = hasUser
+        ? [userLat, userLon]
+        : [number(container.dataset.centerLat), number(container.dataset.centerLon)];
+
+    const map = L.map(container, { zoomControl: true }).setView(center, hasUser ? 15 : 7);
+    L.tileLayer("https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png", {
+        maxZoom: 19,
+        attribution: "&copy; OpenStreetMap contributors",
+    }).addTo(map);
+    L.control.scale().addTo(map);
+
+    const LocateControl = L.Control.extend({
+        options: { position: "topleft" },
+        onAdd: function () {
+            const button = L.DomUtil.create("a", "leaflet-bar leaflet-control map-control-button");
+            button.href = "#";
+            button.title = "移動到目前位置";
+            button.textContent = "◎";
+            L.DomEvent.on(button, "click", function (event) {
+                L.DomEvent.preventDefault(event);
+                map.locate({ setView: true, maxZoom: map.getZoom() });
+            });
+            return button;
+        },
+    });
+    map.addControl(new LocateControl());
+
+    if (container.requestFullscreen) {
+        const FullscreenControl = L.Control.extend({
+            options: { position: "topright" },
+            onAdd: function () {
+                const button = L.DomUtil.create("a", "leaflet-bar leaflet-control map-control-button");
+                button.href = "#";
+                button.title = "進入全螢幕";
+                button.textContent = "⛶";
+                L.DomEvent.on(button, "click", function (event) {
+                    L.DomEvent.preventDefault(event);
+                    if (document.fullscreenElement) {
+                        document.exitFullscreen();
+                    } else {
+                        container.requestFullscreen();
+                    }
+                });
+                document.addEventListener("fullscreenchange", function () {
+                    button.title = document.fullscreenElement ? "退出全螢幕" : "進入全螢幕";
+                    map.invalidateSize();
+                });
+                return button;
+            },
+        });
+        map.addControl(new FullscreenControl());
+    }
+
+    if (hasUser) {
+        L.circleMarker([userLat, userLon], {
+            radius: 8,
+            color: "#2563eb",
+            fillColor: "#2563eb",
+            fillOpacity: 0.9,
+        }).bindTooltip("目前位置").addTo(map);
+    }
+
+    map.on("click", function (event) {
+        window.postMessage(
+            { type: "rmrs-map-click", lat: event.latlng.lat, lng: event.latlng.lng },
+            window.location.origin
+        );
+    });
+
+    function popupContent(properties) {
+        const wrapper = document.createElement("div");
+        const title = document.createElement("a");
+        title.href = properties.url;
+        title.className = "font-semibold";
+        title.textContent = properties.name;
+        wrapper.appendChild(title);
+        const details = [properties.cuisine, properties.price];
+        if (properties.rating !== null && properties.rating !== undefined) {
+            details.push("評分：" + properties.rating);
+        }
+        [properties.address, details.filter(Boolean).join(" ・ ")].forEach((text) => {
+            if (text) {
+                wrapper.appendChild(document.createElement("br"));
+                wrapper.appendChild(document.createTextNode(text));
+            }
+        });
+        return wrapper;
+    }
+
+    const VIEWPORT_DEBOUNCE_MS = 250;
+    const pointLayer = typeof L.markerClusterGroup === "function"
+        ? L.markerClusterGroup({ chunkedLoading: true, showCoverageOnHover: false })
+        : L.layerGroup();
+    const clusterLayer = L.layerGroup();
+    pointLayer.addTo(map);
+    clusterLayer.addTo(map);
+
+    function viewportUrl(params) {
+        const url = new URL(container.dataset.viewportUrl, window.location.origin);
+        Object.entries(params).forEach(([name, value]) => url.searchParams.set(name, value));
+        return url.toString();
+    }
+
+    function fetchViewport(params) {
+        return fetch(viewportUrl(params), {
+            credentials: "same-origin",
+            headers: { Accept: "application/geo+json, application/json" },
+        }).then((response) => {
+            if (!response.ok) {
+                throw new Error("HTTP " + response.status);
+            }
+            return response.json();
+        });
+    }
+
+    function clusterMarker(feature) {
+        const [lon, lat] = feature.geometry.coordinates;
+        const count = feature.properties.count;
+        const size = count < 10 ? "small" : count < 100 ? "medium" : "large";
+        const marker = L.marker([lat, lon], {
+            title: count + " 家餐廳",
+            icon: L.divIcon({
+                html: "<div><span>" + count + "</span></div>",
+                className: "marker-cluster marker-cluster-" + size,
+                iconSize: L.point(40, 40),
+            }),
+        });
+        marker.on("click", function () {
+            const [west, south, east, north] = feature.bbox;
+            map.fitBounds([[south, west], [north, east]]);
+        });
+        return marker;
+    }
+
+    function render(collection) {
+        pointLayer.clearLayers();
+        clusterLayer.clearLayers();
+        const features = collection.features || [];
+        features.forEach((feature) => {
+            const properties = feature.properties || {};
+            if (properties.cluster) {
+                clusterLayer.addLayer(clusterMarker(feature));
+                return;
+            }
+            const [lon, lat] = feature.geometry.coordinates;
+            pointLayer.addLayer(
+                L.marker([lat, lon], { title: properties.name })
+                    .bindPopup(() => popupContent(properties), { maxWidth: 280 })
+            );
+        });
+        if (collection.truncated) {
+            showHint("此範圍僅標示前 " + features.length + " 家餐廳，請放大地圖或縮小搜尋範圍。");
+        } else {
+            showHint(emptyHint);
+        }
+    }
+
+    let emptyHint = "";
+    let requestId = 0;
+    let timer = null;
+
+    function refresh() {
+        const bounds = map.getBounds();
+        const current = ++requestId;
+        fetchViewport({
+            south: bounds.getSouth().toFixed(6),
+            west: L.Util.wrapNum(bounds.getWest(), [-180, 180], true).toFixed(6),
+            north: bounds.getNorth().toFixed(6),
+            east: L.Util.wrapNum(bounds.getEast(), [-180, 180], true).toFixed(6),
+            zoom: map.getZoom(),
+        })
+            .then((collection) => {
+                if (current === requestId) {
+                    render(collection);
+                }
+            })
+            .catch(() => {
+                showHint("地圖資料載入失敗，請重新整理頁面。");
+            });
+    }
+
+    function scheduleRefresh() {
+        clearTimeout(timer);
+        timer = setTimeout(refresh, VIEWPORT_DEBOUNCE_MS);
+    }
+
+    // Frame every matching restaurant first; later moves only load the view.
+    fetchViewport({ fit: 1 })
+        .then((collection) => {
+            const bbox = collection.bbox;
+            if (!bbox) {
+                emptyHint = hasUser
+                    ? "已使用您的定位，但目前尚無提供座標的餐廳資料。"
+                    : "目前結果缺少座標資訊，顯示預設地圖。";
+                showHint(emptyHint);
+                return;
+            }
+            const [west, south, east, north] = bbox;
+            const frame = L.latLngBounds([[south, west], [north, east]]);
+            if (hasUser) {
+                frame.extend([userLat, userLon]);
+            }
+            if (frame.getNorthEast().equals(frame.getSouthWest())) {
+                map.setView(frame.getCenter(), 15);
+            } else {
+                map.fitBounds(frame, { padding: [20, 20] });
+            }
+        })
+        .catch(() => {
+            showHint("地圖資料載入失敗，請重新整理頁面。");
+        })
+        .finally(() => {
+            map.on("moveend", scheduleRefresh);
+            refresh();
+        });
+})();
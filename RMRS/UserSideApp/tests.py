@@ -1,16 +1,33 @@
+import json
+import shutil
+import tempfile
 from datetime import date, timedelta
 from decimal import Decimal
+from unittest import mock
 
+from asgiref.sync import async_to_sync, sync_to_async
 from django.contrib.auth.hashers import check_password, make_password
-from django.urls import reverse
-from django.test import TestCase
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.http import QueryDict
+from django.urls import reverse, set_script_prefix
+from django.test import AsyncRequestFactory, TestCase, override_settings
 from django.utils import timezone
 
+from MerchantSideApp import geo
 from MerchantSideApp.models import Meal, Restaurant, NutritionInfo
+from RecommendationSystem.autocomplete import autocomplete_index
+from RecommendationSystem.fulltext import search_index
+from RecommendationSystem.impressions import impression_buffer
 from RecommendationSystem.models import RecommendationHistory
+from RecommendationSystem.result_cache import invalidate_rankings
 from RecommendationSystem.services import DEFAULT_COOLDOWN_DAYS
 
+from .async_utils import gather_sync
 from .auth_utils import SESSION_USER_KEY
+from .cards import serialize_cards, url_template
 from .models import (
 	AppUser,
 	DailyMealRecord,
@@ -20,6 +37,12 @@ from .models import (
 	UserPreference,
 	WeeklyIntakeSummary,
 )
+from .services import RecommendationEngine
+from .views import (
+	random_recommendation_async,
+	random_recommendation_data_async,
+	search_restaurants_async,
+)
 
 
 class UserAuthTests(TestCase):
@@ -87,6 +110,11 @@ class UserAuthTests(TestCase):
 
 class UserPortalTestCase(TestCase):
 	def setUp(self):
+		cache.clear()
+		autocomplete_index.invalidate()
+		self.addCleanup(autocomplete_index.invalidate)
+		search_index.invalidate()
+		self.addCleanup(search_index.invalidate)
 		self.user = AppUser.objects.create(
 			username="tester",
 			email="tester@example.com",
@@ -677,6 +705,23 @@ class UserPortalTestCase(TestCase):
 		self.assertEqual(Favorite.objects.filter(user=self.user).count(), 0)
 		self.assertContains(remove_response, "已移除收藏餐點。")
 
+	def test_favorite_counters_follow_add_and_remove(self):
+		self._login()
+		url = reverse("usersideapp:interactions")
+		for _ in range(2):
+			self.client.post(url, {"form_type": "favorite_add", "meal": self.meal.id})
+		self.meal.refresh_from_db()
+		self.restaurant.refresh_from_db()
+		self.assertEqual(self.meal.favorite_count, 1)
+		self.assertEqual(self.restaurant.favorite_count, 1)
+		favorite = Favorite.objects.get(user=self.user)
+		for _ in range(2):
+			self.client.post(url, {"form_type": "favorite_remove", "favorite_id": favorite.id})
+		self.meal.refresh_from_db()
+		self.restaurant.refresh_from_db()
+		self.assertEqual(self.meal.favorite_count, 0)
+		self.assertEqual(self.restaurant.favorite_count, 0)
+
 	def test_search_filters_by_meal_category(self):
 		self._login()
 		response = self.client.get(
@@ -687,6 +732,17 @@ class UserPortalTestCase(TestCase):
 		self.assertContains(response, self.restaurant.name)
 		self.assertNotContains(response, self.other_restaurant.name)
 
+	def test_search_matches_normalized_city_and_cuisine(self):
+		self._login()
+		Restaurant.objects.filter(pk=self.other_restaurant.pk).delete()
+		Restaurant.objects.create(name="北市日料", city="台北市", district="信義區", cuisine_type="日本料理")
+		response = self.client.get(
+			reverse("usersideapp:search"),
+			{"city": "臺北", "cuisine_type": "日式"},
+		)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual([restaurant.name for restaurant in response.context["restaurants"]], ["北市日料"])
+
 	def test_search_returns_meal_results(self):
 		self._login()
 		response = self.client.get(
@@ -698,6 +754,179 @@ class UserPortalTestCase(TestCase):
 		meal_url = reverse("merchantsideapp:meal_detail", args=[self.meal.slug])
 		self.assertContains(response, meal_url)
 
+	def test_search_ranks_keyword_matches_by_relevance(self):
+		self._login()
+		bowl = Meal.objects.create(restaurant=self.other_restaurant, name="牛肉麵", description="紅燒牛肉麵，牛肉大塊")
+		Meal.objects.create(restaurant=self.other_restaurant, name="炒飯", description="附牛肉湯")
+		Meal.objects.create(restaurant=self.other_restaurant, name="牛排", description="")
+		response = self.client.get(reverse("usersideapp:search"), {"keyword": "ＢＥＥＦ 牛肉"})
+		self.assertEqual(list(response.context["meals"]), [])
+		with self.captureOnCommitCallbacks(execute=True):
+			bowl.description = "紅燒牛肉麵 beef，牛肉大塊"
+			bowl.save()
+		response = self.client.get(reverse("usersideapp:search"), {"keyword": "ＢＥＥＦ 牛肉"})
+		self.assertEqual([meal.name for meal in response.context["meals"]], ["牛肉麵"])
+		response = self.client.get(reverse("usersideapp:search"), {"keyword": "牛肉"})
+		self.assertEqual([meal.name for meal in response.context["meals"]], ["牛肉麵", "炒飯"])
+		self.assertEqual([restaurant.name for restaurant in response.context["restaurants"]], ["另一家餐廳"])
+		with self.settings(RECOMMENDATION_SEARCH_BACKEND="like"):
+			response = self.client.get(reverse("usersideapp:search"), {"keyword": "牛肉"})
+		self.assertEqual({meal.name for meal in response.context["meals"]}, {"牛肉麵", "炒飯"})
+
+	def test_search_pages_with_keyset_cursors(self):
+		self._login()
+		Restaurant.objects.all().delete()
+		restaurants = [
+			Restaurant.objects.create(name=f"分頁餐廳{index:02d}", rating=rating)
+			for index, rating in enumerate([4.5, 4.5, 4.0, 4.0, 4.0, 3.5, 3.5])
+		]
+		expected = [restaurant.name for restaurant in sorted(restaurants, key=lambda r: (-r.rating, r.name, r.pk))]
+		seen = []
+		url = reverse("usersideapp:search")
+		params = {"city": ""}
+		with mock.patch("UserSideApp.views.search.MAX_RESTAURANT_RESULTS", 3):
+			while True:
+				response = self.client.get(url, params)
+				self.assertEqual(str(response.context["result_count"]), "7")
+				seen.extend(restaurant.name for restaurant in response.context["restaurants"])
+				next_url = response.context["next_restaurants_url"]
+				if not next_url:
+					break
+				self.assertContains(response, "更多餐廳")
+				params = QueryDict(next_url[1:])
+		self.assertEqual(seen, expected)
+		self.assertIn("restaurants_after", params)
+		response = self.client.get(url, {"restaurants_after": "forged"})
+		self.assertEqual(len(response.context["restaurants"]), 7)
+
+	def test_search_counts_are_capped_and_cached(self):
+		self._login()
+		for index in range(4):
+			Meal.objects.create(restaurant=self.restaurant, name=f"計數餐點{index}")
+		cache_dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, cache_dir)
+		shared = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": cache_dir}}
+		with self.settings(RECOMMENDATION_SEARCH_COUNT_CAP=3, CACHES=shared):
+			response = self.client.get(reverse("usersideapp:search"), {"keyword": "計數"})
+			self.assertEqual(str(response.context["meal_result_count"]), "3+")
+			Meal.objects.filter(name__startswith="計數").update(is_recommendable=False)
+			response = self.client.get(reverse("usersideapp:search"), {"keyword": " 計數 "})
+			self.assertEqual(str(response.context["meal_result_count"]), "3+")
+			invalidate_rankings()
+			response = self.client.get(reverse("usersideapp:search"), {"keyword": "計數"})
+			self.assertEqual(str(response.context["meal_result_count"]), "0")
+
+	def test_search_counts_are_not_cached_per_process(self):
+		self._login()
+		for index in range(4):
+			Meal.objects.create(restaurant=self.restaurant, name=f"計數餐點{index}")
+		with self.settings(RECOMMENDATION_SEARCH_COUNT_CAP=3):
+			response = self.client.get(reverse("usersideapp:search"), {"keyword": "計數"})
+			self.assertEqual(str(response.context["meal_result_count"]), "3+")
+			Meal.objects.filter(name__startswith="計數").update(is_recommendable=False)
+			response = self.client.get(reverse("usersideapp:search"), {"keyword": "計數"})
+			self.assertEqual(str(response.context["meal_result_count"]), "0")
+
+	def test_search_markers_return_geojson_for_filters(self):
+		self._login()
+		Restaurant.objects.filter(pk=self.restaurant.pk).update(latitude=Decimal("25.033"), longitude=Decimal("121.565"))
+		Restaurant.objects.create(name="無座標餐廳")
+		response = self.client.get(reverse("usersideapp:search"), {"keyword": "餐廳"})
+		markers_url = response.context["map_markers_url"]
+		self.assertTrue(markers_url.startswith(reverse("usersideapp:search_markers")))
+		self.assertContains(response, 'id="search-map"')
+		response = self.client.get(markers_url)
+		self.assertEqual(response.status_code, 200)
+		payload = response.json()
+		self.assertEqual(payload["type"], "FeatureCollection")
+		self.assertFalse(payload["truncated"])
+		self.assertEqual([feature["properties"]["name"] for feature in payload["features"]], [self.restaurant.name])
+		feature = payload["features"][0]
+		self.assertEqual(feature["geometry"], {"type": "Point", "coordinates": [121.565, 25.033]})
+		self.assertEqual(
+			feature["properties"]["url"],
+			reverse("merchantsideapp:restaurant_detail", args=[self.restaurant.slug]),
+		)
+		self.assertIn("private", response["Cache-Control"])
+		# The catalog version is per process in LocMem, so no ETag is offered there.
+		self.assertNotIn("ETag", response)
+		cache_dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, cache_dir)
+		shared = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": cache_dir}}
+		with self.settings(CACHES=shared):
+			etag = self.client.get(markers_url)["ETag"]
+			self.assertEqual(self.client.get(markers_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+			with self.captureOnCommitCallbacks(execute=True):
+				Restaurant.objects.get(pk=self.other_restaurant.pk).save()
+			self.assertEqual(self.client.get(markers_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+		response = self.client.get(reverse("usersideapp:search_markers"), {"keyword": "不存在的店"})
+		self.assertEqual(response.json()["features"], [])
+
+	def test_search_viewport_returns_points_or_grid_clusters(self):
+		self._login()
+		url = reverse("usersideapp:search_viewport")
+		Restaurant.objects.filter(pk=self.restaurant.pk).update(is_active=False)
+		for index, (latitude, longitude) in enumerate(((25.033, 121.565), (25.034, 121.566), (25.035, 121.564), (22.627, 120.301))):
+			Restaurant.objects.create(name=f"座標餐廳{index}", latitude=latitude, longitude=longitude)
+		Restaurant.objects.create(name="無座標餐廳")
+		taipei = {"south": "25.0", "west": "121.5", "north": "25.1", "east": "121.6"}
+		response = self.client.get(url, {**taipei, "zoom": "16", "fit": "1"})
+		self.assertEqual(response.status_code, 200)
+		payload = response.json()
+		self.assertFalse(payload["clustered"])
+		self.assertEqual(
+			sorted(feature["properties"]["name"] for feature in payload["features"]),
+			["座標餐廳0", "座標餐廳1", "座標餐廳2"],
+		)
+		self.assertEqual(payload["bbox"], [120.301, 22.627, 121.566, 25.035])
+		self.assertIn("private", response["Cache-Control"])
+		with self.settings(RECOMMENDATION_VIEWPORT_CLUSTER_ZOOM=15), mock.patch("UserSideApp.views.search.MAX_VIEWPORT_POINTS", 2):
+			response = self.client.get(url, {"south": "20", "west": "119", "north": "27", "east": "123", "zoom": "7"})
+			payload = response.json()
+			self.assertTrue(payload["clustered"])
+			clusters = sorted(payload["features"], key=lambda feature: -feature["properties"]["count"])
+			self.assertEqual([feature["properties"]["count"] for feature in clusters], [3, 1])
+			self.assertEqual(clusters[0]["properties"]["cell"], geo.encode(25.033, 121.565, geo.precision_for_zoom(7)))
+			west, south, east, north = clusters[0]["bbox"]
+			longitude, latitude = clusters[0]["geometry"]["coordinates"]
+			self.assertTrue(west <= longitude <= east and south <= latitude <= north)
+			self.assertAlmostEqual(latitude, 25.034, places=3)
+		response = self.client.get(url, {"south": "25.0", "north": "25.1", "zoom": "12"})
+		self.assertEqual(response.status_code, 400)
+		self.assertIn("errors", response.json())
+		self.assertEqual(self.client.get(url, taipei).status_code, 400)
+		response = self.client.get(url, {**taipei, "zoom": "16", "keyword": "不存在的店", "fit": "1"})
+		self.assertEqual(response.json()["features"], [])
+		self.assertIsNone(response.json()["bbox"])
+
+	def test_autocomplete_returns_ranked_suggestions(self):
+		url = reverse("usersideapp:search_autocomplete")
+		self.assertEqual(self.client.get(url, {"q": "測試"}).status_code, 302)
+		self._login()
+		Restaurant.objects.filter(pk=self.restaurant.pk).update(rating=Decimal("4.5"))
+		Restaurant.objects.create(name="測試小館", rating=Decimal("3.0"))
+		response = self.client.get(url, {"q": "ﾃｽﾄ測試"})
+		self.assertEqual(response.json(), {"suggestions": []})
+		response = self.client.get(url, {"q": "測試", "kind": "restaurant,bogus", "limit": "50"})
+		suggestions = response.json()["suggestions"]
+		self.assertEqual([s["label"] for s in suggestions], ["測試餐廳", "測試小館"])
+		self.assertEqual(
+			suggestions[0]["url"],
+			reverse("merchantsideapp:restaurant_detail", args=[self.restaurant.slug]),
+		)
+		response = self.client.get(url, {"q": "經典", "limit": "x"})
+		self.assertEqual(
+			[(s["kind"], s["label"]) for s in response.json()["suggestions"]],
+			[("meal", self.meal.name)],
+		)
+
+	def test_record_form_uses_restaurant_typeahead(self):
+		self._login()
+		response = self.client.get(reverse("usersideapp:record"))
+		self.assertContains(response, 'data-autocomplete-kinds="restaurant"')
+		self.assertNotContains(response, f'<option value="{self.other_restaurant.pk}"')
+		self.assertContains(response, 'type="hidden" name="restaurant"')
+
 	def test_search_displays_restaurant_links(self):
 		self._login()
 		response = self.client.get(
@@ -830,6 +1059,77 @@ class UserPortalTestCase(TestCase):
 		payload = response.json()
 		self.assertEqual(payload["cooldownDays"], 4)
 
+	def test_random_page_defers_secondary_sections(self):
+		self._login()
+		response = self.client.get(reverse("usersideapp:random"))
+		self.assertEqual(response.status_code, 200)
+		sections = response.context["secondary_sections"]
+		self.assertTrue(sections)
+		self.assertTrue(all(section["cards"] is None for section in sections))
+		self.assertContains(response, reverse("usersideapp:random_section", args=["popular"]))
+
+	def test_random_page_renders_sections_eagerly_when_disabled(self):
+		self._login()
+		with self.settings(RECOMMENDATION_LAZY_SECTIONS=False):
+			response = self.client.post(reverse("usersideapp:random_data"), {"action": "surprise", "limit": 1})
+		self.assertTrue(all(section["cards"] for section in response.json()["secondary"]))
+
+	def test_section_api_returns_cards_with_cache_headers(self):
+		self._login()
+		url = reverse("usersideapp:random_section", args=["popular"])
+		response = self.client.get(url, {"limit": 50})
+		self.assertEqual(response.status_code, 200)
+		payload = response.json()
+		self.assertEqual(payload["key"], "popular")
+		self.assertEqual([card["meal"]["id"] for card in payload["cards"]], [self.other_meal.pk, self.meal.pk])
+		self.assertIn("private", response["Cache-Control"])
+		self.assertIn("max-age=60", response["Cache-Control"])
+		self.assertIn("Cookie", response["Vary"])
+
+	@override_settings(RECOMMENDATION_IMPRESSION_LOGGING=True)
+	def test_section_impressions_come_from_rendered_cards(self):
+		self._login()
+		with mock.patch.object(impression_buffer, "background", False):
+			self.client.get(reverse("usersideapp:random_section", args=["popular"]), {"limit": 50})
+			self.assertEqual(impression_buffer.flush(), 0)
+			response = self.client.post(
+				reverse("usersideapp:random_impressions"), {"meal": [self.meal.pk, "x", 999999]}
+			)
+			self.assertEqual(response.status_code, 204)
+			self.assertEqual(impression_buffer.flush(), 1)
+		self.assertEqual(
+			list(RecommendationHistory.objects.values_list("meal_id", "was_selected")), [(self.meal.pk, False)]
+		)
+
+	def test_card_serialization_matches_reverse(self):
+		self.restaurant.price_range = Restaurant.PriceRange.LOW
+		self.restaurant.save()
+		payload = serialize_cards([{"meal": self.meal, "restaurant": self.restaurant, "reason": "測試"}])[0]
+		self.assertEqual(payload["meal"]["url"], reverse("merchantsideapp:meal_detail", args=[self.meal.slug]))
+		self.assertEqual(
+			payload["restaurant"]["url"],
+			reverse("merchantsideapp:restaurant_detail", args=[self.restaurant.slug]),
+		)
+		self.assertEqual(payload["restaurant"]["priceLabel"], self.restaurant.get_price_range_display())
+		self.assertEqual((payload["favoriteCount"], payload["reason"]), (0, "測試"))
+		set_script_prefix("/app/")
+		self.addCleanup(set_script_prefix, "/")
+		self.assertEqual(url_template("merchantsideapp:meal_detail").format("x"), "/app/merchant/meals/x/")
+
+	def test_section_api_can_encode_with_orjson(self):
+		self._login()
+		url = reverse("usersideapp:random_section", args=["popular"])
+		expected = self.client.get(url).json()
+		with self.settings(RECOMMENDATION_JSON_ENCODER="orjson"):
+			response = self.client.get(url)
+		self.assertEqual(response["Content-Type"], "application/json")
+		self.assertEqual(json.loads(response.content), expected)
+
+	def test_section_api_rejects_unknown_sections(self):
+		self._login()
+		response = self.client.get(reverse("usersideapp:random_section", args=["nope"]))
+		self.assertEqual(response.status_code, 404)
+
 	def test_random_api_reports_validation_errors(self):
 		self._login()
 		response = self.client.post(
@@ -884,3 +1184,73 @@ class UserPortalTestCase(TestCase):
 		self.assertEqual(response.status_code, 200)
 		self.assertContains(response, "碳水偏多")
 		self.assertContains(response, "澱粉份量微調")
+
+
+@override_settings(ASYNC_PARALLEL_QUERIES=False)
+class AsyncViewTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		search_index.invalidate()
+		self.addCleanup(search_index.invalidate)
+		self.factory = AsyncRequestFactory()
+		self.user = AppUser.objects.create(
+			username="async-tester",
+			email="async@example.com",
+			password_hash=make_password("InitialPass!23"),
+		)
+		self.restaurant = Restaurant.objects.create(name="非同步餐廳", city="台北")
+		self.meal = Meal.objects.create(restaurant=self.restaurant, name="非同步拉麵", category="麵食")
+		self.session = SessionStore()
+		self.session[SESSION_USER_KEY] = self.user.pk
+		self.session.save()
+
+	def _request(self, method, path, data=None, session=None):
+		request = getattr(self.factory, method)(path, data or {})
+		request.session = session or self.session
+		request.user = AnonymousUser()
+		request._messages = FallbackStorage(request)
+		return request
+
+	async def test_random_page_renders_recommendations(self):
+		request = self._request("get", reverse("usersideapp:random"))
+		response = await random_recommendation_async(request)
+		self.assertEqual(response.status_code, 200)
+		self.assertContains(response, "非同步拉麵")
+
+	async def test_random_api_returns_primary_cards(self):
+		request = self._request(
+			"post",
+			reverse("usersideapp:random_data"),
+			{"action": "surprise", "limit": 1},
+		)
+		response = await random_recommendation_data_async(request)
+		self.assertEqual(response.status_code, 200)
+		payload = json.loads(response.content)
+		self.assertEqual(payload["primary"]["cards"][0]["meal"]["name"], "非同步拉麵")
+		self.assertEqual(payload["cooldownDays"], DEFAULT_COOLDOWN_DAYS)
+
+	async def test_search_returns_meal_results(self):
+		request = self._request("get", reverse("usersideapp:search"), {"keyword": "拉麵"})
+		response = await search_restaurants_async(request)
+		self.assertEqual(response.status_code, 200)
+		self.assertContains(response, "非同步拉麵")
+		self.assertContains(response, "非同步餐廳")
+
+	async def test_async_views_require_login(self):
+		anonymous = await sync_to_async(SessionStore)()
+		request = self._request("get", reverse("usersideapp:search"), session=anonymous)
+		response = await search_restaurants_async(request)
+		self.assertEqual(response.status_code, 302)
+		self.assertEqual(response.url, reverse("usersideapp:login"))
+
+	async def test_gather_sync_keeps_argument_order(self):
+		results = await gather_sync(lambda: 1, lambda: "two", Meal.objects.count)
+		self.assertEqual(results, [1, "two", 1])
+
+	def test_prefetch_leaves_only_hydration_for_build_page(self):
+		engine = RecommendationEngine(self.user)
+		async_to_sync(engine.aprefetch)()
+		filters = engine.filters_from_preferences(None)
+		with self.assertNumQueries(1):
+			page = engine.build_page("preferences", filters)
+		self.assertEqual([meal.pk for meal in page.primary], [self.meal.pk])
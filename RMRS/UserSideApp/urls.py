@@ -1,3 +1,4 @@
+from django.conf import settings as django_settings
 from django.urls import path
 
 from .views import (
@@ -8,24 +9,42 @@ from .views import (
     logout_view,
     notifications,
     random_recommendation,
+    random_recommendation_async,
     random_recommendation_data,
+    random_recommendation_data_async,
+    random_section_data,
+    random_section_impressions,
     record_meal,
     register_view,
     restaurant_meals_api,
+    search_autocomplete,
+    search_markers,
     search_restaurants,
+    search_restaurants_async,
+    search_viewport,
     settings,
     today_meal,
 )
 
 app_name = "usersideapp"
 
+if django_settings.ASYNC_VIEWS:
+    search_restaurants = search_restaurants_async  # noqa: F811
+    random_recommendation = random_recommendation_async  # noqa: F811
+    random_recommendation_data = random_recommendation_data_async  # noqa: F811
+
 urlpatterns = [
     path("login/", login_view, name="login"),
     path("register/", register_view, name="register"),
     path("logout/", logout_view, name="logout"),
     path("search/", search_restaurants, name="search"),
+    path("search/markers/", search_markers, name="search_markers"),
+    path("search/autocomplete/", search_autocomplete, name="search_autocomplete"),
+    path("search/viewport/", search_viewport, name="search_viewport"),
     path("random/", random_recommendation, name="random"),
     path("random/data/", random_recommendation_data, name="random_data"),
+    path("random/data/<slug:section>/", random_section_data, name="random_section"),
+    path("random/impressions/", random_section_impressions, name="random_impressions"),
     path("today/", today_meal, name="today"),
     path("record/", record_meal, name="record"),
     path("record/restaurant-meals/", restaurant_meals_api, name="restaurant_meals_api"),
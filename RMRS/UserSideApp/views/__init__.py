@@ -4,8 +4,21 @@ from .home import home
 from .interactions import interactions
 from .meals import record_meal, restaurant_meals_api, today_meal
 from .notifications import notifications
-from .recommendation import random_recommendation, random_recommendation_data
-from .search import search_restaurants
+from .recommendation import (
+    random_recommendation,
+    random_recommendation_async,
+    random_recommendation_data,
+    random_recommendation_data_async,
+    random_section_data,
+    random_section_impressions,
+)
+from .search import (
+    search_autocomplete,
+    search_markers,
+    search_restaurants,
+    search_restaurants_async,
+    search_viewport,
+)
 from .user_settings import settings
 
 __all__ = [
@@ -14,8 +27,15 @@ __all__ = [
     "register_view",
     "home",
     "search_restaurants",
+    "search_restaurants_async",
+    "search_markers",
+    "search_autocomplete",
+    "search_viewport",
     "random_recommendation",
+    "random_recommendation_async",
     "random_recommendation_data",
+    "random_recommendation_data_async",
+    "random_section_data",
     "today_meal",
     "record_meal",
     "restaurant_meals_api",
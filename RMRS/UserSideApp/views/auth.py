@@ -1,6 +1,8 @@
 from django.contrib import messages
 from django.shortcuts import redirect, render
 
+from RecommendationSystem.slates import schedule_slate_refresh
+
 from ..auth_utils import get_current_user, login_user, logout_user
 from ..forms import UserLoginForm, UserRegistrationForm
 
@@ -18,6 +20,7 @@ def login_view(request):
         if form.is_valid():
             user = form.get_user()
             login_user(request, user)
+            schedule_slate_refresh(user.pk)
             messages.success(request, f"歡迎回來，{user.username}！")
             return redirect("usersideapp:home")
     else:
@@ -37,6 +40,7 @@ def register_view(request):
         if form.is_valid():
             user = form.save()
             login_user(request, user)
+            schedule_slate_refresh(user.pk)
             messages.success(request, "帳號建立成功，歡迎加入！")
             return redirect("usersideapp:home")
     else:
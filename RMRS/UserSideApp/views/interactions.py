@@ -1,8 +1,11 @@
 """User interactions view (reviews and favorites) for UserSideApp."""
 
 from django.contrib import messages
+from django.db import transaction
 from django.shortcuts import redirect
 
+from RecommendationSystem.services import adjust_favorite_count
+
 from ..auth_utils import get_current_user, user_login_required
 from ..forms import FavoriteForm, ReviewForm
 from ..models import Favorite, Review
@@ -73,7 +76,17 @@ def interactions(request):
             messages.error(request, "收藏失敗，請重新選擇餐點。")
         elif action == "favorite_remove":
             favorite_id = request.POST.get("favorite_id")
-            deleted, _ = Favorite.objects.filter(user=user, pk=favorite_id).delete()
+            with transaction.atomic():
+                favorite = (
+                    Favorite.objects.select_related("meal")
+                    .filter(user=user, pk=favorite_id)
+                    .first()
+                )
+                deleted = 0
+                if favorite:
+                    deleted, _ = Favorite.objects.filter(pk=favorite.pk).delete()
+                if deleted:
+                    adjust_favorite_count(favorite.meal, -1)
             if deleted:
                 messages.success(request, "已移除收藏餐點。")
             else:
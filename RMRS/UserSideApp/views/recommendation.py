@@ -1,15 +1,36 @@
 """Recommendation views for UserSideApp."""
 
-from django.http import JsonResponse
-from django.urls import reverse
-from django.views.decorators.http import require_POST
+from dataclasses import replace
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_GET, require_POST
+
+from MerchantSideApp.models import Meal
+from RecommendationSystem.impressions import impression_logging_enabled, log_impressions
 from RecommendationSystem.services import get_recommendation_cooldown_days
+from RecommendationSystem.slates import fresh_slate_page, slates_enabled
 
-from ..auth_utils import get_current_user, user_login_required
+from ..auth_utils import aget_current_user, get_current_user, user_login_required
+from ..cards import json_response, serialize_cards, url_template
 from ..forms import RecommendationFilterForm
 from ..services import RecommendationEngine
-from .utils import _render, _collect_form_errors
+from .utils import (
+    _arender,
+    _render,
+    _collect_form_errors,
+    MAX_SECTION_CARDS,
+)
+
+
+def lazy_sections_enabled() -> bool:
+    return bool(getattr(settings, "RECOMMENDATION_LAZY_SECTIONS", True))
+
+
+def section_max_age() -> int:
+    return int(getattr(settings, "RECOMMENDATION_SECTION_MAX_AGE", 60))
 
 
 def _build_recommendation_cards(meals, reason: str, used_ids: set[int] | None = None):
@@ -31,102 +52,84 @@ def _build_recommendation_cards(meals, reason: str, used_ids: set[int] | None =
     return cards
 
 
-def _serialize_card(card: dict) -> dict:
-    """Serialize a recommendation card to JSON-compatible dict."""
-    meal = card["meal"]
-    restaurant = card["restaurant"]
-    price_label = ""
-    if getattr(restaurant, "price_range", None):
-        try:
-            price_label = restaurant.get_price_range_display()
-        except Exception:  # pragma: no cover - defensive
-            price_label = restaurant.price_range
-    meal_url = reverse("merchantsideapp:meal_detail", args=[meal.slug])
-    restaurant_url = reverse("merchantsideapp:restaurant_detail", args=[restaurant.slug])
-    return {
-        "meal": {
-            "id": meal.id,
-            "slug": meal.slug,
-            "name": meal.name,
-            "description": meal.description or "",
-            "isVegetarian": bool(meal.is_vegetarian),
-            "isSpicy": bool(meal.is_spicy),
-            "url": meal_url,
-        },
-        "restaurant": {
-            "id": restaurant.id,
-            "slug": restaurant.slug,
-            "name": restaurant.name,
-            "cuisineType": restaurant.cuisine_type or "",
-            "priceRange": restaurant.price_range or "",
-            "priceLabel": price_label or "",
-            "city": restaurant.city or "",
-            "district": restaurant.district or "",
-            "url": restaurant_url,
-        },
-        "favoriteCount": card.get("favorite_count", 0),
-        "reason": card.get("reason") or "",
-    }
-
-
-def _build_random_context(user, data=None):
+def _build_random_context(user, data=None, engine=None):
     """Build context for random recommendation page."""
-    engine = RecommendationEngine(user)
+    engine = engine or RecommendationEngine(user)
     preference = getattr(user, "preferences", None)
     initial_data = engine.initial_data(preference)
     filter_form = RecommendationFilterForm(initial=initial_data)
     filters_used = engine.filters_from_data(initial_data)
     primary_reason = "根據你的偏好"
-    primary_meals = []
     recommendation_alert = None
     action = (data or {}).get("action") if data else None
     cooldown_days = get_recommendation_cooldown_days(user)
 
+    strategy = "preferences"
     if data:
         if action == "use_preferences":
             filters_used = engine.filters_from_preferences(preference, (data or {}).get("limit"))
-            primary_meals = engine.preference_recommendations(filters_used.limit)
             primary_reason = "根據你的偏好"
         elif action == "surprise":
-            primary_meals = engine.random_meals((data or {}).get("limit") or filters_used.limit)
+            strategy = "random"
+            filters_used = replace(
+                filters_used,
+                limit=engine._ensure_limit((data or {}).get("limit") or filters_used.limit),
+            )
             primary_reason = "驚喜推薦"
         else:
             filter_form = RecommendationFilterForm(data=data, initial=initial_data)
             if filter_form.is_valid():
+                strategy = "filters"
                 filters_used = engine.filters_from_data(filter_form.cleaned_data)
-                primary_meals = engine.apply_filters(filters_used)
                 primary_reason = engine.describe_filters(filters_used)
             else:
-                primary_meals = []
+                strategy = None
     else:
-        primary_meals = engine.preference_recommendations(filters_used.limit)
+        filters_used = engine.filters_from_preferences(preference, filters_used.limit)
 
-    if not primary_meals:
-        primary_meals = engine.popular_meals(filters_used.limit)
+    page = None
+    if strategy == "preferences" and filters_used.limit == engine.DEFAULT_LIMIT:
+        page = fresh_slate_page(engine)
+    lazy = page is None and lazy_sections_enabled()
+    if lazy:
+        page = engine.build_primary(strategy, filters_used)
+    elif page is None:
+        page = engine.build_page(strategy, filters_used)
+    if page.primary_source == "popular":
         recommendation_alert = "目前找不到符合條件的餐點，先為你帶來熱門選擇。"
         primary_reason = "熱門推薦"
 
     used_ids: set[int] = set()
-    primary_cards = _build_recommendation_cards(primary_meals, primary_reason, used_ids)
-
-    sections_config = [
-        ("熱門收藏", "依收藏數排序", engine.popular_meals(4)),
-        ("親民價位", "低價位也能享受美味", engine.budget_friendly(4)),
-        ("素食推薦", "友善素食選擇", engine.vegetarian_spotlight(4)),
-        ("清爽不辣", "適合想吃清淡的一天", engine.mild_flavor(4)),
-        ("新的體驗", "你尚未收藏或評論過", engine.new_experiences(4)),
-    ]
+    primary_cards = _build_recommendation_cards(page.primary, primary_reason, used_ids)
+
+    section_urls = url_template("usersideapp:random_section")
     secondary_sections = []
-    for title, subtitle, meals in sections_config:
-        cards = _build_recommendation_cards(meals, subtitle, used_ids)
-        if cards:
+    if lazy:
+        # Placeholders; the page fetches each one from random_section_data.
+        for key, title, subtitle in engine.SECONDARY_SECTIONS:
             secondary_sections.append(
                 {
-                    "title": title,
+                    "key": key,
+                    "title": title.format(seed="…"),
                     "subtitle": subtitle,
+                    "cards": None,
+                    "url": section_urls.format(key),
+                }
+            )
+    for section in page.sections:
+        cards = _build_recommendation_cards(section.meals, section.subtitle, used_ids)
+        if cards:
+            secondary_sections.append(
+                {
+                    "key": section.key,
+                    "title": section.title,
+                    "subtitle": section.subtitle,
                     "cards": cards,
+                    "url": section_urls.format(section.key),
                 }
             )
+    shown = primary_cards + [card for section in secondary_sections for card in section["cards"] or []]
+    log_impressions(user, [card["meal"] for card in shown])
 
     preference_snapshot = None
     if preference:
@@ -154,6 +157,42 @@ def _build_random_context(user, data=None):
     }
 
 
+async def _prefetched_engine(user):
+    """An engine whose independent reads were already loaded concurrently.
+
+    Skipped when slates are on: the default page then usually comes from
+    the stored slate and needs none of them.
+    """
+    engine = RecommendationEngine(user)
+    if not await sync_to_async(slates_enabled)():
+        await engine.aprefetch(sections=not lazy_sections_enabled())
+    return engine
+
+
+def _random_payload(context) -> dict:
+    """JSON body of the recommendation data endpoint."""
+    return {
+        "primary": {
+            "reason": context["primary_reason"],
+            "cards": serialize_cards(context["primary_recommendations"]),
+        },
+        "secondary": [
+            {
+                "key": section["key"],
+                "title": section["title"],
+                "subtitle": section["subtitle"],
+                "url": section["url"],
+                "cards": None if section["cards"] is None else serialize_cards(section["cards"]),
+            }
+            for section in context["secondary_sections"]
+        ],
+        "alert": context["recommendation_alert"],
+        "preferenceSnapshot": context["preference_snapshot"],
+        "formErrors": _collect_form_errors(context["filter_form"]),
+        "cooldownDays": context["cooldown_days"],
+    }
+
+
 @user_login_required
 def random_recommendation(request):
     """Display random meal recommendations."""
@@ -174,22 +213,77 @@ def random_recommendation_data(request):
     """API endpoint for recommendation data."""
     user = get_current_user(request)
     context = _build_random_context(user, request.POST)
-    data = {
-        "primary": {
-            "reason": context["primary_reason"],
-            "cards": [_serialize_card(card) for card in context["primary_recommendations"]],
-        },
-        "secondary": [
-            {
-                "title": section["title"],
-                "subtitle": section["subtitle"],
-                "cards": [_serialize_card(card) for card in section["cards"]],
-            }
-            for section in context["secondary_sections"]
-        ],
-        "alert": context["recommendation_alert"],
-        "preferenceSnapshot": context["preference_snapshot"],
-        "formErrors": _collect_form_errors(context["filter_form"]),
-        "cooldownDays": context["cooldown_days"],
-    }
-    return JsonResponse(data)
+    return json_response(_random_payload(context))
+
+
+@require_GET
+@user_login_required
+def random_section_data(request, section):
+    """One secondary section as JSON, for the page to load on scroll.
+
+    ``limit`` is capped at ``MAX_SECTION_CARDS``. The URL carries nothing
+    page-specific, so the response is private to the user and briefly
+    cacheable; the page over-fetches and drops meals it already shows.
+    Impressions are not logged here, since the page decides which cards it
+    displays; it reports them to :func:`random_section_impressions`.
+    """
+    if section not in {key for key, _title, _subtitle in RecommendationEngine.SECONDARY_SECTIONS}:
+        raise Http404("Unknown recommendation section")
+    user = get_current_user(request)
+    engine = RecommendationEngine(user)
+    try:
+        limit = int(request.GET.get("limit") or engine.SECTION_LIMIT)
+    except ValueError:
+        limit = engine.SECTION_LIMIT
+    limit = max(1, min(MAX_SECTION_CARDS, limit))
+    result = engine.build_section(section, limit=limit)
+    cards = _build_recommendation_cards(result.meals, result.subtitle)
+    response = json_response(
+        {
+            "key": result.key,
+            "title": result.title,
+            "subtitle": result.subtitle,
+            "cards": serialize_cards(cards),
+        }
+    )
+    patch_cache_control(response, private=True, max_age=section_max_age())
+    patch_vary_headers(response, ("Cookie",))
+    return response
+
+
+@require_POST
+@user_login_required
+def random_section_impressions(request):
+    """Log impressions for the ``meal`` ids a lazily loaded section rendered."""
+    if not impression_logging_enabled():
+        return HttpResponse(status=204)
+    meal_ids = []
+    for value in request.POST.getlist("meal")[:MAX_SECTION_CARDS]:
+        try:
+            meal_ids.append(int(value))
+        except ValueError:
+            continue
+    meals = Meal.objects.filter(pk__in=meal_ids, is_recommendable=True).only("pk", "restaurant_id")
+    log_impressions(get_current_user(request), meals)
+    return HttpResponse(status=204)
+
+
+@user_login_required
+async def random_recommendation_async(request):
+    """Async variant of :func:`random_recommendation` for ASGI deployments."""
+    user = await aget_current_user(request)
+    form_data = request.POST if request.method == "POST" else None
+    engine = await _prefetched_engine(user)
+    context = await sync_to_async(_build_random_context)(user, form_data, engine)
+    return await _arender(request, "usersideapp/random.html", "random", context)
+
+
+@require_POST
+@user_login_required
+async def random_recommendation_data_async(request):
+    """Async variant of :func:`random_recommendation_data`."""
+    user = await aget_current_user(request)
+    engine = await _prefetched_engine(user)
+    context = await sync_to_async(_build_random_context)(user, request.POST, engine)
+    payload = await sync_to_async(_random_payload)(context)
+    return json_response(payload)
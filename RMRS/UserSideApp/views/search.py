@@ -1,185 +1,383 @@
 """Restaurant search view for UserSideApp."""
 
-import folium
-from folium.plugins import Fullscreen, LocateControl
-from django.db.models import Q
-from django.utils.html import escape
+import hashlib
+import json
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Avg, Count, Max, Min, Q
+from django.db.models.functions import Substr
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition, require_GET
+
+from MerchantSideApp import geo, taxonomy
 from MerchantSideApp.models import Meal, Restaurant
+from RecommendationSystem import fulltext
+from RecommendationSystem.autocomplete import KINDS as AUTOCOMPLETE_KINDS, autocomplete_index
+from RecommendationSystem.dietary import dietary_index
+from RecommendationSystem.result_cache import catalog_version, shared_cache_enabled
 
-from ..auth_utils import get_current_user, user_login_required
-from ..forms import RestaurantSearchForm
-from .utils import _render, DEFAULT_MAP_CENTER, MAX_MAP_RESULTS, MAX_MEAL_RESULTS
+from ..async_utils import gather_sync
+from ..auth_utils import user_login_required
+from ..cards import MEAL_ROUTE, PRICE_LABELS, RESTAURANT_ROUTE, json_response, url_template
+from ..forms import RestaurantSearchForm, ViewportForm
+from ..pagination import cached_count, capped_count, keyset_page
+from .utils import (
+    _arender,
+    _render,
+    DEFAULT_AUTOCOMPLETE_RESULTS,
+    DEFAULT_MAP_CENTER,
+    MAX_AUTOCOMPLETE_RESULTS,
+    MAX_MAP_RESULTS,
+    MAX_MEAL_RESULTS,
+    MAX_RESTAURANT_RESULTS,
+    MAX_VIEWPORT_POINTS,
+)
 
+# Query parameters carrying the keyset cursor of each result list.
+RESTAURANT_CURSOR = "restaurants_after"
+MEAL_CURSOR = "meals_after"
 
-@user_login_required
-def search_restaurants(request):
-    """Search restaurants and display on map."""
+
+def map_max_age() -> int:
+    return int(getattr(settings, "RECOMMENDATION_SEARCH_MAP_MAX_AGE", 60))
+
+
+def _search_form(request):
+    """Bind the search form and return it with its cleaned filters (empty when invalid)."""
     form = RestaurantSearchForm(request.GET or None)
     cleaned_filters = {}
     if form.is_bound and form.is_valid():
         cleaned_filters = form.cleaned_data
+    return form, cleaned_filters
 
+
+def _search_querysets(cleaned_filters):
+    """Ordered restaurant and meal querysets matching the search filters."""
     restaurants_qs = Restaurant.objects.filter(is_active=True)
     meals_qs = (
-        Meal.objects.filter(is_available=True, restaurant__is_active=True)
+        Meal.objects.filter(is_recommendable=True)
         .select_related("restaurant")
     )
     keyword = cleaned_filters.get("keyword")
     if keyword:
-        restaurants_qs = restaurants_qs.filter(
-            Q(name__icontains=keyword)
-            | Q(address__icontains=keyword)
-            | Q(cuisine_type__icontains=keyword)
-            | Q(meals__name__icontains=keyword)
-            | Q(meals__description__icontains=keyword)
-        ).distinct()
-        meals_qs = meals_qs.filter(
-            Q(name__icontains=keyword)
-            | Q(description__icontains=keyword)
-            | Q(restaurant__name__icontains=keyword)
-        )
+        restaurants_qs = fulltext.keyword_search(restaurants_qs, "restaurant", keyword)
+        meals_qs = fulltext.keyword_search(meals_qs, "meal", keyword)
     city = cleaned_filters.get("city")
     if city:
-        restaurants_qs = restaurants_qs.filter(city__icontains=city)
-        meals_qs = meals_qs.filter(restaurant__city__icontains=city)
+        region_ids = taxonomy.city_ids(city)
+        restaurants_qs = restaurants_qs.filter(region_ref__in=region_ids)
+        meals_qs = meals_qs.filter(restaurant__region_ref__in=region_ids)
     district = cleaned_filters.get("district")
     if district:
-        restaurants_qs = restaurants_qs.filter(district__icontains=district)
-        meals_qs = meals_qs.filter(restaurant__district__icontains=district)
+        region_ids = taxonomy.district_ids(district)
+        restaurants_qs = restaurants_qs.filter(region_ref__in=region_ids)
+        meals_qs = meals_qs.filter(restaurant__region_ref__in=region_ids)
     cuisine_type = cleaned_filters.get("cuisine_type")
     if cuisine_type:
-        restaurants_qs = restaurants_qs.filter(cuisine_type__icontains=cuisine_type)
-        meals_qs = meals_qs.filter(restaurant__cuisine_type__icontains=cuisine_type)
+        cuisine_ids = taxonomy.cuisine_ids(cuisine_type)
+        restaurants_qs = restaurants_qs.filter(cuisine_ref__in=cuisine_ids)
+        meals_qs = meals_qs.filter(restaurant__cuisine_ref__in=cuisine_ids)
     category = cleaned_filters.get("category")
     if category:
-        restaurants_qs = restaurants_qs.filter(meals__category__iexact=category).distinct()
-        meals_qs = meals_qs.filter(category__iexact=category)
+        category_ids = taxonomy.category_ids(category)
+        restaurants_qs = restaurants_qs.filter(meals__category_ref__in=category_ids).distinct()
+        meals_qs = meals_qs.filter(category_ref__in=category_ids)
     price_range = cleaned_filters.get("price_range")
     if price_range:
         restaurants_qs = restaurants_qs.filter(price_range=price_range)
         meals_qs = meals_qs.filter(restaurant__price_range=price_range)
+    dietary = dietary_index.selection(
+        cleaned_filters.get("include_tags") or (),
+        cleaned_filters.get("exclude_allergens") or (),
+    )
+    if dietary is not None:
+        meals_qs = dietary.apply(meals_qs)
+        restaurants_qs = restaurants_qs.filter(
+            pk__in=meals_qs.order_by().values("restaurant_id")
+        )
+
+    if keyword:
+        return (
+            restaurants_qs.order_by("-search_relevance", "-rating", "name", "pk"),
+            meals_qs.order_by("-search_relevance", "name", "pk"),
+        )
+    return restaurants_qs.order_by("-rating", "name", "pk"), meals_qs.order_by("name", "pk")
+
+
+@user_login_required
+def search_restaurants(request):
+    """Search restaurants and display on map."""
+    form, cleaned_filters = _search_form(request)
+    restaurants_qs, meals_qs = _search_querysets(cleaned_filters)
+    restaurant_page = keyset_page(restaurants_qs, request.GET.get(RESTAURANT_CURSOR), MAX_RESTAURANT_RESULTS)
+    total_results = cached_count(restaurants_qs, "restaurant", cleaned_filters)
+    meal_page = keyset_page(meals_qs, request.GET.get(MEAL_CURSOR), MAX_MEAL_RESULTS)
+    meal_total_results = cached_count(meals_qs, "meal", cleaned_filters)
+    return _render(
+        request,
+        "usersideapp/search.html",
+        "search",
+        _search_context(request, form, cleaned_filters, restaurant_page, total_results, meal_page, meal_total_results),
+    )
+
+
+@user_login_required
+async def search_restaurants_async(request):
+    """Async variant of :func:`search_restaurants`.
+
+    The two counts and the two result pages are independent reads, so they
+    run concurrently.
+    """
+    form, cleaned_filters = await sync_to_async(_search_form)(request)
+    restaurants_qs, meals_qs = await sync_to_async(_search_querysets)(cleaned_filters)
+    restaurant_page, total_results, meal_page, meal_total_results = await gather_sync(
+        lambda: keyset_page(restaurants_qs, request.GET.get(RESTAURANT_CURSOR), MAX_RESTAURANT_RESULTS),
+        lambda: cached_count(restaurants_qs, "restaurant", cleaned_filters),
+        lambda: keyset_page(meals_qs, request.GET.get(MEAL_CURSOR), MAX_MEAL_RESULTS),
+        lambda: cached_count(meals_qs, "meal", cleaned_filters),
+    )
+    context = await sync_to_async(_search_context)(
+        request, form, cleaned_filters, restaurant_page, total_results, meal_page, meal_total_results
+    )
+    return await _arender(request, "usersideapp/search.html", "search", context)
+
+
+def _page_url(request, cursors: dict) -> str:
+    """The current search URL with the given cursor parameters set (None removes one)."""
+    query = request.GET.copy()
+    for name, cursor in cursors.items():
+        if cursor:
+            query[name] = cursor
+        else:
+            query.pop(name, None)
+    return f"?{query.urlencode()}"
+
 
-    restaurants_qs = restaurants_qs.order_by("-rating", "name")
-    total_results = restaurants_qs.count()
-    restaurants = list(restaurants_qs[:MAX_MAP_RESULTS])
-    limited = total_results > len(restaurants)
+def _search_context(request, form, cleaned_filters, restaurant_page, total_results, meal_page, meal_total_results):
+    """Template context for the search page.
 
-    meals_qs = meals_qs.order_by("name")
-    meal_total_results = meals_qs.count()
-    meals = list(meals_qs[:MAX_MEAL_RESULTS])
-    meal_limited = meal_total_results > len(meals)
+    The map is a static shell (``search_map.js``); its markers come from
+    :func:`search_viewport` with the same filters and the visible bounds.
+    """
+    paged = bool(request.GET.get(RESTAURANT_CURSOR) or request.GET.get(MEAL_CURSOR))
 
     user_location = None
     latitude = cleaned_filters.get("latitude")
     longitude = cleaned_filters.get("longitude")
     if latitude is not None and longitude is not None:
-        user_location = (latitude, longitude)
+        user_location = (float(latitude), float(longitude))
 
-    markers = []
-    for restaurant in restaurants:
-        if restaurant.latitude is None or restaurant.longitude is None:
-            continue
-        markers.append(
+    map_query = _page_url(request, {RESTAURANT_CURSOR: None, MEAL_CURSOR: None})
+    return {
+        "form": form,
+        "restaurants": restaurant_page.items,
+        "result_count": total_results,
+        "limit_reached": restaurant_page.has_next,
+        "next_restaurants_url": (
+            _page_url(request, {RESTAURANT_CURSOR: restaurant_page.next_cursor}) if restaurant_page.has_next else None
+        ),
+        "meals": meal_page.items,
+        "meal_result_count": meal_total_results,
+        "meal_limit_reached": meal_page.has_next,
+        "next_meals_url": _page_url(request, {MEAL_CURSOR: meal_page.next_cursor}) if meal_page.has_next else None,
+        "first_page_url": _page_url(request, {RESTAURANT_CURSOR: None, MEAL_CURSOR: None}) if paged else None,
+        "map_markers_url": reverse("usersideapp:search_markers") + map_query,
+        "map_viewport_url": reverse("usersideapp:search_viewport") + map_query,
+        "map_center": DEFAULT_MAP_CENTER,
+        "user_location": user_location,
+    }
+
+
+def _markers_etag(request) -> str | None:
+    """Changes with the query string and with every catalog write.
+
+    None (no ETag) unless the catalog version lives in a cache all workers
+    share; a per-process version would let other workers answer 304 forever.
+    """
+    if not shared_cache_enabled():
+        return None
+    query = sorted((key, values) for key, values in request.GET.lists() if key not in {RESTAURANT_CURSOR, MEAL_CURSOR})
+    payload = json.dumps([catalog_version(), query], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def marker_collection(restaurants_qs, limit: int = MAX_MAP_RESULTS) -> dict:
+    """GeoJSON FeatureCollection of the first ``limit`` restaurants with coordinates."""
+    rows = list(
+        restaurants_qs.filter(latitude__isnull=False, longitude__isnull=False).values_list(
+            "name", "slug", "latitude", "longitude", "address", "cuisine_type", "price_range", "rating"
+        )[: limit + 1]
+    )
+    restaurant_urls = url_template(RESTAURANT_ROUTE)
+    features = []
+    for name, slug, latitude, longitude, address, cuisine_type, price_range, rating in rows[:limit]:
+        features.append(
             {
-                "name": restaurant.name,
-                "lat": float(restaurant.latitude),
-                "lon": float(restaurant.longitude),
-                "address": restaurant.address or "",
-                "cuisine": restaurant.cuisine_type or "",
-                "price": restaurant.get_price_range_display(),
-                "rating": restaurant.rating,
+                "type": "Feature",
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [round(float(longitude), 6), round(float(latitude), 6)],
+                },
+                "properties": {
+                    "name": name,
+                    "url": restaurant_urls.format(slug),
+                    "address": address or "",
+                    "cuisine": cuisine_type or "",
+                    "price": PRICE_LABELS.get(price_range or "", price_range or ""),
+                    "rating": float(rating) if rating is not None else None,
+                },
             }
         )
+    return {"type": "FeatureCollection", "features": features, "truncated": len(rows) > limit}
+
+
+@user_login_required
+@condition(etag_func=_markers_etag)
+@require_GET
+def search_markers(request):
+    """Restaurants matching the search filters as GeoJSON for the search map.
+
+    Takes the search page's query string (cursors are ignored) and returns
+    up to ``MAX_MAP_RESULTS`` points; the page clusters them client-side.
+    The ETag follows the catalog version, so unchanged results revalidate
+    with a 304.
+    """
+    _form, cleaned_filters = _search_form(request)
+    restaurants_qs, _meals_qs = _search_querysets(cleaned_filters)
+    response = json_response(marker_collection(restaurants_qs))
+    patch_cache_control(response, private=True, max_age=map_max_age())
+    patch_vary_headers(response, ("Cookie",))
+    return response
+
+
+def viewport_cluster_zoom() -> int:
+    return int(getattr(settings, "RECOMMENDATION_VIEWPORT_CLUSTER_ZOOM", 15))
+
+
+def _in_bounds(restaurants_qs, south: float, west: float, north: float, east: float):
+    """Restaurants inside the box (a ``west`` east of ``east`` wraps the antimeridian)."""
+    longitude = Q(longitude__gte=west, longitude__lte=east)
+    if west > east:
+        longitude = Q(longitude__gte=west) | Q(longitude__lte=east)
+    return restaurants_qs.filter(Q(latitude__gte=south, latitude__lte=north) & longitude)
+
+
+def _grouping_base(restaurants_qs):
+    """``restaurants_qs`` without ordering, and without join duplicates (``DISTINCT``) for grouping."""
+    if restaurants_qs.query.distinct:
+        return Restaurant.objects.filter(pk__in=restaurants_qs.order_by().values("pk"))
+    return restaurants_qs.order_by()
+
 
-    center_lat, center_lon = DEFAULT_MAP_CENTER
-    zoom_start = 13 if markers else 7
-    if user_location:
-        center_lat, center_lon = user_location
-        zoom_start = 15
-    elif markers:
-        center_lat = sum(marker["lat"] for marker in markers) / len(markers)
-        center_lon = sum(marker["lon"] for marker in markers) / len(markers)
-    restaurant_map = folium.Map(
-        location=[center_lat, center_lon],
-        zoom_start=zoom_start,
-        control_scale=True,
-        tiles="OpenStreetMap",
-        width="100%",
-        height="600px",
+def results_extent(restaurants_qs):
+    """``[west, south, east, north]`` around every matching restaurant with coordinates, or None."""
+    extent = _grouping_base(restaurants_qs).aggregate(
+        west=Min("longitude"), south=Min("latitude"), east=Max("longitude"), north=Max("latitude")
     )
+    if extent["west"] is None:
+        return None
+    return [float(extent[name]) for name in ("west", "south", "east", "north")]
 
-    Fullscreen(position="topright", title="進入全螢幕", title_cancel="退出全螢幕").add_to(restaurant_map)
-    LocateControl(
-        auto_start=False,
-        keepCurrentZoomLevel=True,
-        flyTo=True,
-        strings={"title": "移動到目前位置", "popup": "目前位置"},
-    ).add_to(restaurant_map)
-
-    bounds_points: list[list[float]] = []
-    if user_location:
-        folium.CircleMarker(
-            location=user_location,
-            radius=8,
-            color="#2563eb",
-            fill=True,
-            fill_color="#2563eb",
-            fill_opacity=0.9,
-            tooltip="目前位置",
-        ).add_to(restaurant_map)
-        bounds_points.append([user_location[0], user_location[1]])
-
-    if markers:
-        bounds_points.extend([[marker["lat"], marker["lon"]] for marker in markers])
-    if len(bounds_points) >= 2:
-        restaurant_map.fit_bounds(bounds_points, padding=(20, 20))
-    elif len(bounds_points) == 1:
-        restaurant_map.location = bounds_points[0]
-        restaurant_map.zoom_start = 15
-
-    for marker in markers:
-        popup_lines = [f"<strong>{escape(marker['name'])}</strong>"]
-        if marker["address"]:
-            popup_lines.append(escape(marker["address"]))
-        detail_parts = []
-        if marker["cuisine"]:
-            detail_parts.append(escape(marker["cuisine"]))
-        if marker["price"]:
-            detail_parts.append(escape(marker["price"]))
-        if marker["rating"] is not None:
-            detail_parts.append(f"評分：{marker['rating']}")
-        if detail_parts:
-            popup_lines.append(" ・ ".join(detail_parts))
-        popup_html = "<br/>".join(popup_lines)
-        folium.Marker(
-            [marker["lat"], marker["lon"]],
-            tooltip=marker["name"],
-            popup=folium.Popup(popup_html, max_width=280),
-        ).add_to(restaurant_map)
-
-    folium_map_html = restaurant_map._repr_html_()
-    map_hint = None
-    if not markers and not user_location:
-        map_hint = "目前結果缺少座標資訊，顯示預設地圖。"
-    elif not markers and user_location:
-        map_hint = "已使用您的定位，但目前尚無提供座標的餐廳資料。"
 
-    return _render(
-        request,
-        "usersideapp/search.html",
-        "search",
+def cluster_collection(restaurants_qs, zoom: int) -> dict:
+    """Restaurants grouped by geohash cell sized for ``zoom``, as GeoJSON cluster points.
+
+    One grouped query: the cell is a prefix of the indexed ``geohash`` and each
+    cluster sits at the mean position of its restaurants.
+    """
+    precision = geo.precision_for_zoom(zoom)
+    rows = (
+        _grouping_base(restaurants_qs)
+        .filter(geohash__isnull=False)
+        .annotate(cell=Substr("geohash", 1, precision))
+        .values("cell")
+        .annotate(count=Count("pk"), latitude=Avg("latitude"), longitude=Avg("longitude"))
+        .order_by()
+    )
+    features = []
+    for row in rows:
+        features.append(
+            {
+                "type": "Feature",
+                "bbox": [round(value, 6) for value in geo.cell_bbox(row["cell"])],
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [round(float(row["longitude"]), 6), round(float(row["latitude"]), 6)],
+                },
+                "properties": {"cluster": True, "count": row["count"], "cell": row["cell"]},
+            }
+        )
+    return {"type": "FeatureCollection", "features": features, "clustered": True, "truncated": False}
+
+
+@user_login_required
+@condition(etag_func=_markers_etag)
+@require_GET
+def search_viewport(request):
+    """Matching restaurants inside the map bounds, clustered below a zoom level.
+
+    Takes the search filters plus ``south``/``west``/``north``/``east`` and
+    ``zoom``. From ``RECOMMENDATION_VIEWPORT_CLUSTER_ZOOM`` on, or when at
+    most ``MAX_VIEWPORT_POINTS`` restaurants are in view, the points
+    themselves are returned. Otherwise the response holds one cluster
+    feature (with its count) per geohash cell. ``fit=1`` adds the ``bbox``
+    of all matching restaurants so the map can frame them first.
+    """
+    viewport = ViewportForm(request.GET)
+    if not viewport.is_valid():
+        return JsonResponse({"errors": viewport.errors}, status=400)
+    _form, cleaned_filters = _search_form(request)
+    restaurants_qs, _meals_qs = _search_querysets(cleaned_filters)
+    if not viewport.has_bounds:
+        payload = {"type": "FeatureCollection", "features": [], "clustered": False, "truncated": False}
+    else:
+        bounds = {name: viewport.cleaned_data[name] for name in ViewportForm.BOUNDS}
+        visible = _in_bounds(restaurants_qs, **bounds)
+        zoom = viewport.cleaned_data["zoom"]
+        if zoom >= viewport_cluster_zoom() or not capped_count(visible, MAX_VIEWPORT_POINTS).capped:
+            payload = {**marker_collection(visible, MAX_VIEWPORT_POINTS), "clustered": False}
+        else:
+            payload = cluster_collection(visible, zoom)
+    if viewport.cleaned_data.get("fit"):
+        payload["bbox"] = results_extent(restaurants_qs)
+    response = json_response(payload)
+    patch_cache_control(response, private=True, max_age=map_max_age())
+    patch_vary_headers(response, ("Cookie",))
+    return response
+
+
+@user_login_required
+@require_GET
+def search_autocomplete(request):
+    """Typeahead suggestions whose names start with ``q``.
+
+    ``kind`` is a comma-separated subset of restaurant, meal, cuisine and
+    district (default: all of them); ``limit`` applies per kind and is capped
+    at ``MAX_AUTOCOMPLETE_RESULTS``. Each kind is ordered by rating or
+    popularity.
+    """
+    kinds = [kind for kind in (request.GET.get("kind") or "").split(",") if kind in AUTOCOMPLETE_KINDS]
+    try:
+        limit = int(request.GET.get("limit") or DEFAULT_AUTOCOMPLETE_RESULTS)
+    except ValueError:
+        limit = DEFAULT_AUTOCOMPLETE_RESULTS
+    limit = max(1, min(MAX_AUTOCOMPLETE_RESULTS, limit))
+    suggestions = autocomplete_index.suggest(request.GET.get("q", ""), kinds or AUTOCOMPLETE_KINDS, limit)
+    urls = {"restaurant": url_template(RESTAURANT_ROUTE), "meal": url_template(MEAL_ROUTE)}
+    return json_response(
         {
-            "form": form,
-            "restaurants": restaurants,
-            "result_count": total_results,
-            "limit_reached": limited,
-            "meals": meals,
-            "meal_result_count": meal_total_results,
-            "meal_limit_reached": meal_limited,
-            "folium_map": folium_map_html,
-            "map_has_markers": bool(markers),
-            "has_user_location": bool(user_location),
-            "map_hint": map_hint,
-        },
+            "suggestions": [
+                {
+                    "kind": suggestion.kind,
+                    "id": suggestion.id,
+                    "label": suggestion.label,
+                    "detail": suggestion.detail,
+                    "url": urls[suggestion.kind].format(suggestion.slug) if suggestion.kind in urls else "",
+                }
+                for suggestion in suggestions
+            ]
+        }
     )
@@ -2,6 +2,7 @@
 
 import json
 
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
 
 from ..auth_utils import get_current_user
@@ -10,8 +11,15 @@ from ..models import DailyMealRecord, MealComponent
 
 # Constants
 DEFAULT_MAP_CENTER = (23.6978, 120.9605)
-MAX_MAP_RESULTS = 50
+# Restaurants plotted on the search map (clustered client-side).
+MAX_MAP_RESULTS = 5000
+MAX_RESTAURANT_RESULTS = 50
+# Restaurants returned individually by the viewport API; more than this in view are clustered.
+MAX_VIEWPORT_POINTS = 300
 MAX_MEAL_RESULTS = 40
+MAX_SECTION_CARDS = 12
+DEFAULT_AUTOCOMPLETE_RESULTS = 8
+MAX_AUTOCOMPLETE_RESULTS = 20
 
 
 def _serialize_components(record: DailyMealRecord) -> str:
@@ -59,6 +67,11 @@ def _render(request, template_name: str, active_nav: str, extra: dict | None = N
     return render(request, template_name, context)
 
 
+async def _arender(request, template_name: str, active_nav: str, extra: dict | None = None):
+    """Async counterpart of :func:`_render`; template rendering runs in the sync thread."""
+    return await sync_to_async(_render)(request, template_name, active_nav, extra)
+
+
 def _collect_form_errors(form) -> dict:
     """Collect form errors as a dictionary."""
     if not form.is_bound or form.is_valid():